@@ -6,16 +6,28 @@ class LanguageModelProviders(Enum):
     openai = "openai"
 
 
+import importlib
 import typing
-from funkyprompt.core.agents import CallingContext
-from funkyprompt.core import AbstractModel
-from funkyprompt import entities
+
+if typing.TYPE_CHECKING:
+    from funkyprompt.core.agents import CallingContext
+    from funkyprompt.core import AbstractModel
+
+"""subpackages are imported on first use (PEP 562) so that `import funkyprompt` stays cheap
+and provider SDKs and database drivers are only loaded when they are used"""
+_LAZY_SUBMODULES = {"core", "entities", "services"}
+
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def run(
     questions: str | typing.List[str],
-    context: CallingContext = None,
-    model: AbstractModel = None,
+    context: "CallingContext" = None,
+    model: "AbstractModel" = None,
 ):
     """entry point into the runner for convenience
     - direct questions can be asked butthen the simple `ask` method would suffice
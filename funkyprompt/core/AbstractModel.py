@@ -1,6 +1,8 @@
 from pydantic import BaseModel, create_model, Field, model_validator
+import functools
 import uuid
 import typing
+import weakref
 from funkyprompt.core.types import inspection
 from funkyprompt.core.types.sql import SqlHelper
 from funkyprompt.core.types.cypher import CypherHelper
@@ -14,6 +16,37 @@ KEY_FIELD_ATTRIBUTE = "is_key"
 DEFAULT_KEY_ATTRIBUTE_NAME = "name"
 DEFAULT_NAMESPACE = "default"
 
+"""
+per class metadata e.g. the sql helper, key field and embedding map are derived from the pydantic schema
+which is expensive (`model_json_schema`) so they are computed once per class and kept here.
+the cache is keyed on the class so subclasses and dynamically created models get their own entries
+"""
+_MODEL_METADATA = weakref.WeakKeyDictionary()
+
+
+def _cached_metadata(fn):
+    """memoize a no argument classmethod per model class
+    classes made with `create_model` are new keys so they get their own metadata - nothing is invalidated there.
+    a class that is changed in place must be cleared with `clear_model_metadata`
+    """
+
+    @functools.wraps(fn)
+    def wrapper(cls):
+        cache = _MODEL_METADATA.setdefault(cls, {})
+        if fn.__name__ not in cache:
+            cache[fn.__name__] = fn(cls)
+        return cache[fn.__name__]
+
+    return wrapper
+
+
+def clear_model_metadata(model=None):
+    """invalidate the cached metadata for a model class or for all models"""
+    if model is None:
+        _MODEL_METADATA.clear()
+    else:
+        _MODEL_METADATA.pop(model, None)
+
 
 class AbstractModel(BaseModel):
     class Config:
@@ -27,6 +60,7 @@ class AbstractModel(BaseModel):
     )
 
     @classmethod
+    @_cached_metadata
     def get_model_name(cls):
         c = getattr(cls, "Config", None)
         if c and getattr(c, "name", None):
@@ -57,6 +91,7 @@ class AbstractModel(BaseModel):
             return c.description
 
     @classmethod
+    @_cached_metadata
     def get_model_fullname(cls):
         """
         the model name is our convention e.g. meta.bodies
@@ -72,6 +107,7 @@ class AbstractModel(BaseModel):
         return f"{cls.__module__}.{cls.__name__}"
 
     @classmethod
+    @_cached_metadata
     def get_model_key_field(cls):
         """
         the field that is used as the primary key if it exists
@@ -111,14 +147,22 @@ class AbstractModel(BaseModel):
         pass
 
     @classmethod
+    @_cached_metadata
+    def get_model_type_hints(cls) -> typing.Dict[str, typing.Any]:
+        """the resolved type hints of the model fields"""
+        return typing.get_type_hints(cls)
+
+    @classmethod
+    @_cached_metadata
     def sql(cls) -> SqlHelper:
-        """reference the sql helper"""
+        """reference the sql helper - built once per model class"""
 
         return SqlHelper(cls)
 
     @classmethod
+    @_cached_metadata
     def cypher(cls) -> CypherHelper:
-        """reference the cypher helper"""
+        """reference the cypher helper - built once per model class"""
 
         return CypherHelper(cls)
 
@@ -146,6 +190,7 @@ class AbstractModel(BaseModel):
         return data
 
     @classmethod
+    @_cached_metadata
     def get_embedding_fields(cls) -> typing.Dict[str, str]:
         """returns the fields that have embeddings based on the attribute - uses our convention"""
         needs_embeddings = {}
@@ -155,6 +200,16 @@ class AbstractModel(BaseModel):
                 needs_embeddings[k] = f"{k}_embedding"
         return needs_embeddings
 
+    @classmethod
+    @_cached_metadata
+    def get_embedding_providers(cls) -> typing.Dict[str, str]:
+        """returns the embedding provider for each field that has embeddings"""
+        return {
+            k: (getattr(v, "json_schema_extra", {}) or {}).get("embedding_provider")
+            for k, v in cls.model_fields.items()
+            if (getattr(v, "json_schema_extra", {}) or {}).get("embedding_provider")
+        }
+
     @classmethod
     def get_model_as_prompt(cls) -> str:
         """the model as prompt provides a schema and also the description of the model
@@ -206,7 +261,17 @@ class AbstractEntity(AbstractModel):
 
     """
 
-    name: str = Field(description="The name is unique for the entity", is_key=True)
+    name: str = Field(
+        description="The name is unique for the entity", is_key=True, searchable=True
+    )
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs):
+        """entity types register themselves when defined so they can be resolved by name without a package scan"""
+        super().__pydantic_init_subclass__(**kwargs)
+        from funkyprompt.core.registry import entity_registry
+
+        entity_registry.register(cls)
 
     @model_validator(mode="before")
     @classmethod
@@ -230,4 +295,5 @@ class AbstractEntity(AbstractModel):
 
         from funkyprompt.services import entity_store
 
-        return entity_store(cls).query(questions, limit, **kwargs)
+        """many questions are embedded and searched in one round trip"""
+        return entity_store(cls).vector_search(questions, limit=limit or 7, **kwargs)
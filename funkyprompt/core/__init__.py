@@ -4,22 +4,19 @@ from funkyprompt.core.fields.annotations import OpenAIEmbeddingField
 
 
 def load_entities() -> typing.List[AbstractEntity]:
-    from funkyprompt.core.types.inspection import get_classes
+    """the entities defined in funkyprompt.core - entities prefixed with _ are hidden entities
+    the package is imported once and then the registered entities are returned - see `registry`
+    """
+    from funkyprompt.core.registry import entity_registry
 
-    entities = get_classes(AbstractEntity)
+    entity_registry.load_package("funkyprompt.core")
+    return entity_registry.entities(packages=["funkyprompt.core"])
 
-    def _not_private(e):
-        """we treat entities that are prefixed with _ as hidden entities"""
-        return (
-            e.__name__[:1] != "_"
-            and not getattr(e.Config, "is_hidden", False)
-            and e.__name__ != "AbstractEntity"
-        )
 
-    entities = [e for e in entities if hasattr(e, "Config")]
-    entities = [e for e in entities if _not_private(e)]
+def __getattr__(name):
+    """the logger is loaded on first use - see `funkyprompt.core.utils`"""
+    if name == "logger":
+        from funkyprompt.core.utils import logger
 
-    return entities
-
-
-from funkyprompt.core.utils import logger
+        return logger
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+import asyncio
 import typing
 from . import CallingContext
 
@@ -24,6 +25,17 @@ class LanguageModel(ABC):
     ):
         pass
 
+    async def arun(
+        cls,
+        messages: typing.List[dict],
+        context: CallingContext,
+        functions: typing.Optional[dict] = None,
+    ):
+        """models without an asyncio client run the blocking call in a worker thread"""
+        return await asyncio.to_thread(
+            cls.run, messages=messages, context=context, functions=functions
+        )
+
     def __call__(
         cls,
         messages: typing.List[dict],
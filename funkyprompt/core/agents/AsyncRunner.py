@@ -0,0 +1,56 @@
+"""
+The asyncio agent loop - mixed into the `Runner`
+"""
+
+from funkyprompt.services.models import language_model_client_from_context, _notify
+from funkyprompt.core.agents import CallingContext, LanguageModel
+from funkyprompt.core import ConversationModel
+from funkyprompt.services import async_entity_store
+from . import FunctionCall
+
+
+class AsyncRunner:
+    """the coroutine equivalents of `Runner.run` and `Runner.dump`"""
+
+    async def arun(self, question: str, context: CallingContext = None):
+        """
+        The asyncio agent loop - the same as `run` but the language model call is awaited,
+        tokens stream to the (optionally async) `context.streaming_callback`
+        and the functions of a turn are called concurrently (see `ainvoke`)
+        """
+        context = context or CallingContext()
+        lm_client: LanguageModel = language_model_client_from_context(context)
+        cached = self._cached_call(question, context)
+        response = cached.get()
+        if response is not None:
+            if context.streaming_callback:
+                await _notify(context.streaming_callback, response)
+            await self.adump(question, response, context)
+            return response
+        self._setup_messages(question, context)
+
+        for _ in range(context.max_iterations):
+            response = None
+            function_descriptions = self._function_manager.function_specs()
+            response = await lm_client.acall(
+                messages=self.messages.dump_for_context(context),
+                context=self._loop_context(context),
+                functions=function_descriptions,
+            )
+            if isinstance(response, (FunctionCall, list)):
+                await self.ainvoke(response)
+                continue
+            if response is not None:
+                break
+
+        if not self._mutated_state:
+            cached.put(response)
+        await self.adump(question, response, context)
+
+        return response
+
+    async def adump(self, questions: str, response: str, context: CallingContext):
+        """the asyncio version of `dump`"""
+        await async_entity_store(ConversationModel).update_records(
+            self._conversation(questions, response, context)
+        )
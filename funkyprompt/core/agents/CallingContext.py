@@ -4,6 +4,7 @@ from . import DEFAULT_MODEL
 
 DEFAULT_MAX_AGENT_LOOPS = 10
 DEFAULT_MODEL_TEMPERATURE = 0.0
+DEFAULT_FUNCTION_TIMEOUT_SECONDS = 60.0
 
 
 class ApiCallingContext(BaseModel):
@@ -55,6 +56,25 @@ class ApiCallingContext(BaseModel):
     model: typing.Optional[str] = Field(
         default=DEFAULT_MODEL, description="The LLM Model to use"
     )
+    context_token_budget: typing.Optional[int] = Field(
+        default=None,
+        description="If set, older function results are pruned so that the messages sent to the LLM fit in this many tokens",
+    )
+    prune_policy: typing.Literal["truncate", "elide", "none"] = Field(
+        default="truncate",
+        description="How older function results are pruned to fit the budget - `truncate` keeps the start of each result, `elide` replaces it with a note",
+    )
+    """invalidation of cached responses is process local - it only fires from entity `update_records`/`bulk_update_records` in this process.
+    writes from other processes, embedding queue workers and to non entity tables do not invalidate so responses can be stale up to the cache TTL
+    """
+    use_response_cache: typing.Optional[bool] = Field(
+        default=False,
+        description="Reuse responses to the same questions (or similar ones when the cache has a similarity threshold) - only applies at temperature 0",
+    )
+    function_timeout_seconds: typing.Optional[float] = Field(
+        default=DEFAULT_FUNCTION_TIMEOUT_SECONDS,
+        description="In async runs, the time allowed for each function call - functions can override this with a `timeout` in their metadata",
+    )
 
     file_uris: typing.Optional[typing.List[str]] = Field(
         description="files associated with the context", default_factory=list
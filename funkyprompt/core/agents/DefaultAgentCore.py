@@ -1,12 +1,12 @@
 """this example illustrates how "agents" are just objects with properties and functions
-  some agents may not have properties 
-  but properties act as a response template which will be a json response.
+some agents may not have properties
+but properties act as a response template which will be a json response.
 """
 
 from funkyprompt.core import AbstractModel
+from funkyprompt.core.functions.cache import cacheable
 import typing
 
-
 AGENT_CORE_DESCRIPTION = """
 As a funkyprompt agent you are responsible for calling 
 provided functions to answer the users question.
@@ -67,6 +67,7 @@ class DefaultAgentCore(AbstractModel):
         pass
 
     @classmethod
+    @cacheable()
     def lookup_entity(self, keys: str | typing.List[str]) -> typing.List[dict]:
         """Given one or more entity keys, lookup the entity details
 
@@ -75,7 +76,12 @@ class DefaultAgentCore(AbstractModel):
 
         Returns: a list of typed entities
         """
-        pass
+        from funkyprompt.core import AbstractEntity
+        from funkyprompt.services import entity_store
+
+        """all keys are matched in one graph query and resolved with one select per entity type"""
+        entities = entity_store(AbstractEntity).get_nodes_by_name(keys)
+        return [e.model_dump() for e in entities]
 
     @classmethod
     def funky_prompt_codebase(self, questions: str):
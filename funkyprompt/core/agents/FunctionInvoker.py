@@ -0,0 +1,145 @@
+"""
+Calling the functions a language model asks for - mixed into the `Runner`
+The calls of one model turn run concurrently (in threads for `invoke` and on the loop for `ainvoke`)
+and results come from the function result cache for functions marked cacheable
+"""
+
+from funkyprompt.core import utils
+from . import MessageStack
+from . import FunctionCall, Function
+from funkyprompt.core.functions.cache import (
+    cache_name,
+    cache_options,
+    get_function_cache,
+)
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import inspect
+import typing
+
+
+class FunctionInvoker:
+    """invokes functions from the runner's function manager and adds the results to its messages"""
+
+    def _get_function(self, name: str) -> Function:
+        """the function to call - calling a function with `mutates_state` in its metadata means the response is not cached"""
+        f = self._function_manager[name]
+        if (getattr(f, "metadata", None) or {}).get("mutates_state"):
+            self._mutated_state = True
+        return f
+
+    def _cached_result(self, f: Function, function_call: FunctionCall):
+        """(cache key, found, result) - only functions marked cacheable use the function result cache
+        the key holds the qualified function name, arguments, options and the user scope if the function is per user
+        """
+        options = cache_options(getattr(f, "metadata", None))
+        if not options:
+            return None, False, None
+        key = {
+            "name": cache_name(f),
+            "arguments": function_call.arguments,
+            "options": options,
+            "scope": self._context.username if options["per_user"] else None,
+        }
+        return (key, *get_function_cache().get(**key))
+
+    def _invoke_function(self, function_call: FunctionCall):
+        """call one function and format the result or error as a message"""
+        f = self._get_function(function_call.name)
+
+        try:
+            """try call the function - assumes its some sort of json thing that comes back"""
+            cache_key, found, data = self._cached_result(f, function_call)
+            if not found:
+                data = f(**function_call.arguments)
+                if cache_key:
+                    get_function_cache().put(result=data, **cache_key)
+            data = data or {}
+            return MessageStack.format_function_response_data(
+                function_call.name, data, self._context
+            )
+            """if there is an error, how you format the message matters - some generic ones are added
+            its important to make sure the format coincides with the language model being used in context
+            """
+        except TypeError as tex:
+            utils.logger.warning(f"Error calling function {tex}")
+            return MessageStack.format_function_response_type_error(
+                function_call.name, tex, self._context
+            )
+        except Exception as ex:
+            utils.logger.warning(f"Error calling function {ex}")
+            return MessageStack.format_function_response_error(
+                function_call.name, ex, self._context
+            )
+
+    def invoke(self, function_calls: FunctionCall | typing.List[FunctionCall]):
+        """Invoke function(s) and parse results into messages
+        the (parallel) calls of one model turn run concurrently in threads
+
+        Args:
+            function_calls (FunctionCall|List[FunctionCall]): the payload(s) sent from an LLM to call functions
+        """
+        if isinstance(function_calls, FunctionCall):
+            function_calls = [function_calls]
+        if len(function_calls) == 1:
+            results = [self._invoke_function(function_calls[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(function_calls)) as executor:
+                results = list(executor.map(self._invoke_function, function_calls))
+
+        """update messages (in place) with data if we can or add error messages to notify the language model"""
+        self.messages.add_function_results(function_calls, results)
+
+    async def _ainvoke_function(self, function_call: FunctionCall):
+        """call one function with a timeout and format the result or error as a message
+        coroutine functions are awaited on the loop and blocking functions run in a worker thread
+        (a thread that times out is abandoned rather than interrupted)
+        """
+        f = self._get_function(function_call.name)
+        timeout = (getattr(f, "metadata", None) or {}).get(
+            "timeout", self._context.function_timeout_seconds
+        )
+        try:
+            cache_key, found, data = self._cached_result(f, function_call)
+            if not found:
+                if inspect.iscoroutinefunction(getattr(f, "function", f)):
+                    call = f(**function_call.arguments)
+                else:
+                    call = asyncio.to_thread(f, **function_call.arguments)
+                data = await asyncio.wait_for(call, timeout)
+                if cache_key:
+                    get_function_cache().put(result=data, **cache_key)
+            data = data or {}
+            return MessageStack.format_function_response_data(
+                function_call.name, data, self._context
+            )
+        except asyncio.TimeoutError:
+            utils.logger.warning(f"Timed out calling function {function_call.name}")
+            return MessageStack.format_function_response_error(
+                function_call.name,
+                TimeoutError(f"the function did not return within {timeout} seconds"),
+                self._context,
+            )
+        except TypeError as tex:
+            utils.logger.warning(f"Error calling function {tex}")
+            return MessageStack.format_function_response_type_error(
+                function_call.name, tex, self._context
+            )
+        except Exception as ex:
+            utils.logger.warning(f"Error calling function {ex}")
+            return MessageStack.format_function_response_error(
+                function_call.name, ex, self._context
+            )
+
+    async def ainvoke(self, function_calls: FunctionCall | typing.List[FunctionCall]):
+        """Invoke function(s) concurrently and add the results to the messages in call order
+
+        Args:
+            function_calls (FunctionCall|List[FunctionCall]): the payload(s) sent from an LLM to call functions
+        """
+        if isinstance(function_calls, FunctionCall):
+            function_calls = [function_calls]
+        results = await asyncio.gather(
+            *[self._ainvoke_function(fc) for fc in function_calls]
+        )
+        self.messages.add_function_results(function_calls, results)
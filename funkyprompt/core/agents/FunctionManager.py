@@ -6,6 +6,7 @@ from funkyprompt.core.agents import (
     Plan,
 )
 from ..functions import Function
+from funkyprompt import LanguageModelProviders
 import typing
 
 
@@ -22,12 +23,14 @@ class FunctionManager:
     def __init__(self):
         """some options such as models or data stores to use for function loading"""
         self._functions = {}
+        self._function_specs = {}
 
     def __getitem__(self, key):
         return self._functions.get(key)
 
     def __setitem__(self, key, value):
         self._functions[key] = value
+        self._function_specs = {}
 
     def register(self, model: AbstractModel, include_function_search: bool = False):
         """register the functions of the model
@@ -100,7 +103,22 @@ class FunctionManager:
 
     def reset_functions(self):
         """hard reset on what we know about"""
-        self.functions = {}
+        self._functions = {}
+        self._function_specs = {}
+
+    def function_specs(
+        self, model_provider: str = LanguageModelProviders.openai
+    ) -> typing.List[dict]:
+        """the json specs of the functions to send to the language model
+        the list is kept until functions are added or removed so agent loop iterations reuse it
+        (re-add a function that is changed in place)
+        """
+        specs = self._function_specs.get(model_provider)
+        if specs is None:
+            specs = self._function_specs[model_provider] = [
+                f.to_json_spec(model_provider) for f in self._functions.values()
+            ]
+        return specs
 
     def search(self, question: str, limit: int = None, context: CallingContext = None):
         """search a deep function registry. The plan could be used to hold many functions in an in-memory/in-context registry.
@@ -114,7 +132,7 @@ class FunctionManager:
         """
         from funkyprompt.services import entity_store
 
-        return entity_store(Function).query(question)
+        return entity_store(Function).vector_search(question, limit=limit or 7)
 
     @property
     def functions(self) -> typing.Dict[str, Function]:
@@ -1,9 +1,16 @@
 import typing
-from pydantic import BaseModel, Field, model_serializer, model_validator
+from pydantic import BaseModel, Field, PrivateAttr, model_serializer, model_validator
 from funkyprompt.core import AbstractModel, AbstractEntity
+from funkyprompt.core.utils.tokens import count_tokens, MESSAGE_TOKEN_OVERHEAD
 import datetime
+from itertools import islice
 import json
 from funkyprompt.core.agents import CallingContext
+from funkyprompt.core.functions import FunctionCall
+
+"""the characters kept from older function results under the `truncate` prune policy"""
+PRUNED_FUNCTION_RESULT_CHARACTERS = 500
+FUNCTION_RESULT_ROLES = {"function", "tool"}
 
 
 class Message(BaseModel):
@@ -12,6 +19,46 @@ class Message(BaseModel):
     name: typing.Optional[str] = Field(
         description="for example function names", default=None
     )
+    tool_call_id: typing.Optional[str] = Field(
+        description="the tool call that a tool message responds to", default=None
+    )
+    tool_calls: typing.Optional[typing.List[dict]] = Field(
+        description="the tool calls requested by the assistant", default=None
+    )
+
+    """messages are not changed once added so the serialized dict and token counts are cached"""
+    _dict: typing.Optional[dict] = PrivateAttr(default=None)
+    _tokens: dict = PrivateAttr(default_factory=dict)
+
+    @model_serializer()
+    def dump(self):
+        """the tool fields are only sent when used"""
+        d = dict(vars(self))
+        for k in ["tool_call_id", "tool_calls"]:
+            if d.get(k) is None:
+                d.pop(k)
+        return d
+
+    def to_dict(self) -> dict:
+        """the cached serialized message - treat it as read only"""
+        if self._dict is None:
+            self._dict = self.model_dump()
+        return self._dict
+
+    def token_count(self, model: str = None) -> int:
+        """the (cached) tokens the message costs in the context of the model"""
+        tokens = self._tokens.get(model)
+        if tokens is None:
+            d = self.to_dict()
+            text = d["content"]
+            if not isinstance(text, str):
+                text = json.dumps(text, default=str)
+            if d.get("tool_calls"):
+                text += json.dumps(d["tool_calls"])
+            tokens = self._tokens[model] = (
+                count_tokens(text, model) + MESSAGE_TOKEN_OVERHEAD
+            )
+        return tokens
 
 
 class UserMessage(Message):
@@ -106,20 +153,52 @@ class MessageStack(BaseModel):
 
     def reset(cls):
         """returns the message stack only with the model elements"""
-        data = dict(vars(cls))
-        data["messages"] = []
         return MessageStack(model=cls.model, current_date=cls.current_date)
 
     def add(cls, message: Message | dict):
-        """augment the message and retain all the other stuff"""
+        """append the message in place - the stack is validated once when it is created
+        and messages are only ever appended so snapshots of a prefix stay valid
+        (the stack is returned for chaining)
+        """
         if isinstance(message, dict):
             message = Message(**message)
-        messages = cls.messages
-        messages.append(message)
-        data = dict(vars(cls))
-        data["messages"] = messages
+        cls.messages.append(message)
+        return cls
 
-        return MessageStack(**data)
+    def snapshot(cls) -> "MessageStackSnapshot":
+        """an immutable view of the messages so far - it shares the message storage
+        and is not affected by later appends. use `branch` on it to try different continuations from the same prefix
+        """
+        return MessageStackSnapshot(cls, len(cls.messages))
+
+    def add_function_results(
+        cls, function_calls: typing.List[FunctionCall], results: typing.List[Message]
+    ):
+        """add the formatted results of one model turn
+        tool calls (those with an id) are answered with an assistant message that lists the calls
+        followed by one tool message per call - every call must get a response
+        """
+        if not all(fc.id for fc in function_calls):
+            for message in results:
+                cls.add(message)
+            return cls
+        cls.add(
+            Message(
+                role="assistant",
+                content="",
+                tool_calls=[fc.to_tool_call() for fc in function_calls],
+            )
+        )
+        for fc, message in zip(function_calls, results):
+            cls.add(
+                Message(
+                    role="tool",
+                    name=fc.name,
+                    tool_call_id=fc.id,
+                    content=message.content,
+                )
+            )
+        return cls
 
     def add_system_message(cls, data: str):
         """add string or dict content as system message"""
@@ -213,10 +292,98 @@ class MessageStack(BaseModel):
 
     """smart pruning of messages"""
 
+    def token_count(self, model: str = None) -> int:
+        """the tokens the messages cost - per message counts are cached"""
+        return sum(m.token_count(model) for m in self.messages)
+
+    def dump_for_context(self, context: CallingContext = None) -> typing.List[dict]:
+        """the messages to send to the language model - see `dump_messages_for_context`"""
+        return dump_messages_for_context(self.messages, context)
+
     @model_serializer()
     def custom_serializer(self):
         """
-        we can be smarter about this
+        the cached message dicts - see `dump_for_context` to apply a token budget
         """
 
-        return [m.model_dump() for m in self.messages]
+        return [m.to_dict() for m in self.messages]
+
+
+class MessageStackSnapshot:
+    """an immutable view of the first `length` messages of a stack - the messages are shared, not copied
+    this is safe because stacks only append
+    """
+
+    def __init__(self, stack: MessageStack, length: int):
+        self._stack = stack
+        self._messages = stack.messages
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return islice(self._messages, self._length)
+
+    def __getitem__(self, index: int) -> Message:
+        return self._messages[range(self._length)[index]]
+
+    @property
+    def messages(self) -> typing.List[Message]:
+        return list(self)
+
+    def dump_for_context(self, context: CallingContext = None) -> typing.List[dict]:
+        """the messages to send to the language model - see `dump_messages_for_context`"""
+        return dump_messages_for_context(list(self), context)
+
+    def model_dump(self) -> typing.List[dict]:
+        return [m.to_dict() for m in self]
+
+    def branch(self) -> MessageStack:
+        """a new stack that continues from this prefix - the messages (and their cached dicts and token counts)
+        are shared and the stack is not validated again
+        """
+        data = {k: getattr(self._stack, k) for k in MessageStack.model_fields}
+        data["messages"] = list(self)
+        return MessageStack.model_construct(**data)
+
+
+def dump_messages_for_context(
+    messages: typing.List[Message], context: CallingContext = None
+) -> typing.List[dict]:
+    """the messages to send to the language model
+    if the context has a token budget, function results are pruned oldest first until the messages fit.
+    the results of the latest turn are never pruned and tool messages are kept (with pruned content)
+    because every tool call must be answered
+    """
+    payload = [m.to_dict() for m in messages]
+    budget = context.context_token_budget if context else None
+    if not budget or context.prune_policy == "none":
+        return payload
+
+    model = context.model
+    counts = [m.token_count(model) for m in messages]
+    total = sum(counts)
+    """the latest turn is everything after the last message that is not a function result"""
+    latest_turn = len(payload)
+    while latest_turn and payload[latest_turn - 1]["role"] in FUNCTION_RESULT_ROLES:
+        latest_turn -= 1
+
+    for i in range(latest_turn):
+        if total <= budget:
+            break
+        if payload[i]["role"] not in FUNCTION_RESULT_ROLES:
+            continue
+        content = payload[i]["content"]
+        if not isinstance(content, str):
+            content = json.dumps(content, default=str)
+        if context.prune_policy == "truncate":
+            if len(content) <= PRUNED_FUNCTION_RESULT_CHARACTERS:
+                continue
+            content = f"{content[:PRUNED_FUNCTION_RESULT_CHARACTERS]}... [truncated to fit the context]"
+        else:
+            content = "[this function result was removed to fit the context - call the function again if you need it]"
+        payload[i] = {**payload[i], "content": content}
+        total -= counts[i] - count_tokens(content, model) - MESSAGE_TOKEN_OVERHEAD
+
+    return payload
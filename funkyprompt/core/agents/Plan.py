@@ -147,4 +147,4 @@ class Plan(AbstractEntity):
         from funkyprompt.services import entity_store
         from funkyprompt.core.functions import Function
 
-        return entity_store(Function).query(questions)
+        return entity_store(Function).vector_search(questions)
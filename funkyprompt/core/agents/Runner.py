@@ -7,6 +7,7 @@ If this goes above 200 lines of codes we have failed!
 
 from funkyprompt.core import AbstractModel
 from funkyprompt.services.models import language_model_client_from_context
+from funkyprompt.services.models.response_cache import CachedCall
 from funkyprompt.core import utils
 from funkyprompt.core.agents import (
     CallingContext,
@@ -18,10 +19,12 @@ from funkyprompt.core import ConversationModel
 from funkyprompt.services import entity_store
 from . import MessageStack
 from . import FunctionCall, FunctionManager, Function
+from .FunctionInvoker import FunctionInvoker
+from .AsyncRunner import AsyncRunner
 import typing
 
 
-class Runner:
+class Runner(FunctionInvoker, AsyncRunner):
     """Runners are simple objects that provide the interface between types and language models
     The message setup is the only function that plays with natural language.
     While almost all of the "prompting" is pushed out to types and functions,
@@ -32,6 +35,7 @@ class Runner:
     - import type metadata and functions from the model which controls most everything
     - run an executor loop sending context to the LLM
     - implement the invocation and message setup methods to manage the function and message stack
+      (function invocation is in `FunctionInvoker` and the asyncio loop in `AsyncRunner`)
 
     Under the hood the function manager handles actual function loading and searching
     """
@@ -52,6 +56,7 @@ class Runner:
         """register the functions and other metadata from the model"""
 
         self._context = None
+        self._mutated_state = False
         """register the model's functions which can include function search"""
         self._function_manager.register(self.model)
         self._function_manager.add_function(self.help)
@@ -74,37 +79,6 @@ class Runner:
 
         return plan
 
-    def invoke(self, function_call: FunctionCall):
-        """Invoke function(s) and parse results into messages
-
-        Args:
-            function_call (FunctionCall): the payload send from an LLM to call a function
-        """
-        f = self._function_manager[function_call.name]
-
-        try:
-            """try call the function - assumes its some sort of json thing that comes back"""
-            data = f(**function_call.arguments) or {}
-            data = MessageStack.format_function_response_data(
-                function_call.name, data, self._context
-            )
-            """if there is an error, how you format the message matters - some generic ones are added
-            its important to make sure the format coincides with the language model being used in context
-            """
-        except TypeError as tex:
-            utils.logger.warning(f"Error calling function {tex}")
-            data = MessageStack.format_function_response_type_error(
-                function_call.name, tex, self._context
-            )
-        except Exception as ex:
-            utils.logger.warning(f"Error calling function {ex}")
-            data = MessageStack.format_function_response_error(
-                function_call.name, ex, self._context
-            )
-
-        """update messages with data if we can or add error messages to notify the language model"""
-        self.messages.add(data)
-
     @property
     def functions(self) -> typing.Dict[str, Function]:
         """provide access to the function manager's functions"""
@@ -117,26 +91,26 @@ class Runner:
 
         """setup all the bits before running the loop"""
         lm_client: LanguageModel = language_model_client_from_context(context)
-        self._context = context
-        self.messages = MessageStack(
-            model=self.model,
-            question=question,
-            current_date=utils.dates.now(),
-            function_names=self.functions.keys(),
-            language_model_provider=context.model,
-        )
+        cached = self._cached_call(question, context)
+        response = cached.get()
+        if response is not None:
+            if context.streaming_callback:
+                context.streaming_callback(response)
+            self.dump(question, response, context)
+            return response
+        self._setup_messages(question, context)
 
         """run the agent loop to completion"""
         for _ in range(context.max_iterations):
             response = None
-            function_descriptions = [f.to_json_spec() for f in self.functions.values()]
+            function_descriptions = self._function_manager.function_specs()
             """call the model with messages and function + our system context"""
             response = lm_client(
-                messages=self.messages.model_dump(),
-                context=context,
+                messages=self.messages.dump_for_context(context),
+                context=self._loop_context(context),
                 functions=function_descriptions,
             )
-            if isinstance(response, FunctionCall):
+            if isinstance(response, (FunctionCall, list)):
                 """call one or more functions and update messages"""
                 self.invoke(response)
                 continue
@@ -148,25 +122,59 @@ class Runner:
 
         """log questions to store unless disabled"""
 
+        if not self._mutated_state:
+            cached.put(response)
         self.dump(question, response, context)
 
         return response
 
+    def _cached_call(self, question: str, context: CallingContext) -> CachedCall:
+        """the response cache around a run - the key leaves out the current date so answers are reused within the TTL"""
+        return CachedCall(
+            lambda: MessageStack(
+                model=self.model,
+                question=question,
+                function_names=self.functions.keys(),
+                language_model_provider=context.model,
+            ).model_dump(),
+            self._function_manager.function_specs(),
+            context,
+        )
+
+    def _loop_context(self, context: CallingContext) -> CallingContext:
+        """the run is cached as a whole so the model calls in the loop are not"""
+        if not context.use_response_cache:
+            return context
+        return context.model_copy(update={"use_response_cache": False})
+
+    def _setup_messages(self, question: str, context: CallingContext):
+        self._context = context
+        self._mutated_state = False
+        self.messages = MessageStack(
+            model=self.model,
+            question=question,
+            current_date=utils.dates.now(),
+            function_names=self.functions.keys(),
+            language_model_provider=context.model,
+        )
+
+    def _conversation(self, questions: str, response: str, context: CallingContext):
+        from uuid import uuid4
+
+        return ConversationModel(
+            id=str(uuid4()),
+            user_id=context.username or "system",
+            objective_node_id=context.session_id,
+            content={"question": questions, response: response},
+        )
+
     def dump(self, questions: str, response: str, context: CallingContext):
         """dumps the messages and context to stores
         if the session is a typed objective this is updated in a slowly changing dimension
         generally audit all transactions unless disabled
         """
-        from uuid import uuid4
-
-        default_id = str(uuid4())
         entity_store(ConversationModel).update_records(
-            ConversationModel(
-                id=default_id,
-                user_id=context.username or "system",
-                objective_node_id=context.session_id,
-                content={"question": questions, response: response},
-            )
+            self._conversation(questions, response, context)
         )
 
     def __call__(self, question: str, context: CallingContext = None):
@@ -6,7 +6,17 @@ from funkyprompt.core.functions.Function import Function, FunctionCall
 from .CallingContext import CallingContext
 from .DefaultAgentCore import DefaultAgentCore
 from .AbstractLanguageModel import LanguageModel
-from .MessageStack import MessageStack
+from .MessageStack import MessageStack, MessageStackSnapshot
 from .Plan import Plan
 from .FunctionManager import FunctionManager
-from .Runner import Runner
+
+
+def __getattr__(name):
+    """the runner is loaded on first use as it brings in the language model and store services"""
+    if name == "Runner":
+        from .Runner import Runner
+
+        """importing the submodule binds the module to this name so rebind the class"""
+        globals()["Runner"] = Runner
+        return Runner
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -30,6 +30,11 @@ def KeyField():
     return partial(Field, is_key=True)
 
 
+def SearchableField():
+    """text fields can be added to the full text search index for cheap keyword lookups e.g. names and codes"""
+    return partial(Field, searchable=True)
+
+
 def OpenAIEmbeddingField():
     """it is common to have text content or image content that can be embedded - openai will use system defaults"""
     return partial(Field, embedding_provider="openai")
@@ -40,12 +45,19 @@ def CLIPEmbeddingField():
     return partial(Field, embedding_provider="clip")
 
 
+def HashingEmbeddingField():
+    """text content can be embedded in-process on CPU with a hashing projector - no network is needed so this is useful offline"""
+    return partial(Field, embedding_provider="hashing")
+
+
 """
 By partially invoking we recover the doc string for the Fields that can be used as normal
 """
 KeyField = KeyField()
+SearchableField = SearchableField()
 OpenAIEmbeddingField = OpenAIEmbeddingField()
 CLIPEmbeddingField = CLIPEmbeddingField()
+HashingEmbeddingField = HashingEmbeddingField()
 
 
 class Example(BaseModel):
@@ -6,7 +6,7 @@ In this file there are some function related helper types
 1. FunctionCall: trivially wraps the name and args to a function call
 2. FunctionParameter: describes a parameter name, type, and details
 3. FunctionMetadata: describes a function and wraps parameters
-4. Function: The main class represents a Function entity 
+4. Function: The main class represents a Function entity
 """
 
 from pydantic import Field, BaseModel, PrivateAttr, model_validator, model_serializer
@@ -15,9 +15,12 @@ from funkyprompt.core import types as core_types, AbstractEntity
 from funkyprompt.core.types.inspection import resolve_signature_types, TypeInfo
 from funkyprompt.core.fields.annotations import OpenAIEmbeddingField
 from funkyprompt import LanguageModelProviders
+from .cache import CACHE_ATTRIBUTE
 import docstring_parser
 import typing
+import json
 import re
+import weakref
 
 """for example open ai does not allow some stuff like dots"""
 REGEX_ALLOW_FUNCTION_NAMES: str = (
@@ -26,6 +29,9 @@ REGEX_ALLOW_FUNCTION_NAMES: str = (
 MAX_FUNCTION_NAME_LENGTH = 64
 MAX_FUNCTION_DESCRIPTION_LENGTH = 1024
 
+"""parsed metadata per callable - docstrings and type hints do not change at runtime"""
+_FUNCTION_METADATA = weakref.WeakKeyDictionary()
+
 
 DESCRIPTION = f"""Functions provide an interface over resources/tools that a language model can use.
 Functions can be API alls, runtime python functions, database client etc and it really does not matter which is which.
@@ -37,6 +43,20 @@ With this information a language model can plan over functions and invoke functi
 class FunctionCall(BaseModel):
     name: str
     arguments: str | dict
+    id: typing.Optional[str] = Field(
+        default=None, description="the tool call id when using the tools api"
+    )
+
+    def to_tool_call(cls) -> dict:
+        """the assistant tool call that the function result messages respond to"""
+        arguments = cls.arguments
+        if not isinstance(arguments, str):
+            arguments = json.dumps(arguments, default=str)
+        return {
+            "id": cls.id,
+            "type": "function",
+            "function": {"name": cls.name, "arguments": arguments},
+        }
 
 
 class FunctionParameter(BaseModel):
@@ -92,9 +112,30 @@ class FunctionMetadataParser(BaseModel):
         default_factory=list, description="structured list of parameters"
     )
 
+    """json specs of functions made from this metadata by provider - shared so each is built once per process"""
+    _json_specs: dict = PrivateAttr(default_factory=dict)
+
     @classmethod
     def parse_metadata(
         cls, fn: typing.Callable, alias: str = None, augment_description: str = None
+    ) -> "FunctionMetadataParser":
+        """parsed metadata is cached per callable (bound methods share the entry of their function)
+        so the result is shared and should be treated as read only - see `_parse_metadata`
+        """
+        key = (alias, augment_description)
+        try:
+            cache = _FUNCTION_METADATA.setdefault(getattr(fn, "__func__", fn), {})
+        except TypeError:
+            """not every callable can be weakly referenced"""
+            return cls._parse_metadata(fn, alias, augment_description)
+        metadata = cache.get(key)
+        if metadata is None:
+            metadata = cache[key] = cls._parse_metadata(fn, alias, augment_description)
+        return metadata
+
+    @classmethod
+    def _parse_metadata(
+        cls, fn: typing.Callable, alias: str = None, augment_description: str = None
     ) -> "FunctionMetadataParser":
         """
         parses some expected doc string formats and produces a description and parameter list
@@ -173,13 +214,30 @@ class Function(AbstractEntity):
         )
         return values
 
+    """json specs by provider - shared by functions made from the same callable and reset when a field is set"""
+    _json_specs: dict = PrivateAttr(default_factory=dict)
+
+    def __setattr__(self, name, value):
+        if not name.startswith("_"):
+            self._json_specs = {}
+        super().__setattr__(name, value)
+
     def to_json_spec(
         cls, model_provider: str = LanguageModelProviders.openai, **kwargs
     ) -> dict:
-        """dump in a json schema format ala openai
+        """dump in a json schema format ala openai - the spec is cached so treat it as read only
         https://cookbook.openai.com/examples/how_to_call_functions_with_chat_models
         """
-
+        if kwargs:
+            return cls._to_json_spec(model_provider, **kwargs)
+        spec = cls._json_specs.get(model_provider)
+        if spec is None:
+            spec = cls._json_specs[model_provider] = cls._to_json_spec(model_provider)
+        return spec
+
+    def _to_json_spec(
+        cls, model_provider: str = LanguageModelProviders.openai, **kwargs
+    ) -> dict:
         """parameters - a map of stff"""
         props = {p.name: p.to_json_spec(**kwargs) for p in cls.parameters}
         """body - we parse the name but this must marry up with what we use elsewhere"""
@@ -236,12 +294,16 @@ class Function(AbstractEntity):
             fn, alias=alias, augment_description=augment_description
         )
 
-        """get the function description"""
-        return _RunTimeFunction(
+        """get the function description - functions marked `cacheable` carry their cache options in metadata"""
+        cache = getattr(fn, CACHE_ATTRIBUTE, None)
+        function = _RunTimeFunction(
             **function_desc.model_dump(),
             searchable_description=searchable_description,
+            metadata={"cache": dict(cache)} if cache else {},
             _function=fn,
         )
+        function._json_specs = function_desc._json_specs
+        return function
 
     @classmethod
     def from_openapi_endpoint(
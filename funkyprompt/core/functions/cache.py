@@ -0,0 +1,174 @@
+"""
+A memo cache for the results of idempotent functions called by agents
+Agents often call the same lookup with the same arguments several times in a loop and across sessions.
+
+- mark a function with the `cacheable` decorator or with `metadata={"cache": {...}}` on the `Function`
+- results are keyed on the qualified name of the function (the owning model and function) and the canonical json of the arguments
+- functions whose results depend on the caller can be scoped per user with `per_user=True`
+- each function has its own TTL and max size (least recently used entries are evicted) and hit/miss counters
+- writes to entity tables clear the cache (see `invalidate_function_results`)
+
+```python
+from funkyprompt.core.functions.cache import cacheable, get_function_cache
+
+@cacheable(ttl_seconds=60)
+def lookup(key: str): ...
+
+get_function_cache().stats()
+```
+"""
+
+import collections
+import json
+import threading
+import time
+import typing
+
+DEFAULT_FUNCTION_CACHE_TTL_SECONDS = 300.0
+DEFAULT_FUNCTION_CACHE_MAX_SIZE = 1000
+
+"""the attribute set on decorated callables"""
+CACHE_ATTRIBUTE = "__funkyprompt_cache__"
+
+
+def cacheable(
+    ttl_seconds: float = DEFAULT_FUNCTION_CACHE_TTL_SECONDS,
+    max_size: int = DEFAULT_FUNCTION_CACHE_MAX_SIZE,
+    per_user: bool = False,
+):
+    """mark a function as idempotent so its results can be reused - apply it under `@classmethod`
+
+    Args:
+        ttl_seconds: how long results are reused
+        max_size: max results kept for the function
+        per_user: results depend on the caller so they are only reused for the same `CallingContext.username`
+    """
+
+    def decorator(fn: typing.Callable) -> typing.Callable:
+        setattr(
+            fn,
+            CACHE_ATTRIBUTE,
+            {"ttl_seconds": ttl_seconds, "max_size": max_size, "per_user": per_user},
+        )
+        return fn
+
+    return decorator
+
+
+def cache_options(metadata: typing.Optional[dict]) -> typing.Optional[dict]:
+    """the cache options from function metadata - `{"cache": True}` uses the defaults"""
+    options = (metadata or {}).get("cache")
+    if not options:
+        return None
+    if not isinstance(options, dict):
+        options = {}
+    return {
+        "ttl_seconds": options.get("ttl_seconds", DEFAULT_FUNCTION_CACHE_TTL_SECONDS),
+        "max_size": options.get("max_size", DEFAULT_FUNCTION_CACHE_MAX_SIZE),
+        "per_user": bool(options.get("per_user", False)),
+    }
+
+
+def cache_name(function: typing.Callable) -> str:
+    """the name results are kept under - the bare function name is not unique across models
+    so the module and qualified name of the underlying callable are used e.g. `funkyprompt.entities.Project.lookup`
+    """
+    fn = getattr(function, "function", None) or function
+    qualname = getattr(fn, "__qualname__", None)
+    if not qualname:
+        return getattr(function, "name", None) or repr(fn)
+    return f"{getattr(fn, '__module__', None)}.{qualname}"
+
+
+def canonical_arguments(arguments: str | dict, scope: str = None) -> str:
+    """the same arguments in any order give the same key - the optional scope e.g. a username prefixes it"""
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments or "{}")
+    key = json.dumps(arguments, sort_keys=True, separators=(",", ":"), default=str)
+    return key if scope is None else json.dumps([scope, key])
+
+
+class FunctionResultCache:
+    """per function LRU caches of results with a TTL"""
+
+    def __init__(self):
+        self._results: typing.Dict[str, collections.OrderedDict] = {}
+        self._counters: typing.Dict[str, collections.Counter] = collections.defaultdict(
+            collections.Counter
+        )
+        self._lock = threading.Lock()
+
+    def get(
+        self, name: str, arguments: str | dict, options: dict, scope: str = None
+    ) -> typing.Tuple[bool, typing.Any]:
+        """(found, result) - the result may be None so check found"""
+        key = canonical_arguments(arguments, scope)
+        with self._lock:
+            results = self._results.get(name)
+            entry = results.get(key) if results else None
+            if entry is not None:
+                result, created_at = entry
+                if time.time() - created_at <= options["ttl_seconds"]:
+                    results.move_to_end(key)
+                    self._counters[name]["hits"] += 1
+                    return True, result
+                results.pop(key)
+            self._counters[name]["misses"] += 1
+            return False, None
+
+    def put(
+        self,
+        name: str,
+        arguments: str | dict,
+        result: typing.Any,
+        options: dict,
+        scope: str = None,
+    ):
+        key = canonical_arguments(arguments, scope)
+        with self._lock:
+            results = self._results.setdefault(name, collections.OrderedDict())
+            results[key] = (result, time.time())
+            results.move_to_end(key)
+            while len(results) > options["max_size"]:
+                results.popitem(last=False)
+                self._counters[name]["evictions"] += 1
+
+    def stats(self) -> typing.Dict[str, dict]:
+        """hit/miss counters and hit rates per function"""
+        with self._lock:
+            stats = {}
+            for name, counters in self._counters.items():
+                s = dict(counters)
+                total = s.get("hits", 0) + s.get("misses", 0)
+                s["hit_rate"] = s.get("hits", 0) / total if total else 0.0
+                s["entries"] = len(self._results.get(name, ()))
+                stats[name] = s
+            return stats
+
+    def invalidate(self, name: str = None):
+        """drop the results of one or all functions"""
+        with self._lock:
+            if name is None:
+                self._results.clear()
+            else:
+                self._results.pop(name, None)
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_function_cache() -> FunctionResultCache:
+    """the process wide function result cache"""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = FunctionResultCache()
+    return _CACHE
+
+
+def invalidate_function_results(name: str = None):
+    """called when entity tables change - a no-op until the cache is used"""
+    if _CACHE is not None:
+        _CACHE.invalidate(name)
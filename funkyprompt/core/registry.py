@@ -0,0 +1,145 @@
+"""
+The entity registry indexes entity types by full name e.g. `public.project`.
+Entity classes register themselves when they are defined (see `AbstractEntity.__pydantic_init_subclass__`)
+so user packages only need to be imported and lookups are a dict access rather than a package scan.
+
+- `load_package` imports the modules of a package once so that their entities register
+- with `ENTITY_MANIFEST_PATH` set, the modules that define entities are read from a manifest
+  and imported directly, skipping the `pkgutil` walk - `write_manifest` saves one
+
+```python
+from funkyprompt.core.registry import entity_registry
+entity_registry.load_package("my_package.entities")
+entity_registry.get("public.project")
+```
+"""
+
+import importlib
+import json
+import os
+import pkgutil
+import threading
+import typing
+from funkyprompt.core.utils.env import ENTITY_MANIFEST_PATH
+
+
+class EntityRegistry:
+    """a registry of entity types indexed by full name
+
+    Args:
+        manifest_path: an optional json manifest of package -> entity modules
+    """
+
+    def __init__(self, manifest_path: str = ENTITY_MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self._entities: typing.Dict[str, type] = {}
+        self._index: typing.Dict[str, type] = None
+        self._packages: typing.Set[str] = set()
+        self._lock = threading.RLock()
+
+    def register(self, entity: type) -> type:
+        """add an entity type - called for every subclass of `AbstractEntity`"""
+        with self._lock:
+            self._entities[f"{entity.__module__}.{entity.__qualname__}"] = entity
+            self._index = None
+        return entity
+
+    def _read_manifest(self) -> dict:
+        if not self.manifest_path:
+            return {}
+        path = os.path.expanduser(self.manifest_path)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _scan(self, package: str):
+        """import every module of the package - entities register as they are defined"""
+        for _importer, module_name, is_package in pkgutil.iter_modules(
+            importlib.import_module(package).__path__
+        ):
+            full_module_name = f"{package}.{module_name}"
+            if is_package:
+                self._scan(full_module_name)
+            importlib.import_module(full_module_name)
+
+    def load_package(self, package: str):
+        """import the entity modules of a package once - from the manifest if there is one for it"""
+        if package in self._packages:
+            return
+        with self._lock:
+            if package in self._packages:
+                return
+            modules = self._read_manifest().get(package)
+            try:
+                if modules is None:
+                    self._scan(package)
+                else:
+                    for module in modules:
+                        importlib.import_module(module)
+            except ImportError as ex:
+                from funkyprompt.core.utils import logger
+
+                logger.warning(
+                    f"entity manifest is stale for {package} - scanning - {ex}"
+                )
+                self._scan(package)
+            self._packages.add(package)
+
+    def write_manifest(self, path: str = None) -> dict:
+        """save the modules that define entities for each loaded package"""
+        path = os.path.expanduser(path or self.manifest_path)
+        manifest = {
+            package: sorted(
+                {
+                    e.__module__
+                    for e in self._entities.values()
+                    if e.__module__ == package or e.__module__.startswith(package + ".")
+                }
+            )
+            for package in self._packages
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        return manifest
+
+    def entities(
+        self, packages: typing.List[str] = None, include_hidden: bool = False
+    ) -> typing.List[type]:
+        """the registered entities - optionally only those defined under some packages
+        entities prefixed with _ or with `Config.is_hidden` are hidden entities
+        """
+        with self._lock:
+            entities = list(self._entities.values())
+        if packages:
+            entities = [
+                e
+                for e in entities
+                if any(
+                    e.__module__ == p or e.__module__.startswith(p + ".")
+                    for p in packages
+                )
+            ]
+        if not include_hidden:
+            entities = [
+                e
+                for e in entities
+                if hasattr(e, "Config")
+                and e.__name__[:1] != "_"
+                and not getattr(e.Config, "is_hidden", False)
+            ]
+        return entities
+
+    def get(self, fullname: str) -> typing.Optional[type]:
+        """the entity for a full name e.g. `public.project` - the index is rebuilt only after new registrations"""
+        index = self._index
+        if index is None:
+            with self._lock:
+                index = self._index = {
+                    e.get_model_fullname(): e for e in self.entities()
+                }
+        return index.get(fullname)
+
+
+entity_registry = EntityRegistry()
@@ -1,23 +1,78 @@
+import json
+import typing
+import weakref
+
+
+def cypher_string(value) -> str:
+    """a quoted cypher string literal - names are data and must not be able to break out of the query
+    (a `$$` would end the dollar quoted cypher body so the second `$` is unicode escaped)
+    """
+    value = (
+        str(value).replace("\\", "\\\\").replace("'", "\\'").replace("$$", "$\\u0024")
+    )
+    return f"'{value}'"
+
+
 class CypherHelper:
     """
     see [age docs](https://age.apache.org/age-manual/master/intro/overview.html)
     """
 
     def __init__(self, model, db=None):
-        """"""
+        """the model is held weakly as helpers are cached per model class"""
         from funkyprompt.core import AbstractEntity
 
-        self.model: AbstractEntity = model
+        self._model: typing.Callable[[], AbstractEntity] = weakref.ref(model)
+
+    @property
+    def model(self):
+        return self._model()
 
     def query_from_natural_language(cls, question: str):
         """"""
         return None
 
-    def get_graph_model_attributes(self, node):
+    def get_graph_model_attributes(self, node=None) -> typing.List[str]:
         """the default node behviour is to just keep the name but we can 'index' other attributes
+        fields marked `graph_attribute=True` are copied onto the node
         this can either be done upfront or later on some trigger or job
         """
-        return None
+        node = node or self.model
+        return [
+            k
+            for k, v in node.model_fields.items()
+            if (v.json_schema_extra or {}).get("graph_attribute") and k != "name"
+        ]
+
+    def upsert_nodes_query(self):
+        """a batched node upsert - the nodes are bound as one agtype parameter `$nodes`
+        which is a list of maps with the name and any graph attributes (see `upsert_nodes_params`).
+        pair with `cypher_with_age_wrapper(..., parameters=True)` and run it in chunks
+        """
+        label = self.model.get_model_fullname().replace(".", "_")
+        attributes = self.get_graph_model_attributes(self.model)
+        set_attributes = (
+            "SET " + ", ".join(f"n.{a} = x.{a}" for a in attributes)
+            if attributes
+            else ""
+        )
+        return f"""UNWIND $nodes AS x
+            MERGE (n:{label} {{name: x.name}})
+            {set_attributes}
+            RETURN count(n)"""
+
+    def upsert_nodes_params(self, nodes) -> str:
+        """the agtype parameter map for `upsert_nodes_query`"""
+        attributes = self.get_graph_model_attributes(self.model)
+        return json.dumps(
+            {
+                "nodes": [
+                    {"name": n.name, **{a: getattr(n, a, None) for a in attributes}}
+                    for n in nodes
+                ]
+            },
+            default=str,
+        )
 
     # def upsert_path_query(self, node):https://age.apache.org/age-manual/master/clauses/create.html
 
@@ -31,7 +86,8 @@ class CypherHelper:
     def upsert_node_query(self, nodes):
         """
         create a node upsert query - any attributes can be upserted
-        but labeled nodes are supposed to be unique by name
+        but labeled nodes are supposed to be unique by name.
+        this is one MERGE per node - prefer the batched `upsert_nodes_query` for more than a few nodes
         """
 
         if not isinstance(nodes, list):
@@ -40,23 +96,23 @@ class CypherHelper:
         label = self.model.get_model_fullname().replace(".", "_")
 
         cypher_queries = []
+        graph_attributes = self.get_graph_model_attributes(self.model)
 
         for n in nodes:
             """we may set some attributes like descriptions and stuff"""
             set_attributes = ""
-            graph_attributes = self.get_graph_model_attributes(self.model)
             if graph_attributes:
-                set_attributes = f"""SET n = {{
-                        description: 'new desc'
-                    }}"""
+                """missing attributes are set to null (removed) as in the batched upsert"""
+                values = {a: getattr(n, a, None) for a in graph_attributes}
+                set_attributes = "SET " + ", ".join(
+                    f"n.{a} = {'null' if v is None else cypher_string(v)}"
+                    for a, v in values.items()
+                )
 
             cypher_queries.append(
-                f"""MERGE (n:{label} {{name: '{n.name}'}})
+                f"""MERGE (n:{label} {{name: {cypher_string(n.name)}}})
                 {set_attributes}
                 RETURN n"""
             )
 
-        """for now block them up but we investigate a more efficient notation
-           we generally expect low cardinality upserts for entity types in practice
-        """
         return "\n".join(cypher_queries)
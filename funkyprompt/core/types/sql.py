@@ -1,17 +1,20 @@
 from uuid import UUID
-from funkyprompt.core.types import EMBEDDING_LENGTH_OPEN_AI
+import re
 import typing
-import psycopg2.extras
 import uuid
-from . import some_default_for_type
-from typing import get_type_hints
+import weakref
+import json
+import hashlib
 from enum import Enum
+from pydantic import BaseModel, Field
 
 """special postgres attributes on pydantic fields
 
 sql_child_relation
 is_key
 varchar_size
+vector_index - options for the ANN index on an embedding column see `VectorIndexOptions`
+searchable - text fields that are added to the full text search document
 """
 
 
@@ -58,17 +61,120 @@ class VectorSearchOperator(Enum):
     COSINE = "<=>"
 
 
+"""pgvector operator classes for each search operator - the index only helps queries that use the same operator"""
+VECTOR_OPERATOR_CLASSES = {
+    VectorSearchOperator.L1: "vector_l1_ops",
+    VectorSearchOperator.L2: "vector_l2_ops",
+    VectorSearchOperator.INNER_PRODUCT: "vector_ip_ops",
+    VectorSearchOperator.COSINE: "vector_cosine_ops",
+}
+
+
+"""similarity in [higher is better] terms for each distance operator so that it can be blended with text rank"""
+VECTOR_SIMILARITY_EXPRESSIONS = {
+    VectorSearchOperator.L1: "1.0 / (1.0 + {d})",
+    VectorSearchOperator.L2: "1.0 / (1.0 + {d})",
+    VectorSearchOperator.INNER_PRODUCT: "-1.0 * {d}",
+    VectorSearchOperator.COSINE: "1.0 - {d}",
+}
+TEXT_SEARCH_CONFIG = "english"
+TEXT_SEARCH_COLUMN = "search_document"
+
+"""the column in the bulk load staging table that keeps the order of rows in a batch"""
+STAGING_ORDINAL_COLUMN = "_staging_ordinal"
+
+"""the reciprocal rank fusion constant - ranks are scored 1/(k + rank)"""
+RRF_K = 60
+
+"""leading statements that cannot be prepared or bound with the main statement"""
+_LEADING_SETTING = re.compile(r"\s*((?:SET|LOAD)\b[^;]+;)", re.IGNORECASE)
+
+
+def split_local_settings(query: str) -> typing.Tuple[typing.List[str], str]:
+    """split leading settings e.g. `SET LOCAL hnsw.ef_search` or the AGE `LOAD`/`SET search_path` off a query.
+    bound and prepared statements must be a single statement so these are run first in the same transaction
+    """
+    settings = []
+    match = _LEADING_SETTING.match(query)
+    while match:
+        settings.append(match.group(1))
+        query = query[match.end() :]
+        match = _LEADING_SETTING.match(query)
+    return settings, query
+
+
+def to_vector_param(vec: typing.List[float]) -> str:
+    """the bound parameter for a `%s::vector` placeholder in the compact pgvector text form
+    numpy arrays are converted too as there is no pgvector adapter on the psycopg2 connections
+    """
+    return "[" + ",".join(repr(float(v)) for v in vec) + "]"
+
+
+class VectorIndexOptions(BaseModel):
+    """ANN index options for an embedding column - set `vector_index` on the embedding field to override e.g.
+
+    ```python
+    description: str = OpenAIEmbeddingField(description="...", vector_index={"index_type": "ivfflat", "lists": 500})
+    ```
+    """
+
+    index_type: typing.Optional[str] = Field(
+        default="hnsw", description="hnsw, ivfflat or None for no index"
+    )
+    operator: VectorSearchOperator = Field(
+        default=VectorSearchOperator.INNER_PRODUCT,
+        description="The search operator the index serves",
+    )
+    m: int = Field(default=16, description="hnsw max connections per layer")
+    ef_construction: int = Field(
+        default=64, description="hnsw candidate list size when building"
+    )
+    ef_search: int = Field(
+        default=40, description="hnsw candidate list size when searching"
+    )
+    lists: int = Field(default=100, description="ivfflat number of lists")
+    probes: int = Field(
+        default=10, description="ivfflat number of lists probed when searching"
+    )
+
+    @property
+    def operator_class(self):
+        return VECTOR_OPERATOR_CLASSES[self.operator]
+
+    def search_settings(self, ef_search: int = None, probes: int = None) -> str:
+        """transaction local planner settings for a search over this index"""
+        if self.index_type == "hnsw":
+            return f"SET LOCAL hnsw.ef_search = {int(ef_search or self.ef_search)};"
+        if self.index_type == "ivfflat":
+            return f"SET LOCAL ivfflat.probes = {int(probes or self.probes)};"
+        return ""
+
+
 class SqlHelper:
 
     def __init__(cls, model):
         from funkyprompt.core import AbstractModel
 
-        cls.model: AbstractModel = model
+        """helpers are cached per model class so the class is held weakly to let dynamic models be collected"""
+        cls._model: typing.Callable[[], AbstractModel] = weakref.ref(model)
         cls.table_name = cls.model.get_model_fullname()
         cls.field_names = SqlHelper.select_fields(model)
         cls.id_field = cls.model.get_model_key_field() or "id"
         cls.embedding_fields = list(cls.model.get_embedding_fields().values())
+        """hidden content hashes of the embedding source text so unchanged rows are not re-embedded"""
+        cls.embedding_hash_fields = [f"{f}_hash" for f in cls.embedding_fields]
+        cls.searchable_fields = [
+            k
+            for k, v in model.model_fields.items()
+            if (v.json_schema_extra or {}).get("searchable")
+        ]
         cls.metadata = {}
+        """helpers are cached per model class (see `AbstractModel.sql`) so query templates are built once"""
+        cls._query_templates = {}
+
+    @property
+    def model(cls):
+        return cls._model()
 
     @classmethod
     def select_fields(cls, model):
@@ -84,27 +190,21 @@ class SqlHelper:
             fields.append(k)
         return fields
 
-    def select_fields_with_dummies(cls):
-        """selects the database fields but uses dummy values. this is to allow for some upsert modes (small hack/trick)"""
-
-        fields = cls.select_fields(cls.model)
-        model_fields = get_type_hints(cls.model)
-
-        def dummy_value(field_name):
-            ftype = model_fields[field_name]
-
-            return some_default_for_type(ftype)
-
-        return {f: dummy_value(f) for f in fields}
-
-    def partial_model_tuple(cls, data: dict) -> tuple:
-        """
-        simple wrapper that creates a placeholder tuple injecting in partial actual data
-        this is paired with partial updates
-        """
-        d = cls.select_fields_with_dummies()
-        d.update(data)
-        return tuple(d.values())
+    @property
+    def embedding_update_columns(cls) -> typing.List[str]:
+        """the columns sent in an embedding update - the key, the vectors and then their content hashes"""
+        return [cls.id_field] + cls.embedding_fields + cls.embedding_hash_fields
+
+    def embedding_update_tuple(cls, data: dict) -> tuple:
+        """the row for `embedding_update_query` from a record with the key, vectors and hashes"""
+        return (
+            (data[cls.id_field],)
+            + tuple(
+                None if data.get(e) is None else to_vector_param(data[e])
+                for e in cls.embedding_fields
+            )
+            + tuple(data.get(h) for h in cls.embedding_hash_fields)
+        )
 
     def serialize_for_db(cls, model_instance) -> dict:
         """this exists only to allow for generalized types
@@ -127,6 +227,97 @@ class SqlHelper:
 
         return data
 
+    @staticmethod
+    def content_hash(value) -> str:
+        """the hash of embedding source content - complex content is hashed as sorted json"""
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            value = json.dumps(value, sort_keys=True, default=str)
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def embedding_hashes(cls, row: dict) -> dict:
+        """the hash column values for the embedding sources in the row"""
+        return {
+            f"{e}_hash": cls.content_hash(row.get(f))
+            for f, e in cls.model.get_embedding_fields().items()
+        }
+
+    def rows_with_changed_embedding_sources(
+        cls, rows: typing.List[dict]
+    ) -> typing.List[dict]:
+        """filter upserted rows to those where the source text no longer matches the stored hash
+        the stored hash is only written with the vector so rows that were never embedded are always kept
+        """
+        return [
+            r
+            for r in rows
+            if any(r.get(k) != v for k, v in cls.embedding_hashes(r).items())
+        ]
+
+    def vector_index_options(cls, embedding_field: str) -> VectorIndexOptions:
+        """the index options declared on the source field of the embedding column"""
+        field = embedding_field[: -len("_embedding")]
+        extras = (
+            getattr(cls.model.model_fields.get(field), "json_schema_extra", {}) or {}
+        )
+        return VectorIndexOptions(**(extras.get("vector_index") or {}))
+
+    def vector_index_name(cls, embedding_field: str) -> str:
+        options = cls.vector_index_options(embedding_field)
+        return f"{cls.model.get_model_namespace()}_{cls.model.get_model_name()}_{embedding_field}_{options.index_type}_idx"
+
+    def create_vector_index_scripts(
+        cls, concurrently: bool = False, index_types: typing.List[str] = None
+    ) -> typing.List[str]:
+        """index scripts for each embedding column - concurrent builds do not block writes but cannot run in a transaction
+        `index_types` restricts the scripts to some index types e.g. only `hnsw` when creating the table
+        """
+        scripts = []
+        for e in cls.embedding_fields:
+            options = cls.vector_index_options(e)
+            if not options.index_type:
+                continue
+            if index_types is not None and options.index_type not in index_types:
+                continue
+            if options.index_type == "hnsw":
+                params = f"m = {options.m}, ef_construction = {options.ef_construction}"
+            elif options.index_type == "ivfflat":
+                params = f"lists = {options.lists}"
+            else:
+                raise ValueError(f"unsupported vector index type {options.index_type}")
+            scripts.append(
+                f"""CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {cls.vector_index_name(e)}
+        ON {cls.table_name} USING {options.index_type} ({e} {options.operator_class})
+        WITH ({params});"""
+            )
+        return scripts
+
+    def drop_vector_index_scripts(cls, concurrently: bool = False) -> typing.List[str]:
+        """drop the embedding column indexes e.g. to rebuild with new options"""
+        return [
+            f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {cls.model.get_model_namespace()}.{cls.vector_index_name(e)};"
+            for e in cls.embedding_fields
+            if cls.vector_index_options(e).index_type
+        ]
+
+    def _search_document_expression(cls) -> str:
+        """weighted tsvector over the searchable fields"""
+        return " || ".join(
+            f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}'::regconfig, coalesce({f}::text, '')), '{'A' if f in (cls.id_field, 'name') else 'B'}')"
+            for f in cls.searchable_fields
+        )
+
+    def create_text_index_scripts(cls, concurrently: bool = False) -> typing.List[str]:
+        """the GIN index over the search document"""
+        if not cls.searchable_fields:
+            return []
+        name = f"{cls.model.get_model_namespace()}_{cls.model.get_model_name()}_{TEXT_SEARCH_COLUMN}_gin_idx"
+        return [
+            f"""CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {name}
+        ON {cls.table_name} USING gin ({TEXT_SEARCH_COLUMN});"""
+        ]
+
     @classmethod
     def pydantic_to_postgres_type(cls, t):
         """fill me in"""
@@ -140,6 +331,16 @@ class SqlHelper:
         }
         return type_mapping.get(t, "TEXT")
 
+    def column_type(cls, field_name: str) -> str:
+        """the postgres type of the column for a model field"""
+        field_type = cls.model.get_model_type_hints()[field_name]
+        """handle uuid option"""
+        if typing.get_origin(field_type) is typing.Union and UUID in typing.get_args(
+            field_type
+        ):
+            return "UUID"
+        return SqlHelper.pydantic_to_postgres_type(field_type)
+
     @classmethod
     def _create_embedding_table_script(cls, entity_model, existing_columns=None):
         """for a separate embedding table
@@ -184,19 +385,13 @@ class SqlHelper:
         table_name = (
             f"{entity_model.get_model_namespace()}.{entity_model.get_model_name()}"
         )
-        fields = typing.get_type_hints(entity_model)
+        fields = entity_model.get_model_type_hints()
         field_descriptions = entity_model.model_fields
         id_field = "id"  # <- the id is a hash of the name or a unique id and we use it as the constrain by convention
 
         columns = []
         for field_name, field_type in fields.items():
-            """handle uuid option"""
-            if typing.get_origin(
-                field_type
-            ) is typing.Union and UUID in typing.get_args(field_type):
-                postgres_type = "UUID"
-            else:
-                postgres_type = SqlHelper.pydantic_to_postgres_type(field_type)
+            postgres_type = cls.column_type(field_name)
 
             field_desc = field_descriptions[field_name]
             column_definition = f"{field_name} {postgres_type}"
@@ -212,14 +407,25 @@ class SqlHelper:
             """check should add embedding vector for any columns"""
             metadata = field_descriptions.get(field_name)
             extras = getattr(metadata, "json_schema_extra", {}) or {}
-            if extras.get("embedding_provider", "").replace("_", "") == "openai":
-                columns.append(
-                    f"{field_name}_embedding vector({EMBEDDING_LENGTH_OPEN_AI}) NULL"
-                )
+            if extras.get("embedding_provider"):
+                """the vector size is declared by the registered provider"""
+                from funkyprompt.core.utils.embeddings import get_embedding_provider
+
+                dimension = get_embedding_provider(
+                    extras["embedding_provider"]
+                ).dimension
+                columns.append(f"{field_name}_embedding vector({dimension}) NULL")
+                columns.append(f"{field_name}_embedding_hash VARCHAR NULL")
 
             """add system fields - created at and updated at fields"""
             # TODO
 
+        """a generated full text search document over the searchable fields - the key field ranks highest"""
+        if cls.searchable_fields:
+            columns.append(
+                f"{TEXT_SEARCH_COLUMN} tsvector GENERATED ALWAYS AS ({cls._search_document_expression()}) STORED"
+            )
+
         """add system fields"""
         columns.append("created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
         columns.append("updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
@@ -237,6 +443,14 @@ class SqlHelper:
         EXECUTE FUNCTION update_updated_at_column();
 
         """
+        """the hnsw and text search indexes are created with the table.
+        ivfflat lists are trained on the rows present when the index is built so those are only built
+        after loading with `PostgresService.build_vector_indexes`
+        """
+        create_table_script += "\n".join(
+            cls.create_vector_index_scripts(index_types=["hnsw"])
+            + cls.create_text_index_scripts()
+        )
         return create_table_script
 
     def upsert_query(
@@ -269,8 +483,12 @@ class SqlHelper:
         ```
         """
 
+        key = (returning, tuple(restricted_update_fields or []))
+        if key in cls._query_templates:
+            return cls._query_templates[key]
+
         """TODO: the return can be efficient * for example pulls back embeddings which is almost never what you want"""
-        field_list = cls.field_names
+        field_list = list(cls.field_names)
         """conventionally add in order anything that is added in upsert and missing"""
         for c in restricted_update_fields or []:
             if c not in field_list:
@@ -278,7 +496,6 @@ class SqlHelper:
 
         non_id_fields = [f for f in field_list if f != cls.id_field]
         insert_columns = ", ".join(field_list)
-        insert_values = ", ".join([f"%({field})s" for field in field_list])
 
         """restricted updated fields are powerful for updates 
            we can ignore the other columns in the inserts and added place holder values in the update
@@ -290,10 +507,7 @@ class SqlHelper:
             ]
         )
 
-        value_placeholders = ", ".join(
-            [f"({insert_values})" for _ in range(batch_size)]
-        )
-
+        """the batch size does not change the template - `execute_values` expands the one placeholder"""
         value_placeholders = "%s"
 
         """batch insert with conflict - prefix with a delete statement that sets items to deleted"""
@@ -306,25 +520,112 @@ class SqlHelper:
         RETURNING {returning};
         """
 
-        return upsert_statement.strip()
+        cls._query_templates[key] = upsert_statement.strip()
+        return cls._query_templates[key]
 
-    def embedding_fields_partial_update_query(
-        cls, batch_size: int, returning: str = "*"
-    ):
-        """for now using a convention but this should be determined from the model
-        we have added a convention on the restricted fields for now to reuse the partial update
-        in this mode we are adding embedding fields that are not on the model schema but the convention is to add the embedding fields in order
-        later we should be more explicit about this
-        a decision is made to treat the embedding just like a hidden index that is not on the model - therefore it lives on the client/infra only and not the model
-        we build this into the SQL adapters and postgres client
+    @property
+    def staging_table_name(cls):
+        """the session local staging table used for bulk loads"""
+        return (
+            f"_staging_{cls.model.get_model_namespace()}_{cls.model.get_model_name()}"
+        )
+
+    def create_staging_table_script(cls):
+        """a temp table shaped like the target that empties itself on each commit
+        the extra ordinal column records the position of each row in the batch
         """
+        return f"""CREATE TEMP TABLE IF NOT EXISTS {cls.staging_table_name}
+        (LIKE {cls.table_name} INCLUDING DEFAULTS, {STAGING_ORDINAL_COLUMN} BIGINT) ON COMMIT DELETE ROWS;"""
 
-        """notice we apply a convention for embedding fields"""
-        return cls.partial_update_query(
-            field_names=[f for f in cls.embedding_fields],
-            batch_size=batch_size,
-            returning=returning,
+    def copy_query(cls):
+        """stream csv rows (see `to_csv_row`) into the staging table - NULL is the unquoted empty value"""
+        columns = ", ".join(cls.field_names + [STAGING_ORDINAL_COLUMN])
+        return f"""COPY {cls.staging_table_name} ({columns}) FROM STDIN WITH (FORMAT csv)"""
+
+    def bulk_merge_query(cls, returning: str = None):
+        """a single insert-select from the staging table into the target table
+        duplicate keys in one batch would fail the upsert so the last one (by ordinal) wins
+        """
+        field_list = cls.field_names
+        insert_columns = ", ".join(field_list)
+        update_set = ", ".join(
+            [
+                f"{field} = EXCLUDED.{field}"
+                for field in field_list
+                if field != cls.id_field
+            ]
+        )
+        returning = returning or cls.id_field
+        return f"""INSERT INTO {cls.table_name} ({insert_columns})
+        SELECT DISTINCT ON ({cls.id_field}) {insert_columns} FROM {cls.staging_table_name}
+        ORDER BY {cls.id_field}, {STAGING_ORDINAL_COLUMN} DESC
+        ON CONFLICT ({cls.id_field}) DO UPDATE
+        SET {update_set}
+        RETURNING {returning};"""
+
+    @staticmethod
+    def to_array_literal(values: typing.Iterable) -> str:
+        """the postgres array literal for a list e.g. `{"a","b"}` - elements are always quoted"""
+
+        def _element(v):
+            if v is None:
+                return "NULL"
+            if isinstance(v, (list, tuple)):
+                return SqlHelper.to_array_literal(v)
+            if isinstance(v, bool):
+                v = "true" if v else "false"
+            elif isinstance(v, dict):
+                v = json.dumps(v, default=str)
+            v = str(v).replace("\\", "\\\\").replace('"', '\\"')
+            return f'"{v}"'
+
+        return "{" + ",".join(_element(v) for v in values) + "}"
+
+    @staticmethod
+    def to_csv_row(values: typing.Iterable, ordinal: int = None) -> str:
+        """format one row for `COPY ... WITH (FORMAT csv)`
+        values are always quoted so that only None is read as NULL and empty strings survive.
+        dicts are sent as json and lists as postgres array literals (see `to_array_literal`)
+        """
+
+        def _cell(v):
+            if v is None:
+                return ""
+            if isinstance(v, bool):
+                v = "true" if v else "false"
+            elif isinstance(v, dict):
+                v = json.dumps(v, default=str)
+            elif isinstance(v, (list, tuple)):
+                v = SqlHelper.to_array_literal(v)
+            v = str(v)
+            return '"' + v.replace('"', '""') + '"'
+
+        values = list(values)
+        if ordinal is not None:
+            values.append(ordinal)
+        return ",".join(_cell(v) for v in values) + "\n"
+
+    def embedding_update_query(cls, returning: str = None):
+        """a narrow update of the embedding columns keyed by id - rows are `embedding_update_tuple`s.
+        the embedding is treated like a hidden index that is not on the model so only the key, the vectors and
+        their content hashes are sent (not full width placeholder rows) and only existing rows are updated.
+        the one `VALUES %s` placeholder is expanded for the batch
+        """
+        key = ("embedding_update", returning)
+        if key in cls._query_templates:
+            return cls._query_templates[key]
+
+        columns = cls.embedding_update_columns
+        update_set = ", ".join(
+            [f"{e} = v.{e}::vector" for e in cls.embedding_fields]
+            + [f"{h} = v.{h}" for h in cls.embedding_hash_fields]
         )
+        cls._query_templates[key] = f"""UPDATE {cls.table_name} AS t
+        SET {update_set}
+        FROM (VALUES %s) AS v ({", ".join(columns)})
+        WHERE t.{cls.id_field} = v.{cls.id_field}::{cls.column_type(cls.id_field)}
+        RETURNING t.{returning or cls.id_field};"""
+        return cls._query_templates[key]
 
     def partial_update_query(cls, field_names, batch_size: int, returning: str = "*"):
         """
@@ -337,6 +638,162 @@ class SqlHelper:
             restricted_update_fields=field_names,
         )
 
+    def vector_search_query(
+        cls,
+        search_operator: VectorSearchOperator = None,
+        limit: int = 7,
+        distance_max: float = 2,
+        ef_search: int = None,
+        probes: int = None,
+    ):
+        """generate the vector search query for now for only one embedding col
+        the distance is computed once and the inner ORDER BY distance LIMIT k is what lets the ANN index be used.
+        the distance threshold is applied to the k nearest rather than scanning the table with a WHERE
+        the search operator defaults to the one the column index was built for
+        the query vector is the one bound parameter (see `to_vector_param`) so the statement can be prepared once per shape
+        """
+
+        embedding_fields = cls.embedding_fields[0]
+        select_fields = ",".join(cls.field_names)
+        options = cls.vector_index_options(embedding_fields)
+        search_operator = search_operator or options.operator
+
+        """distances are determined in different ways, that includes what 'large' is"""
+        distances = f"{embedding_fields} {search_operator.value.strip()} %s::vector"
+
+        """per query index settings only apply if the operator matches the index"""
+        settings = (
+            options.search_settings(ef_search=ef_search, probes=probes)
+            if search_operator == options.operator
+            else ""
+        )
+
+        """TODO: we could make some attempt to normalize for different systems
+        the scale of divergence e.g. for NE_INNER_PRODUCT (-1 - d)"""
+        return f"""{settings}
+        SELECT * FROM (
+            SELECT
+            {select_fields},
+            ({distances}) as distances
+            from {cls.table_name}
+                  order by distances ASC LIMIT {int(limit)}
+        ) nearest WHERE distances < {distance_max}
+             """
+
+    def multi_vector_search_query(
+        cls,
+        n: int,
+        search_operator: VectorSearchOperator = None,
+        limit: int = 7,
+        distance_max: float = 2,
+        ef_search: int = None,
+        probes: int = None,
+        fusion: str = "rrf",
+    ):
+        """search for several query vectors (e.g. paraphrases of a question) in one statement
+        each vector gets its own nearest k via a LATERAL join over a VALUES list so the ANN index serves each one.
+        results are deduplicated by key and fused with reciprocal rank fusion (`rrf`) or by the best distance (`max`)
+        there are `n` bound vector parameters - one per question
+        """
+        if fusion not in ("rrf", "max"):
+            raise ValueError(f"unsupported fusion {fusion} - use `rrf` or `max`")
+        embedding_fields = cls.embedding_fields[0]
+        select_fields = ",".join(f"t.{f}" for f in cls.field_names)
+        options = cls.vector_index_options(embedding_fields)
+        search_operator = search_operator or options.operator
+        settings = (
+            options.search_settings(ef_search=ef_search, probes=probes)
+            if search_operator == options.operator
+            else ""
+        )
+        values = ", ".join(f"({i}, %s::vector)" for i in range(int(n)))
+        order = "score DESC" if fusion == "rrf" else "distances ASC"
+
+        return f"""{settings}
+        WITH questions (qid, vec) AS (VALUES {values}),
+        hits AS (
+            SELECT questions.qid, nearest.{cls.id_field}, nearest.distances,
+                row_number() OVER (PARTITION BY questions.qid ORDER BY nearest.distances) AS rank
+            FROM questions CROSS JOIN LATERAL (
+                SELECT {cls.id_field}, ({embedding_fields} {search_operator.value.strip()} questions.vec) AS distances
+                FROM {cls.table_name}
+                ORDER BY distances ASC LIMIT {int(limit)}
+            ) nearest
+        ),
+        fused AS (
+            SELECT {cls.id_field}, min(distances) AS distances, sum(1.0 / ({RRF_K} + rank)) AS score
+            FROM hits WHERE distances < {distance_max}
+            GROUP BY {cls.id_field}
+        )
+        SELECT {select_fields}, fused.distances, fused.score
+        FROM fused JOIN {cls.table_name} t ON t.{cls.id_field} = fused.{cls.id_field}
+        ORDER BY {order} LIMIT {int(limit)}
+        """
+
+    def hybrid_search_query(
+        cls,
+        with_vector: bool = True,
+        search_operator: VectorSearchOperator = None,
+        limit: int = 7,
+        text_weight: float = 0.5,
+        vector_weight: float = 0.5,
+        ef_search: int = None,
+        probes: int = None,
+    ):
+        """blend full text rank and vector similarity in one query
+        candidates are the top k of each (both served by their indexes) and the score is
+        `text_weight * ts_rank_cd + vector_weight * similarity`.
+        the bound parameters are the question text and then (`with_vector`) the question vector
+        without a vector this is a text only search
+        """
+        if not cls.searchable_fields:
+            raise Exception(
+                "this type does not support text search as there are no searchable fields"
+            )
+        select_fields = ",".join(f"t.{f}" for f in cls.field_names)
+        limit = int(limit)
+        ctes = [f"""lexical AS (
+            SELECT {cls.id_field}, ts_rank_cd({TEXT_SEARCH_COLUMN}, query, 32) AS text_score
+            FROM {cls.table_name}, websearch_to_tsquery('{TEXT_SEARCH_CONFIG}', %s) query
+            WHERE {TEXT_SEARCH_COLUMN} @@ query
+            ORDER BY text_score DESC LIMIT {limit}
+        )"""]
+        candidates = f"SELECT {cls.id_field} FROM lexical"
+        vector_score, settings, semantic_join = "0.0", "", ""
+
+        if with_vector and vector_weight:
+            embedding_fields = cls.embedding_fields[0]
+            options = cls.vector_index_options(embedding_fields)
+            search_operator = search_operator or options.operator
+            if search_operator == options.operator:
+                settings = options.search_settings(ef_search=ef_search, probes=probes)
+            ctes.append(f"""semantic AS (
+            SELECT {cls.id_field}, ({embedding_fields} {search_operator.value.strip()} %s::vector) AS distances
+            FROM {cls.table_name}
+            ORDER BY distances ASC LIMIT {limit}
+        )""")
+            candidates += f" UNION SELECT {cls.id_field} FROM semantic"
+            semantic_join = (
+                f"LEFT JOIN semantic s ON s.{cls.id_field} = c.{cls.id_field}"
+            )
+            vector_score = VECTOR_SIMILARITY_EXPRESSIONS[search_operator].format(
+                d="s.distances"
+            )
+
+        return f"""{settings}
+        WITH {", ".join(ctes)},
+        candidates AS ({candidates})
+        SELECT {select_fields},
+            coalesce(l.text_score, 0.0) AS text_score,
+            coalesce({vector_score}, 0.0) AS vector_score,
+            {float(text_weight)} * coalesce(l.text_score, 0.0) + {float(vector_weight)} * coalesce({vector_score}, 0.0) AS score
+        FROM candidates c
+        JOIN {cls.table_name} t ON t.{cls.id_field} = c.{cls.id_field}
+        LEFT JOIN lexical l ON l.{cls.id_field} = c.{cls.id_field}
+        {semantic_join}
+        ORDER BY score DESC LIMIT {limit}
+        """
+
     def query_from_natural_language(
         self,
         question: str,
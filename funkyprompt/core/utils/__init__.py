@@ -1,5 +1,13 @@
 from . import dates, env
-from loguru import logger
 import os
 
 os.environ["LOGURU_LEVEL"] = "DEBUG"
+
+
+def __getattr__(name):
+    """the logger is loaded on first use so that importing funkyprompt does not pay for loguru"""
+    if name == "logger":
+        from loguru import logger
+
+        return logger
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
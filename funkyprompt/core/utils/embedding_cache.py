@@ -0,0 +1,182 @@
+"""
+A content addressed cache for embeddings keyed on (provider, model, sha256 of text)
+Re-ingesting unchanged entities or re-asking the same question should not pay the provider again.
+
+- a small in memory LRU tier for the hot set
+- a persistent sqlite tier that survives restarts
+- both tiers are size bounded and evict the least recently used entries
+- only cache misses are sent to the provider
+"""
+
+import array
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import typing
+from funkyprompt.core.utils.env import (
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MEMORY_SIZE,
+    EMBEDDING_CACHE_DISK_SIZE,
+)
+
+
+def content_key(provider: str, model: str, text: str) -> str:
+    """the cache key for a text embedded by a provider/model"""
+    h = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{provider}:{model}:{h}"
+
+
+class EmbeddingCache:
+    """two tier embedding cache
+
+    Args:
+        path: the sqlite file for the persistent tier - None for memory only
+        memory_size: max entries in the LRU tier
+        disk_size: max entries in the sqlite tier
+    """
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE,
+        disk_size: int = EMBEDDING_CACHE_DISK_SIZE,
+    ):
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+        self._db = None
+        if path:
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS embeddings
+                (key TEXT PRIMARY KEY, vector BLOB NOT NULL, accessed_at REAL NOT NULL)"""
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_accessed_idx ON embeddings (accessed_at)"
+            )
+            self._db.commit()
+
+    def _remember(self, key: str, vector: typing.List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._counters["memory_evictions"] += 1
+
+    def get_many(self, keys: typing.List[str]) -> typing.Dict[str, typing.List[float]]:
+        """look up keys in memory then on disk - returns only the hits"""
+        found = {}
+        with self._lock:
+            missing = []
+            for k in keys:
+                if k in self._memory:
+                    self._memory.move_to_end(k)
+                    found[k] = self._memory[k]
+                else:
+                    missing.append(k)
+            self._counters["memory_hits"] += len(found)
+
+            if self._db and missing:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i : i + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                    for k, blob in rows:
+                        v = array.array("f", blob).tolist()
+                        found[k] = v
+                        self._remember(k, v)
+                    if rows:
+                        self._db.executemany(
+                            "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                            [(time.time(), k) for k, _ in rows],
+                        )
+                        self._counters["disk_hits"] += len(rows)
+                self._db.commit()
+            self._counters["misses"] += len(set(keys) - set(found))
+        return found
+
+    def put_many(self, items: typing.Dict[str, typing.List[float]]):
+        """add vectors to both tiers and evict old entries if the disk tier is over size"""
+        with self._lock:
+            for k, v in items.items():
+                self._remember(k, v)
+            if self._db and items:
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+                    [(k, array.array("f", v).tobytes(), now) for k, v in items.items()],
+                )
+                (count,) = self._db.execute(
+                    "SELECT count(*) FROM embeddings"
+                ).fetchone()
+                if count > self.disk_size:
+                    """evict a little more than needed so we do not do this on every put"""
+                    n = count - self.disk_size + max(1, self.disk_size // 10)
+                    self._db.execute(
+                        """DELETE FROM embeddings WHERE key IN
+                        (SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)""",
+                        (n,),
+                    )
+                    self._counters["disk_evictions"] += n
+                self._db.commit()
+
+    def embed(
+        self,
+        texts: typing.List[str],
+        embed_fn: typing.Callable[[typing.List[str]], typing.List[list]],
+        provider: str,
+        model: str,
+    ) -> typing.List[typing.List[float]]:
+        """return vectors for the texts calling `embed_fn` only for distinct cache misses"""
+        keys = [content_key(provider, model, t) for t in texts]
+        found = self.get_many(keys)
+        misses = {}
+        for k, t in zip(keys, texts):
+            if k not in found:
+                misses.setdefault(k, t)
+        if misses:
+            vectors = embed_fn(list(misses.values()))
+            new = dict(zip(misses.keys(), vectors))
+            self.put_many(new)
+            found.update(new)
+        return [found[k] for k in keys]
+
+    def stats(self) -> dict:
+        """hit/miss and eviction counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            hits = stats.get("memory_hits", 0) + stats.get("disk_hits", 0)
+            total = hits + stats.get("misses", 0)
+            stats["hit_rate"] = hits / total if total else 0.0
+            stats["memory_entries"] = len(self._memory)
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """the process wide embedding cache"""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EmbeddingCache()
+    return _CACHE
@@ -1,24 +1,192 @@
 import typing
+from funkyprompt.core.types import EMBEDDING_LENGTH_OPEN_AI
 
 DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+"""the max number of inputs the provider accepts in one request"""
+DEFAULT_EMBEDDING_MAX_BATCH_SIZE = 2048
+DEFAULT_EMBEDDING_PROVIDER = "openai"
+HASHING_EMBEDDING_DIMENSION = 384
 
 
-def embed_collection(c: typing.List[str], provider="open_ai"):
-    """get an embedding using the default embedding model"""
-    from openai import OpenAI
+class EmbeddingProvider:
+    """an embedding provider declares what the store needs to know up front - the vector size for the DDL
+    and the max batch size - and a batched `embed(texts)` function
 
-    r = OpenAI().embeddings.create(input=c, model=DEFAULT_EMBEDDING_MODEL)
+    Args:
+        name: the name used in the `embedding_provider` field attribute
+        model: the model name - used in cache keys
+        dimension: the vector size
+        max_batch_size: max texts per call to the underlying embed function
+        embed_fn: a callable mapping a list of texts to a list of vectors
+    """
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        dimension: int,
+        max_batch_size: int,
+        embed_fn: typing.Callable[[typing.List[str]], typing.List[typing.List[float]]],
+    ):
+        self.name = name
+        self.model = model
+        self.dimension = dimension
+        self.max_batch_size = max_batch_size
+        self._embed_fn = embed_fn
+
+    def embed(self, texts: typing.List[str]) -> typing.List[typing.List[float]]:
+        """embed any number of texts in chunks of the max batch size"""
+        vectors = []
+        for i in range(0, len(texts), self.max_batch_size):
+            vectors += self._embed_fn(texts[i : i + self.max_batch_size])
+        return vectors
+
+    def __repr__(self):
+        return (
+            f"EmbeddingProvider({self.name}, {self.model}, dimension={self.dimension})"
+        )
+
+
+_PROVIDERS: typing.Dict[str, EmbeddingProvider] = {}
+
+
+def _provider_key(name: str) -> str:
+    """field attributes use both `open_ai` and `openai` so we normalize"""
+    return (name or DEFAULT_EMBEDDING_PROVIDER).replace("_", "").lower()
+
+
+def register_embedding_provider(provider: EmbeddingProvider) -> EmbeddingProvider:
+    """add or replace a provider in the registry"""
+    _PROVIDERS[_provider_key(provider.name)] = provider
+    return provider
+
+
+def get_embedding_provider(name: str = None) -> EmbeddingProvider:
+    """the registered provider for a field `embedding_provider` attribute"""
+    provider = _PROVIDERS.get(_provider_key(name))
+    if provider is None:
+        raise ValueError(
+            f"There is no embedding provider registered for `{name}` - registered providers are {list(_PROVIDERS)}"
+        )
+    return provider
+
+
+def _openai_embed(c: typing.List[str]):
+    from funkyprompt.services.models.clients import get_client
+
+    r = get_client("openai").embeddings.create(input=c, model=DEFAULT_EMBEDDING_MODEL)
     return [e.embedding for e in r.data]
 
 
+def _hashing_embed(c: typing.List[str], dimension: int = HASHING_EMBEDDING_DIMENSION):
+    """an in-process CPU embedding using the hashing trick over words, word bigrams and character trigrams
+    its not semantic like a trained model but it is deterministic, free and needs no network which is good for offline ingest and tests
+    """
+    import hashlib
+    import math
+    import re
+
+    def features(text):
+        words = re.findall(r"\w+", str(text).lower())
+        yield from words
+        yield from (f"{a} {b}" for a, b in zip(words, words[1:]))
+        for w in words:
+            w = f"#{w}#"
+            yield from (w[i : i + 3] for i in range(len(w) - 2))
+
+    vectors = []
+    for text in c:
+        v = [0.0] * dimension
+        for f in features(text):
+            h = int.from_bytes(
+                hashlib.blake2b(f.encode(), digest_size=8).digest(), "little"
+            )
+            v[h % dimension] += 1.0 if (h >> 63) & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in v)) or 1.0
+        vectors.append([x / norm for x in v])
+    return vectors
+
+
+def _sentence_transformers_embed(model_name: str):
+    """sentence transformers models run in-process if the library is installed"""
+    _model = {}
+
+    def embed(c: typing.List[str]):
+        if "model" not in _model:
+            from sentence_transformers import SentenceTransformer
+
+            _model["model"] = SentenceTransformer(model_name)
+        return _model["model"].encode(list(c), normalize_embeddings=True).tolist()
+
+    return embed
+
+
+register_embedding_provider(
+    EmbeddingProvider(
+        name="openai",
+        model=DEFAULT_EMBEDDING_MODEL,
+        dimension=EMBEDDING_LENGTH_OPEN_AI,
+        max_batch_size=DEFAULT_EMBEDDING_MAX_BATCH_SIZE,
+        embed_fn=_openai_embed,
+    )
+)
+register_embedding_provider(
+    EmbeddingProvider(
+        name="hashing",
+        model=f"hashing-{HASHING_EMBEDDING_DIMENSION}",
+        dimension=HASHING_EMBEDDING_DIMENSION,
+        max_batch_size=DEFAULT_EMBEDDING_MAX_BATCH_SIZE,
+        embed_fn=_hashing_embed,
+    )
+)
+register_embedding_provider(
+    EmbeddingProvider(
+        name="sentence_transformers",
+        model="all-MiniLM-L6-v2",
+        dimension=384,
+        max_batch_size=256,
+        embed_fn=_sentence_transformers_embed("all-MiniLM-L6-v2"),
+    )
+)
+register_embedding_provider(
+    EmbeddingProvider(
+        name="clip",
+        model="clip-ViT-B-32",
+        dimension=512,
+        max_batch_size=256,
+        embed_fn=_sentence_transformers_embed("clip-ViT-B-32"),
+    )
+)
+
+
+def embed_collection(
+    c: typing.List[str], provider=DEFAULT_EMBEDDING_PROVIDER, use_cache: bool = True
+):
+    """get an embedding using the provider registered for the `embedding_provider` field attribute
+    embeddings are content addressed so only texts we have not seen before are sent to the provider
+    """
+    p = get_embedding_provider(provider)
+    if not use_cache:
+        return p.embed(c)
+
+    from funkyprompt.core.utils.embedding_cache import get_embedding_cache
+
+    return get_embedding_cache().embed(c, p.embed, provider=p.name, model=p.model)
+
+
 def embed_frame(
-    data: typing.List[dict], field_mapping: dict = None, id_column: str = None
+    data: typing.List[dict],
+    field_mapping: dict = None,
+    id_column: str = None,
+    providers: dict = None,
 ) -> typing.List[dict]:
     """given a data frame with texts that require embeddings do the thing and return a collection of records
     default conventions
     key->id
     field mappings for any column pair X and X_embedding
+    providers map fields to their embedding provider - the default provider is used otherwise
     """
+    providers = providers or {}
     embeddings = {}
 
     def frame_col(name):
@@ -37,7 +205,9 @@ def embed_frame(
     for field, mapping in field_mapping.items():
         text = frame_col(field)
         """use the embedding function"""
-        embeddings[mapping] = embed_collection(text)
+        embeddings[mapping] = embed_collection(
+            text, provider=providers.get(field, DEFAULT_EMBEDDING_PROVIDER)
+        )
 
     """reshape to records"""
     keys = embeddings.keys()
@@ -5,3 +5,25 @@ POSTGRES_PASSWORD = "password"
 POSTGRES_USER = "sirsh"
 POSTGRES_CONNECTION_STRING = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}:{POSTGRES_PORT}/{POSTGRES_DB}"
 AGE_GRAPH = "funkybrain"
+"""process wide connection pool settings shared by all postgres service instances"""
+POSTGRES_POOL_MAX_SIZE = 10
+POSTGRES_POOL_TIMEOUT_SECONDS = 30.0
+POSTGRES_POOL_HEALTH_CHECK_AFTER_SECONDS = 60.0
+"""when enabled upserts enqueue embedding work for background workers instead of embedding inline"""
+EMBEDDING_QUEUE_ENABLED = False
+"""embedding cache - set the path to None to keep the cache in memory only"""
+EMBEDDING_CACHE_PATH = "~/.funkyprompt/embedding_cache.sqlite"
+EMBEDDING_CACHE_MEMORY_SIZE = 10000
+EMBEDDING_CACHE_DISK_SIZE = 1000000
+"""an optional manifest of the modules that define entities so loading skips the package scan - None to always scan"""
+ENTITY_MANIFEST_PATH = None
+"""shared language model http clients - one per provider and process with keep-alive connections"""
+LLM_CLIENT_MAX_CONNECTIONS = 20
+LLM_CLIENT_MAX_KEEPALIVE_CONNECTIONS = 10
+LLM_CLIENT_KEEPALIVE_EXPIRY_SECONDS = 60.0
+LLM_CLIENT_TIMEOUT_SECONDS = 120.0
+"""opt-in language model response cache - exact matches only unless a similarity threshold e.g. 0.95 is set for the semantic tier"""
+RESPONSE_CACHE_TTL_SECONDS = 3600.0
+RESPONSE_CACHE_MAX_SIZE = 10000
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = None
+RESPONSE_CACHE_EMBEDDING_PROVIDER = "openai"
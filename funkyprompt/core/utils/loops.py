@@ -0,0 +1,73 @@
+"""
+Resources that belong to an event loop e.g. async connection pools and async http clients.
+They cannot be used from another loop so they are kept per loop and closed when their loop shuts down.
+
+- resources are keyed weakly on the loop object (not `id(loop)` which is reused once a loop is collected)
+- `asyncio.run` shuts down the async generators of a loop before closing it so a parked async generator
+  is used as the shutdown hook that closes the resources of the loop
+- loops that are closed without `shutdown_asyncgens` do not run the hook - use `aclose` before closing them
+
+```python
+pools = LoopResources(close=lambda pool: pool.close())
+pool = pools.get("key") or pools.set("key", make_pool())
+await pools.aclose()
+```
+"""
+
+import asyncio
+import typing
+import weakref
+
+
+class LoopResources:
+    """resources per event loop that are closed when the loop shuts down
+
+    Args:
+        close: an async callable that closes one resource
+    """
+
+    def __init__(self, close: typing.Callable[[typing.Any], typing.Awaitable]):
+        self._close = close
+        self._resources = weakref.WeakKeyDictionary()
+        """the parked shutdown hook per loop - the loop only holds its async generators weakly"""
+        self._hooks = weakref.WeakKeyDictionary()
+
+    def get(self, key: typing.Hashable) -> typing.Any:
+        """the resource of the running loop or None"""
+        return self._resources.get(asyncio.get_running_loop(), {}).get(key)
+
+    def set(self, key: typing.Hashable, resource: typing.Any) -> typing.Any:
+        """keep a resource for the running loop"""
+        loop = asyncio.get_running_loop()
+        self._resources.setdefault(loop, {})[key] = resource
+        if loop not in self._hooks:
+            hook = self._on_shutdown()
+            """advance to the first yield - this registers the generator with the running loop"""
+            try:
+                hook.__anext__().send(None)
+            except StopIteration:
+                pass
+            self._hooks[loop] = hook
+        return resource
+
+    def resources(self) -> typing.Dict[typing.Hashable, typing.Any]:
+        """the resources of the running loop"""
+        return dict(self._resources.get(asyncio.get_running_loop(), {}))
+
+    async def _on_shutdown(self):
+        try:
+            yield
+        finally:
+            self._hooks.pop(asyncio.get_running_loop(), None)
+            await self.aclose()
+
+    async def aclose(self):
+        """close and drop the resources of the running loop - the shutdown hook stays parked for new ones"""
+        resources = self._resources.pop(asyncio.get_running_loop(), {})
+        for resource in resources.values():
+            try:
+                await self._close(resource)
+            except Exception as ex:
+                from funkyprompt.core.utils import logger
+
+                logger.warning(f"could not close {resource} - {ex}")
@@ -0,0 +1,49 @@
+"""
+Token counting for context budgets.
+`tiktoken` is used when it is installed and otherwise a character based estimate (about 4 characters per token)
+- a different counter e.g. for another provider's tokenizer can be set with `set_token_counter`
+"""
+
+import functools
+import typing
+
+"""the per message overhead of the chat format (role and separators)"""
+MESSAGE_TOKEN_OVERHEAD = 4
+CHARACTERS_PER_TOKEN = 4
+
+_COUNTER: typing.Optional[typing.Callable[[str, str], int]] = None
+
+
+def estimate_tokens(text: str, model: str = None) -> int:
+    """a tokenizer free estimate"""
+    return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """the number of tokens in the text for the model"""
+    if not text:
+        return 0
+    if _COUNTER is not None:
+        return _COUNTER(text, model)
+    encoding = _encoding(model or "")
+    if encoding is None:
+        return estimate_tokens(text, model)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def set_token_counter(counter: typing.Optional[typing.Callable[[str, str], int]]):
+    """use a `(text, model) -> int` counter - None restores the default"""
+    global _COUNTER
+    _COUNTER = counter
@@ -23,25 +23,28 @@ class GenericEntityTypes(Enum):
 from funkyprompt.entities.nodes import *
 
 
-from funkyprompt.core.types.inspection import get_classes
+import typing
 from funkyprompt.core import AbstractEntity
-from funkyprompt.core import load_entities as load_core_entities
+from funkyprompt.core.registry import entity_registry
 
 
 def load_entities(include_core: bool = True) -> typing.List[AbstractEntity]:
     """
     Load entities including the core ones optionally
     if funkyprompt is used as a library we can register entities from
-    - registering/importing a package of entities
+    - registering/importing a package of entities (see `entity_registry.load_package`)
     - dynamic entities in a database
+    packages are imported once and entities register themselves when they are defined
     """
-    entities = get_classes(AbstractEntity, package="funkyprompt.entities")
-    """
-    add core entities
-    """
+    entity_registry.load_package("funkyprompt.entities")
     if include_core:
-        entities += load_core_entities()
-    return entities
+        entity_registry.load_package("funkyprompt.core")
+        return entity_registry.entities()
+    return [
+        e
+        for e in entity_registry.entities()
+        if not e.__module__.startswith("funkyprompt.core.")
+    ]
 
 
 def resolve(
@@ -50,7 +53,11 @@ def resolve(
     """resolve entity given the name and namespace
     the default is public for generic type entities that we store in funkyprompt
     """
-    match = f"{entity_model_namespace}.{entity_model_name}"
-    for e in load_entities():
-        if e.get_model_fullname() == match:
-            return e
+    load_entities()
+    return entity_registry.get(f"{entity_model_namespace}.{entity_model_name}")
+
+
+def resolve_label(label: str) -> AbstractEntity:
+    """resolve the entity model for a graph node label e.g. `public_project`"""
+    model_namespace, model_name = label.split("_", 1)
+    return resolve(model_name, model_namespace)
@@ -10,9 +10,9 @@ class Project(AbstractEntity):
         name: str = "project"
         namespace: str = "public"
 
-    name: str = Field(description="The unique name of the project")
+    name: str = Field(description="The unique name of the project", searchable=True)
     description: str = OpenAIEmbeddingField(
-        description="The detailed description of the project"
+        description="The detailed description of the project", searchable=True
     )
     target_completion: typing.Optional[datetime.datetime] = Field(
         default=None, description="An optional target completion date for the project"
@@ -1,8 +1,31 @@
-from funkyprompt.services.models import language_model_client_from_context
-from funkyprompt.core import AbstractEntity
-from .data.postgres import PostgresService
+import typing
 
+if typing.TYPE_CHECKING:
+    from funkyprompt.core import AbstractEntity
 
-def entity_store(model: AbstractEntity):
+
+def entity_store(model: "AbstractEntity"):
     """returns the configured store for the entity"""
+    from .data.postgres import PostgresService
+
     return PostgresService(model)
+
+
+def async_entity_store(model: "AbstractEntity"):
+    """returns the configured asyncio store for the entity"""
+    from .data.postgres_async import AsyncPostgresService
+
+    return AsyncPostgresService(model)
+
+
+def __getattr__(name):
+    """the language model and database clients are loaded on first use"""
+    if name == "language_model_client_from_context":
+        from funkyprompt.services.models import language_model_client_from_context
+
+        return language_model_client_from_context
+    if name == "PostgresService":
+        from .data.postgres import PostgresService
+
+        return PostgresService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
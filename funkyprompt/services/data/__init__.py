@@ -46,3 +46,44 @@ class DataServiceBase(ABC):
         the query in the format required for the store.
         this could be a text search in a vector store, and sql query, list of keys etc.
         """
+
+
+class AsyncDataServiceBase(ABC):
+    """
+    the asyncio variant of the `DataServiceBase` interface
+    the methods are coroutines so that many store calls can run concurrently on one event loop
+    """
+
+    @abstractmethod
+    async def create_model(self, model: AbstractModel):
+        """
+        see `DataServiceBase.create_model`
+        """
+        pass
+
+    @abstractmethod
+    async def update_records(self, records: typing.List[AbstractModel], **kwargs):
+        """
+        see `DataServiceBase.update_records`
+        """
+        pass
+
+    @abstractmethod
+    async def select_one(self, id: str) -> AbstractModel:
+        """
+        see `DataServiceBase.select_one`
+        """
+        pass
+
+    @abstractmethod
+    async def ask(self, question: str, **kwargs) -> typing.List[dict]:
+        """
+        see `DataServiceBase.ask`
+        """
+        pass
+
+    @abstractmethod
+    async def query(self, query: str, **kwargs):
+        """
+        see `DataServiceBase.query`
+        """
@@ -0,0 +1,332 @@
+"""
+A background embedding pipeline that is decoupled from upserts.
+Upserted ids are enqueued in a postgres table and workers claim them with `FOR UPDATE SKIP LOCKED`
+so that any number of workers (threads or processes) can drain the queue without double work.
+
+- workers read the embedding source columns for claimed ids, embed them in batches up to the provider max batch size
+  and write the vectors back with the partial embedding update
+- claims are leases so work from a crashed worker becomes visible again after `lease_seconds`
+- failures are retried with exponential backoff until `max_attempts`
+- `depth()` and `EmbeddingWorker.stats()` provide queue depth and throughput metrics
+
+```python
+from funkyprompt.entities import Project
+from funkyprompt.services import entity_store
+from funkyprompt.services.data.embedding_queue import EmbeddingQueue, EmbeddingWorkerPool
+
+entity_store(Project).execute(EmbeddingQueue.create_script()) #run once
+pool = EmbeddingWorkerPool([Project], workers=2).start()
+...
+pool.stop()
+```
+
+The embedder is any callable `texts -> vectors` so a fake embedder can be used in tests
+"""
+
+import threading
+import typing
+from funkyprompt.core import AbstractModel
+from funkyprompt.core.utils import logger
+
+EMBEDDING_QUEUE_TABLE = "core.embedding_queue"
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 2.0
+DEFAULT_MAX_BACKOFF_SECONDS = 600.0
+
+
+class EmbeddingQueue:
+    """the queue of record ids that need embeddings for a model
+
+    Args:
+        model: the model whose embedding fields are processed
+        store: the store used to run statements - defaults to the postgres service for the model
+    """
+
+    def __init__(self, model: AbstractModel, store=None):
+        from funkyprompt.services.data.postgres import PostgresService
+
+        self.model = model
+        self.model_name = model.get_model_fullname()
+        self.store = store or PostgresService(model)
+
+    @classmethod
+    def create_script(cls) -> str:
+        """the shared queue table - one row per model and record"""
+        schema = EMBEDDING_QUEUE_TABLE.split(".")[0]
+        return f"""
+        CREATE SCHEMA IF NOT EXISTS {schema};
+        CREATE TABLE IF NOT EXISTS {EMBEDDING_QUEUE_TABLE} (
+            model_name VARCHAR NOT NULL,
+            record_id VARCHAR NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            enqueued_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+            available_at TIMESTAMP NOT NULL DEFAULT clock_timestamp(),
+            locked_until TIMESTAMP,
+            last_error TEXT,
+            PRIMARY KEY (model_name, record_id)
+        );
+        CREATE INDEX IF NOT EXISTS embedding_queue_available_idx
+        ON {EMBEDDING_QUEUE_TABLE} (model_name, available_at);
+        """
+
+    def enqueue(self, ids: typing.List[str]):
+        """add or reset record ids on the queue - re-enqueued records are picked up again even if in flight"""
+        if not ids:
+            return
+        query = f"""INSERT INTO {EMBEDDING_QUEUE_TABLE} (model_name, record_id)
+        VALUES %s
+        ON CONFLICT (model_name, record_id) DO UPDATE
+        SET attempts = 0, last_error = NULL, locked_until = NULL,
+            enqueued_at = clock_timestamp(), available_at = clock_timestamp()"""
+        return self.store.execute_upsert(
+            query, data=[(self.model_name, str(i)) for i in ids]
+        )
+
+    def claim(
+        self,
+        batch_size: int,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> typing.List[dict]:
+        """lease up to `batch_size` available items - concurrent claimers skip each others rows"""
+        query = f"""UPDATE {EMBEDDING_QUEUE_TABLE} q
+        SET locked_until = clock_timestamp() + make_interval(secs => %s)
+        WHERE (q.model_name, q.record_id) IN (
+            SELECT model_name, record_id FROM {EMBEDDING_QUEUE_TABLE}
+            WHERE model_name = %s
+              AND available_at <= clock_timestamp()
+              AND (locked_until IS NULL OR locked_until < clock_timestamp())
+              AND attempts < %s
+            ORDER BY available_at
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING q.record_id, q.attempts, q.enqueued_at"""
+        return (
+            self.store.execute(
+                query, (lease_seconds, self.model_name, max_attempts, batch_size)
+            )
+            or []
+        )
+
+    def complete(self, items: typing.List[dict]):
+        """remove processed items unless they were enqueued again while we worked on them
+        each item is matched on its own claimed `enqueued_at` so a re-enqueued item is kept
+        """
+        if not items:
+            return
+        query = f"""DELETE FROM {EMBEDDING_QUEUE_TABLE}
+        WHERE model_name = %s AND (record_id, enqueued_at) IN %s"""
+        return self.store.execute(
+            query,
+            (
+                self.model_name,
+                tuple((i["record_id"], i["enqueued_at"]) for i in items),
+            ),
+        )
+
+    def fail(
+        self,
+        items: typing.List[dict],
+        error: Exception,
+        backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+        max_backoff_seconds: float = DEFAULT_MAX_BACKOFF_SECONDS,
+    ):
+        """release the lease and make the items available again after an exponential backoff"""
+        if not items:
+            return
+        attempts = max(i["attempts"] for i in items)
+        delay = min(backoff_seconds * (2**attempts), max_backoff_seconds)
+        query = f"""UPDATE {EMBEDDING_QUEUE_TABLE}
+        SET attempts = attempts + 1, locked_until = NULL, last_error = %s,
+            available_at = clock_timestamp() + make_interval(secs => %s)
+        WHERE model_name = %s AND record_id IN %s"""
+        return self.store.execute(
+            query,
+            (
+                str(error),
+                delay,
+                self.model_name,
+                tuple(i["record_id"] for i in items),
+            ),
+        )
+
+    def depth(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> dict:
+        """queue depth metrics for the model"""
+        query = f"""SELECT
+            count(*) FILTER (WHERE attempts < %s AND (locked_until IS NULL OR locked_until < clock_timestamp())) AS pending,
+            count(*) FILTER (WHERE locked_until >= clock_timestamp()) AS in_flight,
+            count(*) FILTER (WHERE attempts >= %s) AS failed
+        FROM {EMBEDDING_QUEUE_TABLE} WHERE model_name = %s"""
+        data = self.store.execute(query, (max_attempts, max_attempts, self.model_name))
+        return dict(data[0]) if data else {}
+
+
+class EmbeddingWorker:
+    """claims batches from the queue, embeds the source text and writes back vectors
+
+    Args:
+        model: the model whose embedding fields are processed
+        embedder: a callable mapping a list of texts to a list of vectors - defaults to each field's registered provider
+        max_batch_size: the max number of texts sent to the embedder in one call - defaults to the smallest provider batch size
+        store: the store to use - defaults to the postgres service for the model
+    """
+
+    def __init__(
+        self,
+        model: AbstractModel,
+        embedder: typing.Callable[[typing.List[str]], typing.List[list]] = None,
+        max_batch_size: int = None,
+        store=None,
+        lease_seconds: int = DEFAULT_LEASE_SECONDS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        from funkyprompt.core.utils.embeddings import (
+            get_embedding_provider,
+            DEFAULT_EMBEDDING_MAX_BATCH_SIZE,
+        )
+
+        self.model = model
+        self.queue = EmbeddingQueue(model, store=store)
+        self.store = self.queue.store
+        self.embedder = embedder
+        self.providers = self.model.get_embedding_providers()
+        self.max_batch_size = max_batch_size or min(
+            [get_embedding_provider(p).max_batch_size for p in self.providers.values()]
+            or [DEFAULT_EMBEDDING_MAX_BATCH_SIZE]
+        )
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._stats = {"batches": 0, "records": 0, "texts": 0, "failures": 0}
+
+    def _embed(
+        self, texts: typing.List[str], provider: str = None
+    ) -> typing.List[list]:
+        """embed non empty texts in provider sized chunks - empty texts get no vector"""
+        from funkyprompt.core.utils.embeddings import embed_collection
+
+        embedder = self.embedder or (lambda c: embed_collection(c, provider=provider))
+        index = [i for i, t in enumerate(texts) if t]
+        vectors = [None] * len(texts)
+        for start in range(0, len(index), self.max_batch_size):
+            chunk = index[start : start + self.max_batch_size]
+            for i, v in zip(chunk, embedder([str(texts[i]) for i in chunk])):
+                vectors[i] = v
+        self._stats["texts"] += len(index)
+        return vectors
+
+    def process(self, items: typing.List[dict]):
+        """embed and write back the claimed items"""
+        helper = self.model.sql()
+        field_mapping = self.model.get_embedding_fields()
+        ids = tuple(i["record_id"] for i in items)
+        query = f"""SELECT {", ".join([helper.id_field] + list(field_mapping))}
+        FROM {helper.table_name} WHERE {helper.id_field} IN %s"""
+        rows = self.store.execute(query, (ids,)) or []
+
+        records = [{helper.id_field: r[helper.id_field]} for r in rows]
+        for field, embedding_field in field_mapping.items():
+            vectors = self._embed(
+                [r[field] for r in rows], provider=self.providers.get(field)
+            )
+            for record, v in zip(records, vectors):
+                record[embedding_field] = v
+        """the content hashes are written with the vectors so unchanged rows are skipped next time"""
+        for record, r in zip(records, rows):
+            record.update(helper.embedding_hashes(r))
+
+        if records:
+            self.store.execute_upsert(
+                query=helper.embedding_update_query(),
+                data=[helper.embedding_update_tuple(r) for r in records],
+            )
+        return records
+
+    def run_once(self) -> int:
+        """claim, process and acknowledge one batch - returns the number of claimed items"""
+        items = self.queue.claim(
+            self.max_batch_size,
+            lease_seconds=self.lease_seconds,
+            max_attempts=self.max_attempts,
+        )
+        if not items:
+            return 0
+        try:
+            self.process(items)
+            self.queue.complete(items)
+            self._stats["batches"] += 1
+            self._stats["records"] += len(items)
+        except Exception as ex:
+            logger.warning(f"embedding batch failed for {self.queue.model_name} - {ex}")
+            self._stats["failures"] += 1
+            self.queue.fail(items, ex)
+        return len(items)
+
+    def stats(self) -> dict:
+        """worker throughput metrics"""
+        return dict(self._stats)
+
+
+class EmbeddingWorkerPool:
+    """a pool of worker threads draining the queue for one or more models
+
+    Args:
+        models: the models to process
+        workers: the number of threads per model
+        poll_interval: seconds to sleep when the queue is empty
+        kwargs: passed to each `EmbeddingWorker` e.g. the embedder
+    """
+
+    def __init__(
+        self,
+        models: typing.List[AbstractModel],
+        workers: int = 1,
+        poll_interval: float = 1.0,
+        **kwargs,
+    ):
+        self.poll_interval = poll_interval
+        self.workers = [
+            EmbeddingWorker(m, **kwargs) for m in models for _ in range(workers)
+        ]
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _loop(self, worker: EmbeddingWorker):
+        while not self._stop.is_set():
+            try:
+                claimed = worker.run_once()
+            except Exception as ex:
+                logger.warning(f"embedding worker error - {ex}")
+                claimed = 0
+            if not claimed:
+                self._stop.wait(self.poll_interval)
+
+    def start(self) -> "EmbeddingWorkerPool":
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._loop, args=(w,), daemon=True)
+            for w in self.workers
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self) -> dict:
+        """aggregate worker stats and the queue depth per model"""
+        stats = {}
+        for w in self.workers:
+            s = stats.setdefault(
+                w.queue.model_name,
+                {"batches": 0, "records": 0, "texts": 0, "failures": 0},
+            )
+            for k, v in w.stats().items():
+                s[k] += v
+        for w in {w.queue.model_name: w for w in self.workers}.values():
+            stats[w.queue.model_name]["depth"] = w.queue.depth(w.max_attempts)
+        return stats
@@ -0,0 +1,239 @@
+"""
+A process wide, size bounded connection pool for the postgres service.
+Creating a connection per service instance means a TCP+auth handshake per agent turn so instead
+all `PostgresService` instances check connections in and out of one shared pool.
+
+- connections are created lazily up to `max_size` and reused
+- a checkout waits up to `timeout` seconds for a free connection and then raises `PoolTimeout`
+- connections that have been idle for a while are health checked before they are handed out
+- `stats()` reports what is in use, idle and how long callers waited
+- the names of server side prepared statements are tracked per connection and forgotten when it is closed
+"""
+
+import collections
+import contextlib
+import os
+import threading
+import time
+import typing
+from funkyprompt.core.utils.env import (
+    POSTGRES_CONNECTION_STRING,
+    POSTGRES_POOL_MAX_SIZE,
+    POSTGRES_POOL_TIMEOUT_SECONDS,
+    POSTGRES_POOL_HEALTH_CHECK_AFTER_SECONDS,
+)
+from funkyprompt.core.utils import logger
+
+
+class PoolTimeout(Exception):
+    """raised when no connection could be checked out of the pool in time"""
+
+    pass
+
+
+class ConnectionPool:
+    """a thread safe pool of psycopg2 connections
+
+    Examples:
+
+    ```python
+    pool = ConnectionPool(POSTGRES_CONNECTION_STRING, max_size=5)
+    with pool.connection() as conn:
+        conn.cursor().execute("SELECT 1")
+    pool.stats()
+    ```
+    """
+
+    def __init__(
+        self,
+        connection_string: str = None,
+        max_size: int = POSTGRES_POOL_MAX_SIZE,
+        timeout: float = POSTGRES_POOL_TIMEOUT_SECONDS,
+        health_check_after: float = POSTGRES_POOL_HEALTH_CHECK_AFTER_SECONDS,
+        connect: typing.Callable = None,
+    ):
+        """
+        Args:
+            connection_string: the postgres connection string
+            max_size: the max number of open connections (in use + idle)
+            timeout: default seconds to wait for a connection on checkout
+            health_check_after: idle connections older than this are pinged before reuse
+            connect: an optional connection factory - defaults to psycopg2.connect
+        """
+        self.connection_string = connection_string or POSTGRES_CONNECTION_STRING
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._connect = connect or self._psycopg2_connect
+        """idle connections with the time they were returned to the pool"""
+        self._idle = collections.deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        self._counters = collections.Counter()
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        """prepared statement names keyed by connection id"""
+        self._prepared: typing.Dict[int, typing.Set[str]] = {}
+        self._closed = False
+
+    def _psycopg2_connect(self):
+        import psycopg2
+
+        return psycopg2.connect(self.connection_string)
+
+    def _is_healthy(self, conn, idle_since: float) -> bool:
+        """closed connections are always discarded and stale ones are pinged"""
+        if getattr(conn, "closed", False):
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        try:
+            c = conn.cursor()
+            c.execute("SELECT 1")
+            c.close()
+            conn.rollback()
+            return True
+        except Exception as ex:
+            logger.warning(f"discarding unhealthy pooled connection - {ex}")
+            self._counters["health_check_failures"] += 1
+            return False
+
+    def _discard(self, conn):
+        self._prepared.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self, timeout: float = None):
+        """check out a connection - waits for a free slot until the timeout"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn, idle_since = None, None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"could not get a connection within {timeout} seconds - {self.stats()}"
+                        )
+                    self._counters["waits"] += 1
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    """reserve a slot and connect outside the lock"""
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                    self._counters["connects"] += 1
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._counters["checkouts"] += 1
+                self._wait_seconds += waited
+                self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """return a connection to the pool - broken or closed connections and any returned after `close` are dropped"""
+        if not discard and not getattr(conn, "closed", False):
+            try:
+                """never hand out a connection mid transaction"""
+                conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            discard = discard or self._closed
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._discard(conn)
+
+    def prepared_statements(self, conn) -> typing.Set[str]:
+        """the names of the statements prepared on a pooled connection - callers add names after a PREPARE"""
+        return self._prepared.setdefault(id(conn), set())
+
+    @contextlib.contextmanager
+    def connection(self, timeout: float = None):
+        """context managed checkout - the connection is returned even on error"""
+        conn = self.getconn(timeout=timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self) -> dict:
+        """pool statistics e.g. for telemetry"""
+        with self._cond:
+            checkouts = self._counters["checkouts"]
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._size - len(self._idle),
+                "idle": len(self._idle),
+                "checkouts": checkouts,
+                "connects": self._counters["connects"],
+                "waits": self._counters["waits"],
+                "timeouts": self._counters["timeouts"],
+                "health_check_failures": self._counters["health_check_failures"],
+                "prepared_statements": sum(len(p) for p in self._prepared.values()),
+                "wait_seconds_total": self._wait_seconds,
+                "wait_seconds_avg": (
+                    self._wait_seconds / checkouts if checkouts else 0.0
+                ),
+                "wait_seconds_max": self._max_wait_seconds,
+            }
+
+    def close(self):
+        """close all idle connections - checked out connections are closed when returned"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+_POOLS: typing.Dict[tuple, ConnectionPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(connection_string: str = None, **kwargs) -> ConnectionPool:
+    """the process wide pool for a connection string
+    pools are keyed on the process id too so that forked workers do not share sockets
+    """
+    connection_string = connection_string or POSTGRES_CONNECTION_STRING
+    key = (connection_string, os.getpid())
+    pool = _POOLS.get(key)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(key)
+            if pool is None:
+                pool = _POOLS[key] = ConnectionPool(connection_string, **kwargs)
+    return pool
@@ -8,32 +8,78 @@ In funkyprompt the game is to play nice with AbstractModels so that the postgres
 [Text Search Control](https://www.postgresql.org/docs/current/textsearch-controls.html)
 """
 
+import functools
+import hashlib
+import re
 import typing
 import psycopg2
+import psycopg2.extras
 from funkyprompt.core import AbstractModel, AbstractEntity
 from funkyprompt.services.data import DataServiceBase
-from funkyprompt.core.utils.env import POSTGRES_CONNECTION_STRING, AGE_GRAPH
+from funkyprompt.services.data.pool import ConnectionPool, get_pool
+from funkyprompt.services.models.response_cache import invalidate_responses
+from funkyprompt.core.functions.cache import invalidate_function_results
+from funkyprompt.core.utils.env import (
+    POSTGRES_CONNECTION_STRING,
+    AGE_GRAPH,
+    EMBEDDING_QUEUE_ENABLED,
+    POSTGRES_POOL_MAX_SIZE,
+)
 from funkyprompt.core.utils import logger
-from funkyprompt.core.types.sql import VectorSearchOperator
+from funkyprompt.core.types.sql import (
+    VectorSearchOperator,
+    split_local_settings,
+    to_vector_param,
+)
 import json
 from funkyprompt.entities import resolve as resolve_entity
 
 
-def cypher_with_age_wrapper(q: str):
-    """wrapper a cypher query"""
+def cypher_with_age_wrapper(q: str, parameters: bool = False):
+    """wrapper a cypher query
+    with `parameters` the cypher `$name` parameters are bound from one agtype map parameter `%s`
+    which AGE only allows in a prepared statement
+    the search path is transaction local so that it does not leak to later users of the pooled connection
+    """
+    params = ", %s" if parameters else ""
     return (
         f""" LOAD 'age';
-        SET search_path = ag_catalog, "$user", public;
+        SET LOCAL search_path = ag_catalog, "$user", public;
 
         SELECT * 
         FROM cypher('{AGE_GRAPH}', $$
             {q}
-        $$) as (n agtype);"""
+        $${params}) as (n agtype);"""
         if q
         else None
     )
 
 
+@functools.lru_cache(maxsize=1024)
+def prepared_statement(query: str) -> typing.Tuple[str, typing.List[str], str, int]:
+    """the prepared statement for a query with `%s` placeholders - the query text is the shape
+    so each (model, query shape) is parsed and planned once per connection and only parameters are sent after that
+
+    Returns:
+        the statement name, the leading settings to run first, the `$n` statement body and the number of parameters
+    """
+    settings, body = split_local_settings(query)
+    counter = iter(range(1, body.count("%s") + 1))
+
+    def placeholder(m):
+        return "%" if m.group(1) == "%" else f"${next(counter)}"
+
+    n = body.count("%s")
+    body = re.sub(r"%(s|%)", placeholder, body)
+    name = "fp_" + hashlib.sha1(query.encode("utf-8")).hexdigest()[:20]
+    return name, settings, body, n
+
+
+def _fetch_dicts(c) -> typing.List[dict]:
+    column_names = [desc[0] for desc in c.description or []]
+    return [dict(zip(column_names, r)) for r in c.fetchall()]
+
+
 def _parse_vertex_result(x):
     x = json.loads(x["n"].split("::")[0])
     model_namespace, model_name = x["label"].split("_", 1)
@@ -78,9 +124,15 @@ class PostgresService(DataServiceBase):
     """
 
     def __init__(self, model: AbstractModel):
-        self.conn = psycopg2.connect(POSTGRES_CONNECTION_STRING)
+        """connections are checked out of the process wide pool per statement so instances are cheap"""
+        self.pool: ConnectionPool = get_pool(POSTGRES_CONNECTION_STRING)
         self.model: AbstractModel = model
 
+    @classmethod
+    def pool_stats(cls) -> dict:
+        """in use, idle and wait time stats for the shared connection pool"""
+        return get_pool(POSTGRES_CONNECTION_STRING).stats()
+
     def _alter_model(cls):
         """try to alter the table by adding new columns only"""
         raise NotImplementedError("alter table not yet implemented")
@@ -123,30 +175,100 @@ class PostgresService(DataServiceBase):
         """
         if not query:
             return
-        try:
-            c = cls.conn.cursor()
-            if as_upsert:
-                psycopg2.extras.execute_values(
-                    c, query, data, template=None, page_size=page_size
-                )
-            else:
-                c.execute(query, data)
-
-            if c.description:
-                result = c.fetchall()
-                """if we have and updated and read we can commit and send,
-                otherwise we commit outside this block"""
-                cls.conn.commit()
-                column_names = [desc[0] for desc in c.description or []]
-                result = [dict(zip(column_names, r)) for r in result]
-                return result
-            """case of upsert no-query transactions"""
-            cls.conn.commit()
-        except Exception as pex:
-            cls.conn.rollback()
-            raise
-        finally:
-            cls.conn.close
+        with cls.pool.connection() as conn:
+            try:
+                c = conn.cursor()
+                if as_upsert:
+                    psycopg2.extras.execute_values(
+                        c, query, data, template=None, page_size=page_size
+                    )
+                else:
+                    c.execute(query, data)
+
+                if c.description:
+                    result = _fetch_dicts(c)
+                    """if we have and updated and read we can commit and send,
+                    otherwise we commit outside this block"""
+                    conn.commit()
+                    return result
+                """case of upsert no-query transactions"""
+                conn.commit()
+            except Exception as pex:
+                conn.rollback()
+                raise
+
+    def execute_prepared(cls, query: str, data: tuple = ()):
+        """run a hot query as a server side prepared statement with bound parameters.
+        the statement is prepared the first time it is used on a pooled connection and then only executed
+        which skips the parse and plan and keeps large parameters e.g. vectors out of the statement text.
+        leading `SET LOCAL` settings run first in the same transaction
+        """
+        if not query:
+            return
+        name, settings, body, n = prepared_statement(query)
+        with cls.pool.connection() as conn:
+            prepared = cls.pool.prepared_statements(conn)
+            for attempt in range(2):
+                try:
+                    c = conn.cursor()
+                    for setting in settings:
+                        c.execute(setting)
+                    if name not in prepared:
+                        c.execute(f"PREPARE {name} AS {body}")
+                        prepared.add(name)
+                    c.execute(
+                        f"EXECUTE {name}" + (f"({', '.join(['%s'] * n)})" if n else ""),
+                        tuple(data or ()),
+                    )
+                    result = _fetch_dicts(c) if c.description else None
+                    conn.commit()
+                    return result
+                except psycopg2.errors.InvalidSqlStatementName:
+                    """the statement is no longer on the session e.g. after a DISCARD ALL so we prepare it again"""
+                    conn.rollback()
+                    prepared.discard(name)
+                    if attempt:
+                        raise
+                except psycopg2.errors.DuplicatePreparedStatement:
+                    """the statement is on the session but we did not track it so we replace it"""
+                    conn.rollback()
+                    conn.cursor().execute(f"DEALLOCATE {name}")
+                    conn.commit()
+                    if attempt:
+                        raise
+                except Exception:
+                    """prepared statements are not transactional so other errors e.g. bad data leave them in place"""
+                    conn.rollback()
+                    raise
+
+    def execute_autocommit(cls, query: str):
+        """some maintenance statements e.g. concurrent index builds cannot run inside a transaction"""
+        if not query:
+            return
+        with cls.pool.connection() as conn:
+            conn.autocommit = True
+            try:
+                conn.cursor().execute(query)
+            finally:
+                conn.autocommit = False
+
+    def build_vector_indexes(self, rebuild: bool = False, concurrently: bool = True):
+        """build (or drop and rebuild e.g. after changing options) the ANN indexes declared on the model
+        concurrent builds do not block writes to the table
+
+        Args:
+            rebuild (bool, optional): drop existing indexes first. Defaults to False.
+            concurrently (bool, optional): build without locking writes. Defaults to True.
+        """
+        helper = self.model.sql()
+        scripts = []
+        if rebuild:
+            scripts += helper.drop_vector_index_scripts(concurrently=concurrently)
+        scripts += helper.create_vector_index_scripts(concurrently=concurrently)
+        for script in scripts:
+            logger.info(script)
+            self.execute_autocommit(script)
+        return scripts
 
     def execute_upsert(cls, query: str, data: tuple = None, page_size: int = 100):
         """run an upsert sql query"""
@@ -160,10 +282,18 @@ class PostgresService(DataServiceBase):
         """
         return cls(model)._create_model()
 
-    def update_records(self, records: typing.List[AbstractModel]):
+    def update_records(
+        self,
+        records: typing.List[AbstractModel],
+        bulk: bool = False,
+        batch_size: int = 10000,
+    ):
         """records are updated using typed object relational mapping.
         the embedding update is queued
+        for large loads use `bulk=True` to stream the records with COPY - see `bulk_update_records`
         """
+        if bulk:
+            return self.bulk_update_records(records, batch_size=batch_size)
         if records and not isinstance(records, list):
             records = [records]
         helper = self.model.sql()
@@ -179,19 +309,16 @@ class PostgresService(DataServiceBase):
                 ),
             )
 
-            """for now do inline but this could be an async thing to not block"""
+            """inline unless the background embedding queue is enabled"""
             self.queue_update_embeddings(result)
 
             """add the node for certain types that have unique names and are entity like
                we could in future do this as a transaction in the upserts or as a trigger 
             """
             if issubclass(self.model, AbstractEntity):
-
-                query = cypher_with_age_wrapper(
-                    self.model.cypher().upsert_node_query(records)
-                )
-                logger.debug(query)
-                _ = self.execute(query)
+                self.upsert_graph_nodes(records)
+                invalidate_responses(self.model.get_model_fullname())
+                invalidate_function_results()
                 # self.queue_add_nodes(records) # or do we find a way to insert them in the insert block which would be nice
                 # it seems like just adding the node as a reference with all the data is the way to do since the use case for entity lookup is one item
                 # and therefore we want a fast insert and on demand we can do a two-pass resolve entities and query them
@@ -199,35 +326,180 @@ class PostgresService(DataServiceBase):
 
             return result
 
+    def bulk_update_records(
+        self,
+        records: typing.Iterable[AbstractModel],
+        batch_size: int = 10000,
+        embed: bool = True,
+    ) -> dict:
+        """a bulk load mode for large ingests - records are streamed in batches with `COPY ... FROM STDIN`
+        into a session staging table and each batch is merged into the table with one `INSERT ... ON CONFLICT`.
+        Only the key and embedding source columns are read back (if embedding) rather than `RETURNING *`
+
+        Args:
+            records (typing.Iterable[AbstractModel]): any iterable e.g. a generator of records
+            batch_size (int, optional): rows per COPY/merge transaction. Defaults to 10000.
+            embed (bool, optional): queue embedding updates for each merged batch. Defaults to True.
+
+        Returns: load stats including rows per second
+        """
+        import time
+        import itertools
+
+        helper = self.model.sql()
+        embedding_sources = list(self.model.get_embedding_fields().keys())
+        returning = ", ".join(
+            [helper.id_field]
+            + (embedding_sources + helper.embedding_hash_fields if embed else [])
+        )
+        merge_query = helper.bulk_merge_query(returning=returning)
+        is_entity = issubclass(self.model, AbstractEntity)
+
+        records = iter(records)
+        rows, batches, started = 0, 0, time.monotonic()
+        try:
+            while True:
+                batch = list(itertools.islice(records, batch_size))
+                if not batch:
+                    break
+                result = self._bulk_merge_batch(batch, merge_query)
+
+                """the follow up writes check out their own connections so the merge connection is returned first"""
+                if embed and embedding_sources:
+                    self.queue_update_embeddings(result)
+                if is_entity:
+                    self.upsert_graph_nodes(batch)
+                rows += len(batch)
+                batches += 1
+                logger.debug(f"bulk loaded {rows} rows into {helper.table_name}")
+        finally:
+            if is_entity and batches:
+                invalidate_responses(self.model.get_model_fullname())
+                invalidate_function_results()
+
+        elapsed = time.monotonic() - started
+        stats = {
+            "table": helper.table_name,
+            "rows": rows,
+            "batches": batches,
+            "seconds": elapsed,
+            "rows_per_second": rows / elapsed if elapsed else 0.0,
+        }
+        logger.info(f"bulk load {stats}")
+        return stats
+
+    def _bulk_merge_batch(
+        self, batch: typing.List[AbstractModel], merge_query: str
+    ) -> typing.List[dict]:
+        """COPY one batch into the staging table and merge it in one transaction
+        rows are copied with their position in the batch so the last of any duplicate keys wins
+        """
+        import io
+
+        helper = self.model.sql()
+        buffer = io.StringIO()
+        for i, r in enumerate(batch):
+            buffer.write(
+                helper.to_csv_row(helper.serialize_for_db(r).values(), ordinal=i)
+            )
+        buffer.seek(0)
+        with self.pool.connection() as conn:
+            try:
+                c = conn.cursor()
+                c.execute(helper.create_staging_table_script())
+                c.copy_expert(helper.copy_query(), buffer)
+                c.execute(merge_query)
+                result = _fetch_dicts(c)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+
+    def upsert_graph_nodes(
+        self, records: typing.Iterable[AbstractEntity], batch_size: int = 5000
+    ) -> dict:
+        """upsert the entity nodes in chunks - each chunk is one prepared `UNWIND $nodes ... MERGE`
+        with the nodes bound as an agtype list rather than one MERGE statement per node.
+        graph attributes (see `CypherHelper.get_graph_model_attributes`) are set on the nodes
+
+        Returns: stats including nodes per second
+        """
+        import time
+        import itertools
+
+        cypher = self.model.cypher()
+        query = cypher_with_age_wrapper(cypher.upsert_nodes_query(), parameters=True)
+        records = iter(records)
+        nodes, batches, started = 0, 0, time.monotonic()
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            self.execute_prepared(query, (cypher.upsert_nodes_params(batch),))
+            nodes += len(batch)
+            batches += 1
+
+        elapsed = time.monotonic() - started
+        stats = {
+            "label": self.model.get_model_fullname(),
+            "nodes": nodes,
+            "batches": batches,
+            "seconds": elapsed,
+            "nodes_per_second": nodes / elapsed if elapsed else 0.0,
+        }
+        logger.debug(f"graph node upsert {stats}")
+        return stats
+
     def queue_update_embeddings(self, result: typing.List[dict]):
         """embeddings in general should be processed async
         when we insert some data, we read back a result with ids and column data for embeddings
         we then use whatever provided to get an embedding tensor and save it to the database
         this insert could be inline or adjacent table
+        when `EMBEDDING_QUEUE_ENABLED` the ids are enqueued for the background workers in `embedding_queue`
         """
         from funkyprompt.core.utils.embeddings import embed_frame
 
         helper = self.model.sql()
+        if not result or not helper.embedding_fields:
+            return
+        """rows whose source text matches the stored content hash keep their embeddings"""
+        result = helper.rows_with_changed_embedding_sources(result)
+        if not result:
+            return
+
+        if EMBEDDING_QUEUE_ENABLED:
+            from funkyprompt.services.data.embedding_queue import EmbeddingQueue
+
+            return EmbeddingQueue(self.model, store=self).enqueue(
+                [r[helper.id_field] for r in result]
+            )
 
         embeddings = embed_frame(
             result,
             field_mapping=self.model.get_embedding_fields(),
             id_column=helper.id_field,
+            providers=self.model.get_embedding_providers(),
         )
+        for e, r in zip(embeddings, result):
+            e.update(helper.embedding_hashes(r))
 
-        query = helper.embedding_fields_partial_update_query(batch_size=len(result))
-
+        """only the key, vectors and hashes are sent in a narrow update of the existing rows"""
         return self.execute_upsert(
-            query=query, data=(helper.partial_model_tuple(e) for e in embeddings)
+            query=helper.embedding_update_query(),
+            data=[helper.embedding_update_tuple(e) for e in embeddings],
         )
 
     def select_one(self, name: str, column: str = "name"):
         """selects one by name using the internal model"""
         table_name = self.model.get_model_fullname()
-        fields = ",".join(self.model.sql().field_names)
-        q = f"""SELECT { fields } FROM {table_name} where {column} = '{name}' limit 1"""
-        data = self.execute(q)
-        if len(data):
+        field_names = self.model.sql().field_names
+        if column not in field_names:
+            raise ValueError(f"{column} is not a field of {table_name}")
+        fields = ",".join(field_names)
+        q = f"""SELECT { fields } FROM {table_name} where {column} = %s limit 1"""
+        data = self.execute_prepared(q, (name,))
+        if data:
             return self.model(**dict(data[0]))
 
     def ask(self, question: str):
@@ -245,34 +517,70 @@ class PostgresService(DataServiceBase):
         """what we will do here is create what is called a wrapped entity"""
         return entity
 
+    def select_many(self, names: typing.List[str], column: str = "name"):
+        """selects all rows matching any of the names in one query using the internal model"""
+        table_name = self.model.get_model_fullname()
+        field_names = self.model.sql().field_names
+        if column not in field_names:
+            raise ValueError(f"{column} is not a field of {table_name}")
+        fields = ",".join(field_names)
+        q = f"""SELECT { fields } FROM {table_name} where {column} = ANY(%s)"""
+        data = self.execute_prepared(q, (list(names),))
+        return [self.model(**dict(d)) for d in data or []]
+
     @classmethod
-    def get_nodes_by_name(cls, name) -> typing.List[AbstractEntity]:
+    def get_nodes_by_name(
+        cls, name: str | typing.List[str]
+    ) -> typing.List[AbstractEntity]:
         """the node mode is only useful when we are invariant to types,
         because we can resolve nodes even when we dont know their type.
         Suppose an LLM knows that something _is_ an entity but does not know what it is
         we can match ANY nodes in the graph and then when we know the label->entity map
-        we can then select one by one.
-        We can make this more efficient in a number of ways but for now it provides a nice
-        entity resolution route for agent
-        Examples of optimization:
-        - cached types in the instance
-        - async parallel search over nodes
+        we can select the typed entities - see `resolve_nodes`.
+        One or more names are matched in one graph query
         """
-
-        cypher_query = f"""MATCH (v {{name:'{name}'}}) RETURN v"""
-        data = cls(AbstractEntity).query_graph(cypher_query)
+        names = [name] if isinstance(name, str) else list(name)
+        if not names:
+            return []
+        query = cypher_with_age_wrapper(
+            "MATCH (v) WHERE v.name IN $names RETURN v", parameters=True
+        )
+        data = cls(AbstractEntity).execute_prepared(
+            query, (json.dumps({"names": names}),)
+        )
         """do the entity wrapper stuff here
            should return an expanded abstract model i.e. one with lots of metadata in a structure e.g. desc, data, available functions
         """
+        return cls.resolve_nodes([_parse_vertex_result(x) for x in data or []], names)
 
-        """we can wrap the entities when we know their type when they match name
-           we need to do multiple select_ones for each matched type here (TODO:)
+    @classmethod
+    def resolve_nodes(
+        cls, nodes: typing.List[dict], names: typing.List[str] = None
+    ) -> typing.List[AbstractEntity]:
+        """load the typed entities for parsed graph nodes.
+        names are grouped by their (cached) label model so there is one `ANY` select per type
+        and the types are selected concurrently on pooled connections.
+        results are ordered as the names are
         """
-        data = [_parse_vertex_result(x) for x in data]
-        """a not so efficient way to load entities but fine for testing"""
-        data = [cls(d["model"]).select_one(d["name"]) for d in data]
-
-        return data
+        from concurrent.futures import ThreadPoolExecutor
+
+        groups = {}
+        for d in nodes:
+            if d["model"] is not None:
+                groups.setdefault(d["model"], []).append(d["name"])
+        if not groups:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(len(groups), POSTGRES_POOL_MAX_SIZE)
+        ) as executor:
+            results = executor.map(
+                lambda item: cls(item[0]).select_many(item[1]), groups.items()
+            )
+            entities = [e for r in results for e in r]
+        if names:
+            order = {n: i for i, n in enumerate(names)}
+            entities.sort(key=lambda e: order.get(e.name, len(order)))
+        return entities
 
     def query_graph(self, query: str):
         """query the graph with a valid cypher query"""
@@ -306,12 +614,21 @@ class PostgresService(DataServiceBase):
 
     def vector_search(
         self,
-        question: str,
-        search_operator: VectorSearchOperator = VectorSearchOperator.INNER_PRODUCT,
+        question: str | typing.List[str],
+        search_operator: VectorSearchOperator = None,
         limit: int = 7,
+        ef_search: int = None,
+        probes: int = None,
+        fusion: str = "rrf",
     ):
         """
         uses the default
+        the search operator defaults to the operator the ANN index was built for and
+        `ef_search` (hnsw) or `probes` (ivfflat) trade recall for latency per query
+
+        Args:
+            question (str | typing.List[str]): one or more questions e.g. paraphrases
+            fusion (str): for many questions, fuse by reciprocal rank `rrf` or best distance `max`
         """
 
         from funkyprompt.core.utils.embeddings import embed_collection
@@ -328,31 +645,75 @@ class PostgresService(DataServiceBase):
         :TODO: test the more general case of multiple columns with multiple providers when getting embeddings
         it may be a different operator is better in each case
         """
-        vec = embed_collection([question])[0]
+        questions = [question] if isinstance(question, str) else list(question)
+        field = list(self.model.get_embedding_fields())[0]
+        """all questions are embedded in one batched call"""
+        vecs = embed_collection(
+            questions, provider=self.model.get_embedding_providers()[field]
+        )
 
-        embedding_fields = helper.embedding_fields[0]
-        select_fields = ",".join(helper.field_names)
+        if len(vecs) == 1:
+            query = helper.vector_search_query(
+                search_operator=search_operator,
+                limit=limit,
+                ef_search=ef_search,
+                probes=probes,
+            )
+        else:
+            """several questions run as one statement and the results are fused"""
+            query = helper.multi_vector_search_query(
+                len(vecs),
+                search_operator=search_operator,
+                limit=limit,
+                ef_search=ef_search,
+                probes=probes,
+                fusion=fusion,
+            )
 
-        distance_max: float = 2
-        part_predicates = (
-            f"{embedding_fields} {search_operator.value} '{vec}' < {distance_max}"
-        )
+        return self.execute_prepared(query, tuple(to_vector_param(v) for v in vecs))
 
-        """distances are determined in different ways, that includes what 'large' is"""
-        distances = f"{embedding_fields} {search_operator.value} '{vec}' "
+    def hybrid_search(
+        self,
+        question: str,
+        limit: int = 7,
+        text_weight: float = 0.5,
+        vector_weight: float = 0.5,
+        search_operator: VectorSearchOperator = None,
+    ):
+        """full text rank over the searchable fields blended with vector similarity in one query.
+        with `vector_weight=0` (or no embedding columns) no embedding is requested which suits keyword lookups e.g. names and codes
+
+        Args:
+            question (str): the search text
+            limit (int, optional): results to return. Defaults to 7.
+            text_weight (float, optional): weight of the text rank. Defaults to 0.5.
+            vector_weight (float, optional): weight of the vector similarity. Defaults to 0.5.
+        """
+        from funkyprompt.core.utils.embeddings import embed_collection
 
-        """TODO: we could make some attempt to normalize for different systems
-        the scale of divergence e.g. for NE_INNER_PRODUCT (-1 - d)"""
-        """generate the query for now for only one embedding col"""
-        query = f"""SELECT
-            {select_fields},
-            ({distances}) as distances
-            from {helper.table_name} 
-              WHERE {part_predicates}
-                  order by {distances} ASC LIMIT {limit}
-             """
+        helper = self.model.sql()
+        vec = None
+        if vector_weight and helper.embedding_fields:
+            field = list(self.model.get_embedding_fields())[0]
+            vec = embed_collection(
+                [question], provider=self.model.get_embedding_providers()[field]
+            )[0]
+
+        query = helper.hybrid_search_query(
+            vec is not None,
+            search_operator=search_operator,
+            limit=limit,
+            text_weight=text_weight,
+            vector_weight=vector_weight,
+        )
+        params = (question,) if vec is None else (question, to_vector_param(vec))
+        return self.execute_prepared(query, params)
 
-        return self.execute(query)
+    def text_search(self, question: str, limit: int = 7):
+        """keyword search over the full text index only - no embedding call"""
+        return self.hybrid_search(
+            question, limit=limit, text_weight=1.0, vector_weight=0.0
+        )
 
 
 """notes
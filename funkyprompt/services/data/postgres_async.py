@@ -0,0 +1,424 @@
+"""
+The asyncio postgres service mirrors the `PostgresService` over psycopg3 and an async connection pool.
+When agents are served from an asyncio web server the sync service blocks the event loop on every statement
+whereas here many store calls can run concurrently on one thread
+
+```python
+import asyncio
+from funkyprompt.entities import Project
+from funkyprompt.services.data.postgres_async import AsyncPostgresService
+
+store = AsyncPostgresService(Project)
+results = await asyncio.gather(
+    store.select_one('test'),
+    store.vector_search('projects about sirsh interests'),
+)
+```
+
+The SQL and cypher are generated by the same model helpers as the sync service.
+Hot queries are bound and prepared server side and if `pgvector` is installed vectors are sent with its binary adapter
+"""
+
+import asyncio
+import json
+import time
+import typing
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from funkyprompt.core import AbstractModel, AbstractEntity
+from funkyprompt.services.data import AsyncDataServiceBase
+from funkyprompt.services.data.postgres import (
+    cypher_with_age_wrapper,
+    _parse_vertex_result,
+)
+from funkyprompt.services.models.response_cache import invalidate_responses
+from funkyprompt.core.functions.cache import invalidate_function_results
+from funkyprompt.core.utils.env import (
+    POSTGRES_CONNECTION_STRING,
+    POSTGRES_POOL_MAX_SIZE,
+    POSTGRES_POOL_TIMEOUT_SECONDS,
+    POSTGRES_POOL_HEALTH_CHECK_AFTER_SECONDS,
+    EMBEDDING_QUEUE_ENABLED,
+)
+from funkyprompt.core.utils import logger
+from funkyprompt.core.utils.loops import LoopResources
+from funkyprompt.core.types.sql import (
+    VectorSearchOperator,
+    split_local_settings,
+    to_vector_param,
+)
+
+try:
+    import numpy as np
+    from pgvector.psycopg import register_vector_async
+except ImportError:
+    register_vector_async = None
+
+"""async pools per event loop and connection string - closed when their loop shuts down (see `LoopResources`)"""
+_POOLS = LoopResources(close=lambda pool: pool.close())
+
+
+async def _configure_connection(conn):
+    """register the binary pgvector adapter on new pooled connections when it is available"""
+    if register_vector_async is not None:
+        try:
+            await register_vector_async(conn)
+        except Exception as ex:
+            logger.warning(f"could not register the pgvector adapter - {ex}")
+        await conn.rollback()
+
+
+def _vector_param(vec: typing.List[float]):
+    """numpy float32 arrays are dumped in binary by the pgvector adapter - otherwise the text form is bound"""
+    if register_vector_async is not None:
+        return np.asarray(vec, dtype=np.float32)
+    return to_vector_param(vec)
+
+
+async def get_async_pool(connection_string: str = None) -> AsyncConnectionPool:
+    """the async pool for the connection string
+    async pools are bound to the event loop that opened them so there is one per running loop
+    """
+    connection_string = connection_string or POSTGRES_CONNECTION_STRING
+    pool = _POOLS.get(connection_string)
+    if pool is None:
+        pool = _POOLS.set(
+            connection_string,
+            AsyncConnectionPool(
+                connection_string,
+                min_size=1,
+                max_size=POSTGRES_POOL_MAX_SIZE,
+                timeout=POSTGRES_POOL_TIMEOUT_SECONDS,
+                max_idle=POSTGRES_POOL_HEALTH_CHECK_AFTER_SECONDS,
+                check=AsyncConnectionPool.check_connection,
+                configure=_configure_connection,
+                open=False,
+            ),
+        )
+        await pool.open()
+    return pool
+
+
+async def close_async_pools():
+    """close and drop the async pools of the running loop e.g. before closing a loop not run by `asyncio.run`"""
+    await _POOLS.aclose()
+
+
+def expand_values_placeholder(
+    query: str, data: typing.List[tuple], page_size: int = 100
+) -> typing.Iterator[typing.Tuple[str, list]]:
+    """psycopg3 has no `execute_values` so we expand the `VALUES %s` placeholder of
+    our upsert queries into pages of row placeholders with flattened parameters
+    """
+    data = list(data)
+    for i in range(0, len(data), page_size):
+        page = data[i : i + page_size]
+        rows = ", ".join(f"({', '.join(['%s'] * len(r))})" for r in page)
+        yield query.replace("VALUES %s", f"VALUES {rows}", 1), [
+            v for r in page for v in r
+        ]
+
+
+class AsyncPostgresService(AsyncDataServiceBase):
+    """the asyncio postgres service wrapper for sinking and querying entities/models
+    see `PostgresService` for the sync version - the methods here are the coroutine equivalents
+    """
+
+    def __init__(self, model: AbstractModel, connection_string: str = None):
+        self.connection_string = connection_string or POSTGRES_CONNECTION_STRING
+        self.model: AbstractModel = model
+
+    async def pool_stats(self) -> dict:
+        """stats for the shared async connection pool"""
+        return (await get_async_pool(self.connection_string)).get_stats()
+
+    async def execute(
+        self,
+        query: str,
+        data: tuple = None,
+        as_upsert: bool = False,
+        page_size: int = 100,
+        prepare: bool = None,
+    ):
+        """run any sql query
+        this works only for selects and transactional updates without selects.
+        psycopg3 cannot send several statements with bound parameters in one execute
+        so leading settings e.g. `SET LOCAL hnsw.ef_search` are split off and run first.
+        `prepare=True` prepares the statement on the connection the first time it is seen
+        """
+        if not query:
+            return
+        pool = await get_async_pool(self.connection_string)
+        async with pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor(row_factory=dict_row) as c:
+                    if as_upsert:
+                        result = []
+                        for q, params in expand_values_placeholder(
+                            query, data, page_size=page_size
+                        ):
+                            await c.execute(q, params)
+                            if c.description:
+                                result += await c.fetchall()
+                        return result
+                    settings, query = split_local_settings(query)
+                    for s in settings:
+                        await c.execute(s)
+                    await c.execute(query, data, prepare=prepare)
+                    if c.description:
+                        return await c.fetchall()
+
+    async def execute_upsert(
+        self, query: str, data: tuple = None, page_size: int = 100
+    ):
+        """run an upsert sql query"""
+        return await self.execute(query, data=data, page_size=page_size, as_upsert=True)
+
+    async def create_model(self, model: AbstractModel = None):
+        """creates the model based on the type - see `PostgresService.create_model`"""
+        model = model or self.model
+        script = model.sql().create_script()
+        logger.debug(script)
+        await self.execute(script)
+        await self.execute(cypher_with_age_wrapper(model.cypher().create_script()))
+        logger.info(f"updated {model.get_model_fullname()}")
+
+    async def update_records(self, records: typing.List[AbstractModel]):
+        """records are updated using typed object relational mapping.
+        the embedding update is queued
+        """
+        if records and not isinstance(records, list):
+            records = [records]
+        if not records:
+            return
+        helper = self.model.sql()
+        query = helper.upsert_query(batch_size=len(records))
+        result = await self.execute_upsert(
+            query=query,
+            data=[tuple(helper.serialize_for_db(r).values()) for r in records],
+        )
+
+        await self.queue_update_embeddings(result)
+
+        if issubclass(self.model, AbstractEntity):
+            await self.upsert_graph_nodes(records)
+            invalidate_responses(self.model.get_model_fullname())
+            invalidate_function_results()
+
+        return result
+
+    async def upsert_graph_nodes(
+        self, records: typing.List[AbstractEntity], batch_size: int = 5000
+    ) -> dict:
+        """see `PostgresService.upsert_graph_nodes`"""
+        cypher = self.model.cypher()
+        query = cypher_with_age_wrapper(cypher.upsert_nodes_query(), parameters=True)
+        started = time.monotonic()
+        for i in range(0, len(records), batch_size):
+            await self.execute(
+                query,
+                (cypher.upsert_nodes_params(records[i : i + batch_size]),),
+                prepare=True,
+            )
+        elapsed = time.monotonic() - started
+        stats = {
+            "label": self.model.get_model_fullname(),
+            "nodes": len(records),
+            "batches": -(-len(records) // batch_size),
+            "seconds": elapsed,
+            "nodes_per_second": len(records) / elapsed if elapsed else 0.0,
+        }
+        logger.debug(f"graph node upsert {stats}")
+        return stats
+
+    async def queue_update_embeddings(self, result: typing.List[dict]):
+        """the embedding api client is sync so we run it in a worker thread and then write back the vectors
+        when `EMBEDDING_QUEUE_ENABLED` the ids are enqueued for the background workers as in the sync service
+        """
+        from funkyprompt.core.utils.embeddings import embed_frame
+
+        helper = self.model.sql()
+        if not result or not helper.embedding_fields:
+            return
+        result = helper.rows_with_changed_embedding_sources(result)
+        if not result:
+            return
+
+        if EMBEDDING_QUEUE_ENABLED:
+            from funkyprompt.services.data.embedding_queue import EmbeddingQueue
+
+            """the queue writes with the sync service so it runs in a worker thread"""
+            return await asyncio.to_thread(
+                EmbeddingQueue(self.model).enqueue, [r[helper.id_field] for r in result]
+            )
+
+        embeddings = await asyncio.to_thread(
+            embed_frame,
+            result,
+            field_mapping=self.model.get_embedding_fields(),
+            id_column=helper.id_field,
+            providers=self.model.get_embedding_providers(),
+        )
+        for e, r in zip(embeddings, result):
+            e.update(helper.embedding_hashes(r))
+
+        return await self.execute_upsert(
+            query=helper.embedding_update_query(),
+            data=[helper.embedding_update_tuple(e) for e in embeddings],
+        )
+
+    async def select_one(self, name: str, column: str = "name"):
+        """selects one by name using the internal model"""
+        table_name = self.model.get_model_fullname()
+        field_names = self.model.sql().field_names
+        if column not in field_names:
+            raise ValueError(f"{column} is not a field of {table_name}")
+        fields = ",".join(field_names)
+        q = f"""SELECT { fields } FROM {table_name} where {column} = %s limit 1"""
+        data = await self.execute(q, (name,), prepare=True)
+        if data:
+            return self.model(**dict(data[0]))
+
+    async def ask(self, question: str):
+        """natural language to SQL is used to query the store"""
+        query = self.model.sql().query_from_natural_language(
+            question,
+        )
+        return await self.execute(query)
+
+    async def query(self, query: str):
+        """directly query by SQL - see `PostgresService.query`"""
+        return await self.execute(query)
+
+    async def query_graph(self, query: str):
+        """query the graph with a valid cypher query"""
+        query = cypher_with_age_wrapper(query)
+        return await self.execute(query)
+
+    async def select_many(self, names: typing.List[str], column: str = "name"):
+        """selects all rows matching any of the names in one query using the internal model"""
+        table_name = self.model.get_model_fullname()
+        field_names = self.model.sql().field_names
+        if column not in field_names:
+            raise ValueError(f"{column} is not a field of {table_name}")
+        fields = ",".join(field_names)
+        q = f"""SELECT { fields } FROM {table_name} where {column} = ANY(%s)"""
+        data = await self.execute(q, (list(names),), prepare=True)
+        return [self.model(**dict(d)) for d in data or []]
+
+    async def get_nodes_by_name(
+        self, name: str | typing.List[str]
+    ) -> typing.List[AbstractEntity]:
+        """match nodes of any type by one or more names and select the typed entities - see `resolve_nodes`"""
+        names = [name] if isinstance(name, str) else list(name)
+        if not names:
+            return []
+        query = cypher_with_age_wrapper(
+            "MATCH (v) WHERE v.name IN $names RETURN v", parameters=True
+        )
+        data = await self.execute(query, (json.dumps({"names": names}),), prepare=True)
+        return await self.resolve_nodes(
+            [_parse_vertex_result(x) for x in data or []], names
+        )
+
+    async def resolve_nodes(
+        self, nodes: typing.List[dict], names: typing.List[str] = None
+    ) -> typing.List[AbstractEntity]:
+        """one `ANY` select per entity type with the types selected concurrently - see `PostgresService.resolve_nodes`"""
+        groups = {}
+        for d in nodes:
+            if d["model"] is not None:
+                groups.setdefault(d["model"], []).append(d["name"])
+        results = await asyncio.gather(
+            *[
+                AsyncPostgresService(model, self.connection_string).select_many(n)
+                for model, n in groups.items()
+            ]
+        )
+        entities = [e for r in results for e in r]
+        if names:
+            order = {n: i for i, n in enumerate(names)}
+            entities.sort(key=lambda e: order.get(e.name, len(order)))
+        return entities
+
+    async def vector_search(
+        self,
+        question: str | typing.List[str],
+        search_operator: VectorSearchOperator = None,
+        limit: int = 7,
+        ef_search: int = None,
+        probes: int = None,
+        fusion: str = "rrf",
+    ):
+        """see `PostgresService.vector_search`"""
+        from funkyprompt.core.utils.embeddings import embed_collection
+
+        helper = self.model.sql()
+
+        if not helper.embedding_fields:
+            raise Exception(
+                "this type does not support vector search as there are no embedding columns"
+            )
+
+        questions = [question] if isinstance(question, str) else list(question)
+        field = list(self.model.get_embedding_fields())[0]
+        vecs = await asyncio.to_thread(
+            embed_collection,
+            questions,
+            provider=self.model.get_embedding_providers()[field],
+        )
+
+        query = (
+            helper.vector_search_query(
+                search_operator=search_operator,
+                limit=limit,
+                ef_search=ef_search,
+                probes=probes,
+            )
+            if len(vecs) == 1
+            else helper.multi_vector_search_query(
+                len(vecs),
+                search_operator=search_operator,
+                limit=limit,
+                ef_search=ef_search,
+                probes=probes,
+                fusion=fusion,
+            )
+        )
+
+        return await self.execute(
+            query, tuple(_vector_param(v) for v in vecs), prepare=True
+        )
+
+    async def hybrid_search(
+        self,
+        question: str,
+        limit: int = 7,
+        text_weight: float = 0.5,
+        vector_weight: float = 0.5,
+        search_operator: VectorSearchOperator = None,
+    ):
+        """see `PostgresService.hybrid_search`"""
+        from funkyprompt.core.utils.embeddings import embed_collection
+
+        helper = self.model.sql()
+        vec = None
+        if vector_weight and helper.embedding_fields:
+            field = list(self.model.get_embedding_fields())[0]
+            vec = (
+                await asyncio.to_thread(
+                    embed_collection,
+                    [question],
+                    provider=self.model.get_embedding_providers()[field],
+                )
+            )[0]
+
+        query = helper.hybrid_search_query(
+            vec is not None,
+            search_operator=search_operator,
+            limit=limit,
+            text_weight=text_weight,
+            vector_weight=vector_weight,
+        )
+        params = (question,) if vec is None else (question, _vector_param(vec))
+        return await self.execute(query, params, prepare=True)
@@ -1,8 +1,18 @@
 from funkyprompt.core.agents import CallingContext
-from funkyprompt.core.agents import MessageStack
+from funkyprompt.core.agents import MessageStack, MessageStackSnapshot
+from .response_cache import CachedCall
+import asyncio
+import inspect
 import typing
 
 
+async def _notify(callback, content):
+    """callbacks can be plain functions or coroutines e.g. writing to a websocket"""
+    result = callback(content)
+    if inspect.isawaitable(result):
+        await result
+
+
 class LanguageModelBase:
 
     def __call__(
@@ -10,7 +20,7 @@ class LanguageModelBase:
         messages: str | typing.List[dict] | MessageStack,
         context: CallingContext = None,
         functions: typing.Optional[dict] = None,
-        **kwargs
+        **kwargs,
     ):
         """the callable is a lightly more opinionated version of run for convenience
         but users of run should remain close to what the model needs
@@ -21,16 +31,76 @@ class LanguageModelBase:
         if isinstance(messages, str):
             """simple convenience cheat"""
             messages = MessageStack(question=messages, model=DefaultAgentCore)
-        if isinstance(messages, MessageStack):
-            messages = messages.model_dump()
+        if isinstance(messages, (MessageStack, MessageStackSnapshot)):
+            messages = messages.dump_for_context(context)
 
         self._messages = messages
         self._functions = functions
 
-        return self.run(messages=messages, context=context, functions=functions)
+        """opt-in reuse of deterministic responses (see `response_cache`)"""
+        cached = CachedCall(messages, functions, context)
+        response = cached.get()
+        if response is not None:
+            if context.streaming_callback:
+                context.streaming_callback(response)
+            return response
 
+        response = self.run(messages=messages, context=context, functions=functions)
+        cached.put(response)
+        return response
 
-from .gpt import GptModel
+    async def acall(
+        self,
+        messages: str | typing.List[dict] | MessageStack,
+        context: CallingContext = None,
+        functions: typing.Optional[dict] = None,
+        **kwargs,
+    ):
+        """the asyncio version of the callable - see `arun`"""
+        from funkyprompt.core.agents import DefaultAgentCore
+
+        context = context or CallingContext()
+        if isinstance(messages, str):
+            messages = MessageStack(question=messages, model=DefaultAgentCore)
+        if isinstance(messages, (MessageStack, MessageStackSnapshot)):
+            messages = messages.dump_for_context(context)
+
+        self._messages = messages
+        self._functions = functions
+
+        cached = CachedCall(messages, functions, context)
+        response = cached.get()
+        if response is not None:
+            if context.streaming_callback:
+                await _notify(context.streaming_callback, response)
+            return response
+
+        response = await self.arun(
+            messages=messages, context=context, functions=functions
+        )
+        cached.put(response)
+        return response
+
+    async def arun(
+        self,
+        messages: typing.List[dict],
+        context: CallingContext,
+        functions: typing.Optional[dict] = None,
+        **kwargs,
+    ):
+        """providers without an asyncio client run the blocking call in a worker thread"""
+        return await asyncio.to_thread(
+            self.run, messages=messages, context=context, functions=functions
+        )
+
+
+def __getattr__(name):
+    """provider clients are loaded on first use so their SDKs are only imported when needed"""
+    if name == "GptModel":
+        from .gpt import GptModel
+
+        return GptModel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def language_model_client_from_context(
@@ -48,6 +118,8 @@ def language_model_client_from_context(
 
     Within each of these providers the context can choose a model size/version
     """
+    from .gpt import GptModel
+
     context = context or CallingContext()
 
     """default"""
@@ -1,4 +1,11 @@
-import anthropic
+def __getattr__(name):
+    """the SDK is imported on first use (PEP 562)"""
+    if name == "anthropic":
+        import anthropic
+
+        return anthropic
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # https://docs.anthropic.com/en/docs/quickstart
 model = "claude-3-5-sonnet-20240620"
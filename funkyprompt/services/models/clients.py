@@ -0,0 +1,150 @@
+"""
+A registry of shared language model API clients.
+Creating a client per call (or per runner) means a new connection pool and a TLS handshake on every agent iteration
+so instead one configured client is kept per provider (and model where the client is bound to one) per process
+and shared across runners and threads - the SDK clients are thread safe.
+
+- http clients keep connections alive and are sized by `LLM_CLIENT_MAX_CONNECTIONS`
+- async clients are bound to the event loop that created them so they are kept per loop and closed when it shuts down
+  (`close_async_clients` closes them explicitly e.g. for loops that are not run with `asyncio.run`)
+- factories for other providers can be added with `register_client_factory`
+
+```python
+from funkyprompt.services.models.clients import get_client
+client = get_client("openai")
+client.chat.completions.create(...)
+```
+"""
+
+import inspect
+import os
+import threading
+import typing
+from funkyprompt.core.utils.loops import LoopResources
+from funkyprompt.core.utils.env import (
+    LLM_CLIENT_MAX_CONNECTIONS,
+    LLM_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+    LLM_CLIENT_KEEPALIVE_EXPIRY_SECONDS,
+    LLM_CLIENT_TIMEOUT_SECONDS,
+)
+
+_FACTORIES: typing.Dict[str, typing.Callable] = {}
+_CLIENTS: typing.Dict[tuple, typing.Any] = {}
+_LOCK = threading.Lock()
+"""bumped when factories or credentials change so that async clients made before are no longer handed out"""
+_GENERATION = 0
+
+
+async def _close_client(client):
+    """the SDK async clients close with a coroutine"""
+    result = client.close()
+    if inspect.isawaitable(result):
+        await result
+
+
+_ASYNC_CLIENTS = LoopResources(close=_close_client)
+
+
+def _http_options(asynchronous: bool = False) -> dict:
+    """keep-alive and pool limits for the httpx client used by the SDKs"""
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=LLM_CLIENT_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_CLIENT_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_CLIENT_KEEPALIVE_EXPIRY_SECONDS,
+    )
+    client = httpx.AsyncClient if asynchronous else httpx.Client
+    return {
+        "http_client": client(limits=limits, timeout=LLM_CLIENT_TIMEOUT_SECONDS),
+    }
+
+
+def _openai_client(model: str = None, asynchronous: bool = False):
+    import openai
+
+    client = openai.AsyncOpenAI if asynchronous else openai.OpenAI
+    return client(**_http_options(asynchronous))
+
+
+def _anthropic_client(model: str = None, asynchronous: bool = False):
+    import anthropic
+
+    client = anthropic.AsyncAnthropic if asynchronous else anthropic.Anthropic
+    return client(**_http_options(asynchronous))
+
+
+def _groq_client(model: str = None, asynchronous: bool = False):
+    import groq
+
+    client = groq.AsyncGroq if asynchronous else groq.Groq
+    return client(**_http_options(asynchronous))
+
+
+def register_client_factory(provider: str, factory: typing.Callable):
+    """register a factory `(model, asynchronous) -> client` for a provider - existing clients are dropped"""
+    global _GENERATION
+    with _LOCK:
+        _FACTORIES[provider] = factory
+        _GENERATION += 1
+        for key in [k for k in _CLIENTS if k[0] == provider]:
+            _CLIENTS.pop(key)
+
+
+def _factory(provider: str) -> typing.Callable:
+    if provider not in _FACTORIES:
+        raise ValueError(
+            f"There is no client registered for `{provider}` - registered providers are {list(_FACTORIES)}"
+        )
+    return _FACTORIES[provider]
+
+
+def get_client(provider: str = "openai", model: str = None, asynchronous: bool = False):
+    """the shared client for a provider - created on first use
+
+    Args:
+        provider: the provider name e.g. openai, anthropic, groq
+        model: only for providers whose clients are bound to a model
+        asynchronous: the asyncio client (call from a running event loop)
+    """
+    if asynchronous:
+        """the running loop only serves one thread so async clients need no lock"""
+        key = (provider, model, os.getpid(), _GENERATION)
+        client = _ASYNC_CLIENTS.get(key)
+        if client is None:
+            client = _ASYNC_CLIENTS.set(
+                key, _factory(provider)(model=model, asynchronous=True)
+            )
+        return client
+
+    """clients are per process - forked workers must not share sockets"""
+    key = (provider, model, os.getpid())
+    client = _CLIENTS.get(key)
+    if client is None:
+        with _LOCK:
+            client = _CLIENTS.get(key)
+            if client is None:
+                client = _CLIENTS[key] = _factory(provider)(
+                    model=model, asynchronous=False
+                )
+    return client
+
+
+def clear_clients():
+    """drop the shared clients e.g. after changing credentials
+    async clients that were handed out stay open until their loop shuts down
+    """
+    global _GENERATION
+    with _LOCK:
+        _CLIENTS.clear()
+        _GENERATION += 1
+
+
+async def close_async_clients():
+    """close and drop the async clients of the running loop"""
+    await _ASYNC_CLIENTS.aclose()
+
+
+register_client_factory("openai", _openai_client)
+register_client_factory("anthropic", _anthropic_client)
+register_client_factory("groq", _groq_client)
@@ -5,7 +5,15 @@
 # gemini-1.5-flash: our fastest multi-modal model
 # gemini-1.5-pro: our most capable and intelligent multi-modal model
 
-import google.generativeai as genai
+
+def __getattr__(name):
+    """the SDK is imported on first use (PEP 562)"""
+    if name == "genai":
+        import google.generativeai as genai
+
+        return genai
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # model = genai.GenerativeModel('gemini-1.5-flash')
 # response = model.generate_content("What is the meaning of life?", stream=True)
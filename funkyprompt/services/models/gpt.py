@@ -6,7 +6,33 @@ import typing
 from funkyprompt.core.agents import CallingContext
 from funkyprompt.core.functions import FunctionCall
 import json
-from . import LanguageModelBase
+from . import LanguageModelBase, _notify
+from .clients import get_client
+
+
+def _add_tool_call_deltas(tool_calls: dict, deltas):
+    """streamed tool calls arrive as fragments keyed by index - the id and name come first and the arguments follow"""
+    for d in deltas:
+        call = tool_calls.setdefault(
+            d.index, {"id": None, "name": None, "arguments": ""}
+        )
+        if d.id:
+            call["id"] = d.id
+        if d.function:
+            if d.function.name:
+                call["name"] = d.function.name
+            if d.function.arguments:
+                call["arguments"] += d.function.arguments
+
+
+def _to_function_calls(tool_calls: dict) -> typing.List[FunctionCall]:
+    """wrap the tool calls in our simple interface in the order the model made them"""
+    return [
+        FunctionCall(
+            id=c["id"], name=c["name"], arguments=json.loads(c["arguments"] or "{}")
+        )
+        for _, c in sorted(tool_calls.items())
+    ]
 
 
 def _get_function_call_or_stream(
@@ -15,18 +41,21 @@ def _get_function_call_or_stream(
     """
     This is a little bit opaque as it tries to abstract
     function calling and non-function calling for both streaming modes
+    When the model calls functions a list of one or more `FunctionCall` is returned (parallel tool calls)
     """
 
-    def function_builder(function_call, response):
-        """wrap it in our simple interface"""
-        function_name = function_call.name
-        function_args = function_call.arguments
+    def function_builder(deltas, response):
+        """collect all the (parallel) tool calls from the rest of the stream"""
+        tool_calls = {}
+        _add_tool_call_deltas(tool_calls, deltas)
         for c in response:
             if c.choices:
                 c = c.choices[0].delta
-                if c.function_call:
-                    function_args += c.function_call.arguments
-        return FunctionCall(name=function_name, arguments=json.loads(function_args))
+                if c.tool_calls:
+                    _add_tool_call_deltas(tool_calls, c.tool_calls)
+            elif token_callback_action:
+                token_callback_action(c)
+        return _to_function_calls(tool_calls)
 
     def content_builder(content, response):
         """
@@ -53,10 +82,10 @@ def _get_function_call_or_stream(
 
             if chunk.choices:
                 _chunk = chunk.choices[0].delta
-                has_call = _chunk.function_call
+                has_call = _chunk.tool_calls
                 if has_call:
                     fb = function_builder(
-                        _chunk.function_call,
+                        _chunk.tool_calls,
                         response,
                     )
                     return fb
@@ -82,12 +111,16 @@ def _get_function_call_or_stream(
     else:
         """not streaming mode - respecting the same interface"""
         response_message = response.choices[0].message
-        function_call = response_message.function_call
-        if function_call:
-            return FunctionCall(
-                name=function_call.name,
-                arguments=json.loads(function_call.arguments),
-            )
+        tool_calls = response_message.tool_calls
+        if tool_calls:
+            return [
+                FunctionCall(
+                    id=t.id,
+                    name=t.function.name,
+                    arguments=json.loads(t.function.arguments or "{}"),
+                )
+                for t in tool_calls
+            ]
         if isinstance(response_buffer, list):
             response_buffer.append(response_message.content)
 
@@ -101,7 +134,71 @@ def _get_function_call_or_stream(
         return response_message.content
 
 
+async def _aget_function_call_or_stream(
+    response, callback=None, response_buffer=None, token_callback_action=None
+):
+    """
+    The asyncio mirror of `_get_function_call_or_stream` for the `AsyncOpenAI` client
+    streamed tokens are passed to the (optionally async) callback as they arrive
+    """
+
+    async def function_builder(deltas, response):
+        tool_calls = {}
+        _add_tool_call_deltas(tool_calls, deltas)
+        async for c in response:
+            if c.choices:
+                c = c.choices[0].delta
+                if c.tool_calls:
+                    _add_tool_call_deltas(tool_calls, c.tool_calls)
+            elif token_callback_action:
+                token_callback_action(c)
+        return _to_function_calls(tool_calls)
+
+    async def content_builder(content, response):
+        """an async generator for consumers that iterate the stream themselves"""
+        yield content
+        async for c in response:
+            if not c.choices and token_callback_action:
+                token_callback_action(c)
+            if c.choices:
+                yield c.choices[0].delta.content
+
+    if isinstance(response, openai.AsyncStream):
+        content = ""
+        async for chunk in response:
+            if chunk.choices:
+                _chunk = chunk.choices[0].delta
+                if _chunk.tool_calls:
+                    return await function_builder(_chunk.tool_calls, response)
+                elif _chunk.content:
+                    content += _chunk.content
+                    if callback:
+                        await _notify(callback, _chunk.content)
+                    if isinstance(response_buffer, list):
+                        response_buffer.append(_chunk.content)
+                    else:
+                        return content_builder(_chunk.content, response)
+            elif token_callback_action:
+                token_callback_action(chunk)
+
+        if isinstance(response_buffer, list):
+            response_buffer.append(content)
+        return content
+
+    """not streaming mode - the response is complete so the sync parsing applies"""
+    return _get_function_call_or_stream(
+        response,
+        callback,
+        response_buffer=response_buffer,
+        token_callback_action=token_callback_action,
+    )
+
+
 class GptModel(LanguageModelBase):
+    """model instances hold per run buffers but share the process wide api client (see `clients.get_client`)"""
+
+    def __init__(self, client=None):
+        self.client = client or get_client("openai")
 
     def get_function_call_or_stream(
         self,
@@ -117,6 +214,26 @@ class GptModel(LanguageModelBase):
             token_callback_action=token_callback_action,
         )
 
+    def _completion_args(
+        cls,
+        messages: typing.List[dict],
+        context: CallingContext,
+        functions: typing.Optional[dict] = None,
+    ) -> dict:
+        """functions are offered as tools so the model can request several calls in one turn"""
+        tools = [{"type": "function", "function": f} for f in functions or []]
+        return dict(
+            model=context.model,
+            tools=tools or openai.NOT_GIVEN,
+            tool_choice="auto" if tools else openai.NOT_GIVEN,
+            parallel_tool_calls=True if tools else openai.NOT_GIVEN,
+            messages=messages,
+            temperature=context.temperature,
+            response_format=context.get_response_format(),
+            stream=context.is_streaming,
+            stream_options=({"include_usage": True} if context.is_streaming else None),
+        )
+
     def run(
         cls,
         messages: typing.List[dict],
@@ -130,15 +247,8 @@ class GptModel(LanguageModelBase):
         - manages function calling
         """
 
-        response = openai.chat.completions.create(
-            model=context.model,
-            functions=(list(functions) if functions else None),
-            function_call="auto" if functions else None,
-            messages=messages,
-            temperature=context.temperature,
-            response_format=context.get_response_format(),
-            stream=context.is_streaming,
-            stream_options=({"include_usage": True} if context.is_streaming else None),
+        response = cls.client.chat.completions.create(
+            **cls._completion_args(messages, context, functions)
         )
 
         cls.response_buffer = []
@@ -150,3 +260,25 @@ class GptModel(LanguageModelBase):
         )
 
         return response
+
+    async def arun(
+        cls,
+        messages: typing.List[dict],
+        context: CallingContext,
+        functions: typing.Optional[dict] = None,
+        **kwargs
+    ):
+        """The asyncio entry point - the same as `run` using the shared `AsyncOpenAI` client of the running loop
+        so that many sessions can wait on the api concurrently without a thread each
+        """
+        client = get_client("openai", asynchronous=True)
+        response = await client.chat.completions.create(
+            **cls._completion_args(messages, context, functions)
+        )
+
+        cls.response_buffer = []
+        return await _aget_function_call_or_stream(
+            response,
+            context.streaming_callback,
+            response_buffer=cls.response_buffer,
+        )
@@ -1,6 +1,14 @@
 # https://github.com/groq/groq-python
 
-from groq import Groq
+
+def __getattr__(name):
+    """the SDK is imported on first use (PEP 562)"""
+    if name == "Groq":
+        from groq import Groq
+
+        return Groq
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # https://console.groq.com/docs/models
 model = "llama3-8b-8192"
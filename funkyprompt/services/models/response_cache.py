@@ -0,0 +1,279 @@
+"""
+An opt-in cache of language model responses (see `CallingContext.use_response_cache`)
+Users often ask the same or near identical questions so a deterministic answer can be reused.
+
+- the exact tier is keyed on a hash of the messages, functions, model and temperature
+- the opt-in semantic tier matches the embedding of the user's question against earlier questions asked in the same scope
+  (the same messages before the question, functions, model and temperature) above a similarity threshold.
+  it is off unless a threshold is set because similar questions can still need different answers
+- entries expire after a TTL and both tiers are size bounded (least recently used entries are evicted)
+- entity writes through the store `update_records`/`bulk_update_records` in this process invalidate the entries cached before them.
+  writes from other processes, the embedding queue workers and non entity tables do not so the TTL bounds staleness there
+- only deterministic (temperature 0) text responses are cached
+
+```python
+from funkyprompt.services.models.response_cache import get_response_cache
+get_response_cache().stats()
+```
+"""
+
+import collections
+import hashlib
+import json
+import math
+import operator
+import threading
+import time
+import typing
+from funkyprompt.core.utils.env import (
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_MAX_SIZE,
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    RESPONSE_CACHE_EMBEDDING_PROVIDER,
+)
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _unit(vector: typing.List[float]) -> typing.List[float]:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class _Entry:
+    __slots__ = ["response", "created_at"]
+
+    def __init__(self, response: str):
+        self.response = response
+        self.created_at = time.time()
+
+
+class ResponseCache:
+    """two tier response cache
+
+    Args:
+        ttl_seconds: how long responses are reused
+        max_size: max entries in each tier
+        similarity_threshold: the min cosine similarity of questions in the semantic tier - None (the default) to use exact matches only
+        embedding_provider: the provider used to embed questions (see `embeddings.register_embedding_provider`)
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_size: int = RESPONSE_CACHE_MAX_SIZE,
+        similarity_threshold: typing.Optional[float] = (
+            RESPONSE_CACHE_SIMILARITY_THRESHOLD
+        ),
+        embedding_provider: str = RESPONSE_CACHE_EMBEDDING_PROVIDER,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.similarity_threshold = similarity_threshold
+        self.embedding_provider = embedding_provider
+        self._exact = collections.OrderedDict()
+        """semantic entries are (scope, unit question vector) keyed by an id in insertion order"""
+        self._semantic = collections.OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+
+    @property
+    def generation(self) -> int:
+        """the number of entity table changes seen - responses cached before a change are not reused"""
+        return self._generation
+
+    def invalidate(self, table: str = None):
+        """entity data changed so earlier responses may be stale
+        responses do not record which tables they read so a change to any entity table clears the cache
+        """
+        with self._lock:
+            self._generation += 1
+            self._exact.clear()
+            self._semantic.clear()
+            self._counters["invalidations"] += 1
+
+    @staticmethod
+    def keys(
+        messages: typing.List[dict],
+        functions: typing.Optional[typing.List[dict]],
+        model: str,
+        temperature: float,
+    ) -> typing.Tuple[str, str, typing.Optional[str]]:
+        """the exact key, the semantic scope and the question to embed
+        the question is the last message if it is from the user and the scope is everything else
+        """
+        key = _hash(messages, functions, model, temperature)
+        question = None
+        if messages and messages[-1].get("role") == "user":
+            question = messages[-1].get("content")
+            messages = messages[:-1]
+        return key, _hash(messages, functions, model, temperature), question
+
+    def _valid(self, entry: _Entry) -> bool:
+        return time.time() - entry.created_at <= self.ttl_seconds
+
+    def _embed(self, question: str) -> typing.Optional[typing.List[float]]:
+        """the unit question vector - the semantic tier is skipped if the provider fails"""
+        from funkyprompt.core.utils.embeddings import embed_collection
+
+        try:
+            return _unit(
+                embed_collection([str(question)], provider=self.embedding_provider)[0]
+            )
+        except Exception as ex:
+            from funkyprompt.core.utils import logger
+
+            logger.warning(f"response cache could not embed the question - {ex}")
+            return None
+
+    def get(
+        self, key: str, scope: str = None, question: str = None
+    ) -> typing.Optional[str]:
+        """the exact match or the response to the most similar question in scope"""
+        with self._lock:
+            entry = self._exact.get(key)
+            if entry is not None:
+                if self._valid(entry):
+                    self._exact.move_to_end(key)
+                    self._counters["exact_hits"] += 1
+                    return entry.response
+                self._exact.pop(key)
+
+        vector = (
+            self._embed(question)
+            if self.similarity_threshold is not None and question and scope
+            else None
+        )
+        if vector is not None:
+            with self._lock:
+                best, best_key = self.similarity_threshold, None
+                for k, (s, v) in self._semantic.items():
+                    if s == scope:
+                        similarity = sum(map(operator.mul, vector, v))
+                        if similarity >= best:
+                            best, best_key = similarity, k
+                entry = self._exact.get(best_key) if best_key else None
+                if entry is not None and self._valid(entry):
+                    self._counters["semantic_hits"] += 1
+                    return entry.response
+
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def put(
+        self,
+        key: str,
+        response: str,
+        scope: str = None,
+        question: str = None,
+        generation: int = None,
+    ):
+        """cache the response - pass the `generation` read before the request so that
+        a response computed while entity data changed is not cached
+        """
+        if generation is None:
+            generation = self._generation
+        vector = (
+            self._embed(question)
+            if self.similarity_threshold is not None and question and scope
+            else None
+        )
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._exact[key] = _Entry(response)
+            self._exact.move_to_end(key)
+            if vector is not None:
+                self._semantic[key] = (scope, vector)
+                self._semantic.move_to_end(key)
+            while len(self._exact) > self.max_size:
+                evicted, _ = self._exact.popitem(last=False)
+                self._semantic.pop(evicted, None)
+                self._counters["evictions"] += 1
+
+    def stats(self) -> dict:
+        """hit/miss counters"""
+        with self._lock:
+            stats = dict(self._counters)
+            hits = stats.get("exact_hits", 0) + stats.get("semantic_hits", 0)
+            total = hits + stats.get("misses", 0)
+            stats["hit_rate"] = hits / total if total else 0.0
+            stats["entries"] = len(self._exact)
+            return stats
+
+    def clear(self):
+        with self._lock:
+            self._exact.clear()
+            self._semantic.clear()
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """the process wide response cache"""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ResponseCache()
+    return _CACHE
+
+
+def invalidate_responses(table: str = None):
+    """called when entity tables change - a no-op until the cache is used"""
+    if _CACHE is not None:
+        _CACHE.invalidate(table)
+
+
+def is_cacheable(context) -> bool:
+    """responses are only reused when asked for and deterministic"""
+    return bool(context and context.use_response_cache and not context.temperature)
+
+
+class CachedCall:
+    """the cache lookup and store around one language model request - a no-op unless the context is cacheable
+
+    Args:
+        messages: the messages sent - a callable can be passed to build them only if the cache is used
+        functions: the function specs sent
+        context: the calling context
+    """
+
+    def __init__(
+        self,
+        messages: typing.List[dict] | typing.Callable[[], typing.List[dict]],
+        functions: typing.Optional[typing.List[dict]],
+        context,
+    ):
+        self.cache = get_response_cache() if is_cacheable(context) else None
+        if self.cache is not None:
+            if callable(messages):
+                messages = messages()
+            self.key, self.scope, self.question = self.cache.keys(
+                messages, functions, context.model, context.temperature
+            )
+            self.generation = self.cache.generation
+
+    def get(self) -> typing.Optional[str]:
+        if self.cache is None:
+            return None
+        return self.cache.get(self.key, self.scope, self.question)
+
+    def put(self, response: typing.Any):
+        """only text responses are cached e.g. not function calls or generators"""
+        if self.cache is not None and isinstance(response, str):
+            self.cache.put(
+                self.key,
+                response,
+                scope=self.scope,
+                question=self.question,
+                generation=self.generation,
+            )
@@ -0,0 +1,57 @@
+import docstring_parser
+from funkyprompt.core.agents import FunctionManager, DefaultAgentCore
+from funkyprompt.core.functions import Function
+from funkyprompt.core.functions.Function import FunctionMetadataParser
+
+
+def lookup(key: str):
+    """a lookup
+
+    Args:
+        key (str): the key
+    """
+    return {"key": key}
+
+
+def search(question: str):
+    """a search
+
+    Args:
+        question (str): the question
+    """
+    return {"question": question}
+
+
+def test_function_metadata_is_parsed_once(monkeypatch):
+    """building runners for the same agent does not parse docstrings and type hints again"""
+    FunctionManager().register(DefaultAgentCore())
+    parsed = []
+    parse = docstring_parser.parse
+    monkeypatch.setattr(
+        docstring_parser, "parse", lambda doc: parsed.append(doc) or parse(doc)
+    )
+    FunctionManager().register(DefaultAgentCore())
+    assert parsed == []
+
+    assert FunctionMetadataParser.parse_metadata(
+        lookup
+    ) is FunctionMetadataParser.parse_metadata(lookup)
+    assert FunctionMetadataParser.parse_metadata(lookup, alias="other").name == "other"
+
+
+def test_function_specs_are_reused_until_functions_change():
+    """"""
+    manager = FunctionManager()
+    manager.add_function(lookup)
+    specs = manager.function_specs()
+    assert manager.function_specs() is specs
+    assert specs[0] is Function.from_callable(lookup).to_json_spec()
+
+    manager.add_function(search)
+    assert [s["name"] for s in manager.function_specs()] == ["lookup", "search"]
+
+    """changing a function rebuilds only its own spec"""
+    f = manager["search"]
+    f.description = "changed"
+    assert f.to_json_spec()["description"] == "changed"
+    assert Function.from_callable(search).to_json_spec()["description"] != "changed"
@@ -0,0 +1,85 @@
+import json
+import time
+from funkyprompt.core.agents import CallingContext, DefaultAgentCore, MessageStack
+from funkyprompt.core.utils import tokens
+
+
+def _stack_with_results(n: int, size: int = 4000) -> MessageStack:
+    messages = MessageStack(model=DefaultAgentCore, question="question")
+    for i in range(n):
+        messages.add_user_message(f"turn {i}")
+        messages.add(
+            MessageStack.format_function_response_data(f"lookup_{i}", "x" * size)
+        )
+    return messages
+
+
+def test_messages_are_serialized_once():
+    """"""
+    messages = _stack_with_results(3)
+    first = messages.dump_for_context()
+    second = messages.dump_for_context()
+    assert all(a is b for a, b in zip(first, second))
+    assert messages.model_dump() == first
+
+
+def test_old_function_results_are_pruned_to_the_budget():
+    """the oldest results are pruned first and the latest result is kept"""
+    tokens.set_token_counter(tokens.estimate_tokens)
+    try:
+        messages = _stack_with_results(4)
+        total = messages.token_count()
+        assert total > 4000
+
+        context = CallingContext(context_token_budget=2500)
+        payload = messages.dump_for_context(context)
+        assert sum(tokens.estimate_tokens(json.dumps(m)) for m in payload) < 3000
+        results = [m for m in payload if m["role"] == "function"]
+        assert results[0]["content"].endswith("[truncated to fit the context]")
+        assert results[-1] == messages.messages[-1].to_dict()
+
+        """the cached messages are not changed"""
+        assert messages.token_count() == total
+
+        context = CallingContext(context_token_budget=2500, prune_policy="elide")
+        payload = messages.dump_for_context(context)
+        assert "removed to fit the context" in payload[3]["content"]
+
+        context = CallingContext(context_token_budget=2500, prune_policy="none")
+        assert messages.dump_for_context(context) == messages.model_dump()
+    finally:
+        tokens.set_token_counter(None)
+
+
+def test_add_appends_in_place():
+    """adding does not rebuild the stack so long tool chains stay linear"""
+    messages = MessageStack(model=DefaultAgentCore, question="question")
+    system = messages.messages[0]
+    assert messages.add_user_message("more") is messages
+
+    started = time.perf_counter()
+    for i in range(20000):
+        messages.add({"role": "function", "name": "f", "content": str(i)})
+    assert time.perf_counter() - started < 1
+    assert len(messages.messages) == 20003
+    assert messages.messages[0] is system
+
+
+def test_snapshots_share_messages_and_branch():
+    """"""
+    messages = _stack_with_results(2)
+    snapshot = messages.snapshot()
+    n = len(snapshot)
+    messages.add_user_message("after the snapshot")
+    assert len(snapshot) == n and snapshot[-1] is messages.messages[n - 1]
+
+    plan_a, plan_b = snapshot.branch(), snapshot.branch()
+    plan_a.add_user_message("plan a")
+    plan_b.add_user_message("plan b")
+    assert [m.content for m in (plan_a.messages[-1], plan_b.messages[-1])] == [
+        "plan a",
+        "plan b",
+    ]
+    assert plan_a.messages[0] is plan_b.messages[0] is messages.messages[0]
+    assert plan_a.model_dump()[:n] == snapshot.model_dump()
+    assert len(messages.messages) == n + 1
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import sys
+import time
+from funkyprompt.core.agents import Runner, CallingContext, FunctionCall
+
+
+def slow_lookup(key: str):
+    """a blocking lookup
+
+    Args:
+        key (str): the key
+    """
+    time.sleep(0.3)
+    return {"key": key}
+
+
+async def slow_search(question: str):
+    """a coroutine search
+
+    Args:
+        question (str): the question
+    """
+    await asyncio.sleep(0.3)
+    return {"question": question}
+
+
+async def hangs(question: str):
+    """never returns in time
+
+    Args:
+        question (str): the question
+    """
+    await asyncio.sleep(10)
+
+
+class _FakeModel:
+    """calls all functions in one turn and then answers"""
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.turns = []
+
+    def __call__(self, messages, context, functions):
+        self.turns.append(messages)
+        if len(self.turns) == 1:
+            return self.calls
+        return "done"
+
+    async def acall(self, messages, context, functions):
+        return self(messages, context, functions)
+
+
+def _run(monkeypatch, calls, asynchronous=True, function_metadata=None, **context):
+    model = _FakeModel(calls)
+    for module in ["Runner", "AsyncRunner"]:
+        monkeypatch.setattr(
+            sys.modules[f"funkyprompt.core.agents.{module}"],
+            "language_model_client_from_context",
+            lambda context: model,
+        )
+
+    async def adump(*args):
+        pass
+
+    runner = Runner()
+    monkeypatch.setattr(runner, "adump", adump)
+    monkeypatch.setattr(runner, "dump", lambda *args: None)
+    for f in [slow_lookup, slow_search, hangs]:
+        runner._function_manager.add_function(f).metadata.update(
+            function_metadata or {}
+        )
+
+    started = time.perf_counter()
+    if asynchronous:
+        response = asyncio.run(runner.arun("question", CallingContext(**context)))
+    else:
+        response = runner.run("question", CallingContext(**context))
+    return response, model, time.perf_counter() - started
+
+
+def test_arun_calls_functions_concurrently(monkeypatch):
+    """the blocking and coroutine functions of one turn overlap"""
+    calls = [
+        FunctionCall(name="slow_lookup", arguments={"key": "a"}),
+        FunctionCall(name="slow_search", arguments={"question": "b"}),
+        FunctionCall(name="slow_lookup", arguments={"key": "c"}),
+    ]
+    response, model, elapsed = _run(monkeypatch, calls)
+    assert response == "done"
+    assert elapsed < 0.6, elapsed
+
+    """all the results are added in call order before the next turn"""
+    results = [m for m in model.turns[1] if m["role"] == "function"]
+    assert [m["name"] for m in results] == [c.name for c in calls]
+    assert json.loads(results[1]["content"])["data"] == {"question": "b"}
+
+
+def test_arun_function_timeouts(monkeypatch):
+    """a function that times out becomes an error message for the model"""
+    calls = [FunctionCall(name="hangs", arguments={"question": "a"})]
+    response, model, elapsed = _run(monkeypatch, calls, function_timeout_seconds=0.1)
+    assert response == "done" and elapsed < 1
+    assert "0.1 seconds" in model.turns[1][-1]["content"]
+
+
+def test_run_answers_parallel_tool_calls(monkeypatch):
+    """the calls of one turn run concurrently and every tool call id gets a tool message"""
+    calls = [
+        FunctionCall(id="call_1", name="slow_lookup", arguments={"key": "a"}),
+        FunctionCall(id="call_2", name="slow_lookup", arguments={"key": "b"}),
+    ]
+    response, model, elapsed = _run(monkeypatch, calls, asynchronous=False)
+    assert response == "done"
+    assert elapsed < 0.55, elapsed
+
+    assistant, *results = model.turns[1][-3:]
+    assert assistant["role"] == "assistant"
+    assert [t["id"] for t in assistant["tool_calls"]] == ["call_1", "call_2"]
+    assert json.loads(assistant["tool_calls"][0]["function"]["arguments"]) == {
+        "key": "a"
+    }
+    assert [(m["role"], m["tool_call_id"]) for m in results] == [
+        ("tool", "call_1"),
+        ("tool", "call_2"),
+    ]
+    assert json.loads(results[1]["content"])["data"] == {"key": "b"}
+
+
+def test_run_responses_are_cached_unless_state_changes(monkeypatch):
+    """"""
+    from funkyprompt.services.models import response_cache
+
+    monkeypatch.setattr(
+        response_cache,
+        "_CACHE",
+        response_cache.ResponseCache(similarity_threshold=None),
+    )
+    calls = [FunctionCall(name="slow_lookup", arguments={"key": "a"})]
+    context = dict(asynchronous=False, use_response_cache=True)
+    assert _run(monkeypatch, calls, **context)[0] == "done"
+    response, model, _ = _run(monkeypatch, calls, **context)
+    assert response == "done" and model.turns == []
+
+    """runs that call a function marked as changing state are not cached"""
+    response_cache._CACHE.clear()
+    context["function_metadata"] = {"mutates_state": True}
+    _run(monkeypatch, calls, **context)
+    _, model, _ = _run(monkeypatch, calls, **context)
+    assert len(model.turns) == 2
+
+
+def test_cacheable_function_results_are_reused(monkeypatch):
+    """repeated calls with the same arguments (in any order) call the function once"""
+    from funkyprompt.core.functions import cache
+
+    monkeypatch.setattr(cache, "_CACHE", cache.FunctionResultCache())
+    calls = [
+        FunctionCall(id="call_1", name="slow_lookup", arguments={"key": "a"}),
+        FunctionCall(id="call_2", name="slow_lookup", arguments={"key": "a"}),
+    ]
+    metadata = {"cache": {"ttl_seconds": 60, "max_size": 10}}
+    _run(monkeypatch, calls[:1], asynchronous=False, function_metadata=metadata)
+    started = time.perf_counter()
+    response, model, _ = _run(monkeypatch, calls, function_metadata=metadata)
+    assert time.perf_counter() - started < 0.25
+    assert json.loads(model.turns[1][-1]["content"])["data"] == {"key": "a"}
+    stats = cache.get_function_cache().stats()
+    assert stats[f"{__name__}.slow_lookup"]["hits"] == 2
@@ -0,0 +1,91 @@
+import time
+from funkyprompt.core.functions import Function
+from funkyprompt.core.functions.cache import (
+    FunctionResultCache,
+    cacheable,
+    cache_name,
+    cache_options,
+)
+
+
+@cacheable(ttl_seconds=60, max_size=2)
+def lookup(key: str, limit: int = 1):
+    """a lookup
+
+    Args:
+        key (str): the key
+        limit (int): the limit
+    """
+    return {"key": key}
+
+
+def test_cacheable_functions_carry_options():
+    """"""
+    f = Function.from_callable(lookup)
+    assert cache_options(f.metadata) == {
+        "ttl_seconds": 60,
+        "max_size": 2,
+        "per_user": False,
+    }
+    assert cache_options({"cache": True})["ttl_seconds"] > 0
+    assert cache_options({}) is None
+
+
+def test_results_are_keyed_on_canonical_arguments():
+    """"""
+    cache = FunctionResultCache()
+    options = cache_options({"cache": {"ttl_seconds": 60, "max_size": 2}})
+    assert cache.get("lookup", {"key": "a", "limit": 1}, options) == (False, None)
+    cache.put("lookup", {"key": "a", "limit": 1}, None, options)
+    assert cache.get("lookup", '{"limit": 1, "key": "a"}', options) == (True, None)
+
+    """least recently used results are evicted"""
+    cache.put("lookup", {"key": "b"}, 2, options)
+    cache.put("lookup", {"key": "c"}, 3, options)
+    assert cache.get("lookup", {"key": "a", "limit": 1}, options)[0] is False
+    assert cache.get("lookup", {"key": "c"}, options) == (True, 3)
+
+    stats = cache.stats()["lookup"]
+    assert stats["hits"] == 2 and stats["misses"] == 2 and stats["hit_rate"] == 0.5
+
+    cache.invalidate()
+    assert cache.get("lookup", {"key": "c"}, options)[0] is False
+
+
+def test_results_expire():
+    """"""
+    cache = FunctionResultCache()
+    options = {"ttl_seconds": 0.05, "max_size": 10}
+    cache.put("lookup", {"key": "a"}, 1, options)
+    time.sleep(0.1)
+    assert cache.get("lookup", {"key": "a"}, options)[0] is False
+
+
+class _Orders:
+    @classmethod
+    @cacheable(per_user=True)
+    def lookup(cls, key: str):
+        """the orders of the caller
+
+        Args:
+            key (str): the key
+        """
+        return {"key": key}
+
+
+def test_results_are_scoped_by_owner_and_user():
+    """functions with the same name on different models and the results of different users do not collide"""
+    orders = Function.from_callable(_Orders.lookup)
+    assert orders.name == Function.from_callable(lookup).name
+    assert cache_name(orders) != cache_name(Function.from_callable(lookup))
+    assert cache_name(orders).endswith("_Orders.lookup")
+
+    cache = FunctionResultCache()
+    options = cache_options(orders.metadata)
+    assert options["per_user"]
+    cache.put(cache_name(orders), {"key": "a"}, 1, options, scope="alice")
+    assert cache.get(cache_name(orders), {"key": "a"}, options, scope="alice") == (
+        True,
+        1,
+    )
+    assert cache.get(cache_name(orders), {"key": "a"}, options, scope="bob")[0] is False
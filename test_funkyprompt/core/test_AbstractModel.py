@@ -0,0 +1,85 @@
+import gc
+import time
+import weakref
+import pytest
+from pydantic import Field
+from funkyprompt.core import AbstractEntity, AbstractModel
+from funkyprompt.core.AbstractModel import clear_model_metadata
+from funkyprompt.core.fields.annotations import HashingEmbeddingField
+
+
+class _LocalDocument(AbstractEntity):
+    class Config:
+        name: str = "local_document"
+        namespace: str = "test"
+
+    description: str = HashingEmbeddingField(description="embedded locally")
+
+
+def test_model_metadata_is_computed_once():
+    """"""
+    helper = _LocalDocument.sql()
+    assert _LocalDocument.sql() is helper
+    assert _LocalDocument.get_model_key_field() == "name"
+    assert _LocalDocument.get_embedding_fields() == {
+        "description": "description_embedding"
+    }
+
+    """query templates are cached and building one must not change the helper fields"""
+    fields = list(helper.field_names)
+    q = helper.partial_update_query(helper.embedding_fields, batch_size=10)
+    assert helper.partial_update_query(helper.embedding_fields, batch_size=100) is q
+    assert helper.field_names == fields
+
+    clear_model_metadata(_LocalDocument)
+    assert _LocalDocument.sql() is not helper
+
+
+def test_dynamic_models_get_their_own_metadata():
+    """"""
+    helper = _LocalDocument.sql()
+    Model = _LocalDocument.create_model(
+        "local_document_extended", extra=(str, Field(default=None))
+    )
+    assert Model.sql() is not helper
+    assert "extra" in Model.sql().field_names
+    assert "extra" not in helper.field_names
+
+
+def test_cached_helpers_do_not_keep_dynamic_models_alive():
+    """entities are kept by the registry but other dynamic models can be collected"""
+    Model = AbstractModel.create_model(
+        "local_temporary", namespace="test", title=(str, Field(default=None))
+    )
+    assert Model.sql().model is Model and Model.cypher().model is Model
+    ref = weakref.ref(Model)
+    del Model
+    gc.collect()
+    assert ref() is None, "the metadata cache should not hold the class"
+
+
+@pytest.mark.benchmark
+def test_benchmark_cached_model_metadata():
+    """reports cold and warm per call timings of the metadata used on every upsert - run with `-m benchmark -s`
+    nothing is asserted on the timings as wall clock ratios are not stable on shared runners
+    """
+    n = 200
+
+    def timed(fn, cold: bool) -> float:
+        fn()
+        elapsed = 0.0
+        for _ in range(n):
+            if cold:
+                clear_model_metadata(_LocalDocument)
+            started = time.perf_counter()
+            fn()
+            elapsed += time.perf_counter() - started
+        return elapsed / n
+
+    for name, fn in [
+        ("sql()", _LocalDocument.sql),
+        ("get_model_key_field()", _LocalDocument.get_model_key_field),
+    ]:
+        print(
+            f"{name} per call cold {timed(fn, True) * 1e6:.1f}us warm {timed(fn, False) * 1e6:.1f}us"
+        )
@@ -0,0 +1,39 @@
+from funkyprompt.core import AbstractEntity
+from funkyprompt.core.registry import EntityRegistry, entity_registry
+
+
+class _HiddenThing(AbstractEntity):
+    class Config:
+        name: str = "hidden_thing"
+        namespace: str = "test"
+
+
+def test_entities_register_when_defined():
+    """"""
+
+    class RegisteredThing(AbstractEntity):
+        class Config:
+            name: str = "registered_thing"
+            namespace: str = "test"
+
+    assert entity_registry.get("test.registered_thing") is RegisteredThing
+    assert (
+        entity_registry.get("test.hidden_thing") is None
+    ), "hidden entities are not resolved"
+    assert _HiddenThing in entity_registry.entities(include_hidden=True)
+
+
+def test_manifest_skips_the_package_scan(tmp_path):
+    """"""
+    path = str(tmp_path / "manifest.json")
+    registry = EntityRegistry(manifest_path=path)
+    registry.load_package("funkyprompt.entities")
+    for e in entity_registry.entities(packages=["funkyprompt.entities"]):
+        registry.register(e)
+    manifest = registry.write_manifest()
+    assert manifest == {"funkyprompt.entities": ["funkyprompt.entities.nodes"]}
+
+    reloaded = EntityRegistry(manifest_path=path)
+    reloaded._scan = None  # the scan must not be used when there is a manifest
+    reloaded.load_package("funkyprompt.entities")
+    assert "funkyprompt.entities" in reloaded._packages
@@ -0,0 +1,44 @@
+import json
+from pydantic import Field
+from funkyprompt.core import AbstractEntity
+from funkyprompt.core.types.cypher import cypher_string
+
+
+class _LocalPlace(AbstractEntity):
+    class Config:
+        name: str = "local_place"
+        namespace: str = "test"
+
+    country: str = Field(default=None, graph_attribute=True)
+    notes: str = Field(default=None)
+
+
+def test_batched_node_upsert_binds_nodes():
+    """"""
+    cypher = _LocalPlace.cypher()
+    assert cypher.get_graph_model_attributes() == ["country"]
+
+    query = cypher.upsert_nodes_query()
+    assert query.startswith("UNWIND $nodes AS x")
+    assert "MERGE (n:test_local_place {name: x.name})" in query
+    assert "SET n.country = x.country" in query
+
+    nodes = [_LocalPlace(name=f"o'place {i}", country="IE") for i in range(10000)]
+    params = json.loads(cypher.upsert_nodes_params(nodes))
+    assert len(params["nodes"]) == 10000
+    assert params["nodes"][0] == {"name": "o'place 0", "country": "IE"}
+
+
+def test_cypher_strings_are_escaped():
+    """"""
+    assert cypher_string("o'brien") == "'o\\'brien'"
+    assert "$$" not in cypher_string("a $$ b")
+
+
+def test_missing_node_attributes_are_null():
+    """"""
+    query = _LocalPlace.cypher().upsert_node_query(
+        [_LocalPlace(name="a", country="IE"), _LocalPlace(name="b")]
+    )
+    assert "SET n.country = 'IE'" in query
+    assert "SET n.country = null" in query and "'None'" not in query
@@ -0,0 +1,100 @@
+import csv
+import io
+import json
+import typing
+import pytest
+from funkyprompt.core import AbstractEntity, AbstractModel
+from funkyprompt.core.fields.annotations import HashingEmbeddingField
+from funkyprompt.core.types.sql import (
+    SqlHelper,
+    STAGING_ORDINAL_COLUMN,
+    to_vector_param,
+)
+
+
+class _LocalRecord(AbstractModel):
+    class Config:
+        name: str = "local_record"
+        namespace: str = "test"
+
+    id: str
+    attributes: dict = None
+    tags: typing.List[str] = None
+
+
+def test_csv_rows_round_trip_json_and_arrays():
+    """"""
+    attributes = {"a": 1, "b": None, "c": True, "quote": 'say "hi"'}
+    row = SqlHelper.to_csv_row(
+        ["x", attributes, ['a "b"', None, "c\\d"], ""], ordinal=3
+    )
+    cells = next(csv.reader(io.StringIO(row)))
+    assert json.loads(cells[1]) == attributes, "dicts are sent as json"
+    assert cells[2] == '{"a \\"b\\"",NULL,"c\\\\d"}', "lists are array literals"
+    assert row.endswith(',"","3"\n'), "empty strings are quoted so they are not NULL"
+    assert SqlHelper.to_csv_row([None, "a"]) == ',"a"\n'
+
+
+def test_bulk_merge_keeps_the_last_duplicate():
+    """"""
+    helper = _LocalRecord.sql()
+    assert STAGING_ORDINAL_COLUMN in helper.create_staging_table_script()
+    assert helper.copy_query().startswith(
+        f"COPY {helper.staging_table_name} (id, attributes, tags, {STAGING_ORDINAL_COLUMN})"
+    )
+    assert (
+        f"ORDER BY id, {STAGING_ORDINAL_COLUMN} DESC" in helper.bulk_merge_query()
+    ), "the last row for a key in a batch should win"
+
+
+def test_vector_params_use_the_pgvector_text_form():
+    """"""
+    assert to_vector_param([1, 0.5]) == "[1.0,0.5]"
+    np = pytest.importorskip("numpy")
+    assert to_vector_param(np.array([1, 0.5], dtype=np.float32)) == "[1.0,0.5]"
+
+
+class _LocalIndexed(AbstractModel):
+    class Config:
+        name: str = "local_indexed"
+        namespace: str = "test"
+
+    id: str
+    title: str = HashingEmbeddingField(description="hnsw by default")
+    body: str = HashingEmbeddingField(
+        description="clustered", vector_index={"index_type": "ivfflat"}
+    )
+
+
+def test_only_hnsw_indexes_are_created_with_the_table():
+    """ivfflat is trained on the rows present so it is built after loading"""
+    helper = _LocalIndexed.sql()
+    script = helper.create_script()
+    assert "USING hnsw (title_embedding" in script
+    assert "ivfflat" not in script
+    built = helper.create_vector_index_scripts(concurrently=True)
+    assert len(built) == 2 and "USING ivfflat (body_embedding" in built[1]
+
+
+class _LocalNote(AbstractEntity):
+    class Config:
+        name: str = "local_note"
+        namespace: str = "test"
+
+    description: str = HashingEmbeddingField(description="embedded locally")
+
+
+def test_embedding_update_is_narrow():
+    """only the key, vectors and hashes are sent and only existing rows are updated"""
+    helper = _LocalNote.sql()
+    query = helper.embedding_update_query()
+    assert query.startswith("UPDATE") and "INSERT" not in query
+    row = helper.embedding_update_tuple(
+        {
+            "name": "a",
+            "description_embedding": [0.5, 0.25],
+            "description_embedding_hash": "h",
+        }
+    )
+    assert row == ("a", "[0.5,0.25]", "h")
+    assert len(row) == len(helper.embedding_update_columns)
@@ -0,0 +1,46 @@
+from funkyprompt.core.utils.embedding_cache import EmbeddingCache
+
+
+def _fake_embedder(calls):
+    def embed(texts):
+        calls.append(list(texts))
+        return [[float(len(t)), 0.5] for t in texts]
+
+    return embed
+
+
+def test_only_misses_are_embedded(tmp_path):
+    """"""
+    calls = []
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite"), memory_size=10)
+    embed = _fake_embedder(calls)
+
+    v = cache.embed(["a", "bb", "a"], embed, provider="fake", model="m")
+    assert v == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert calls == [["a", "bb"]], "duplicates in one call are embedded once"
+
+    cache.embed(["a", "ccc"], embed, provider="fake", model="m")
+    assert calls[-1] == ["ccc"], "only the miss should go to the provider"
+
+    cache.embed(["a"], embed, provider="fake", model="other")
+    assert calls[-1] == ["a"], "the key includes the model"
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["misses"] == 4, stats
+
+
+def test_persistent_tier_survives_and_is_bounded(tmp_path):
+    """"""
+    path = str(tmp_path / "cache.sqlite")
+    calls = []
+    cache = EmbeddingCache(path=path, memory_size=1, disk_size=5)
+    cache.embed([str(i) for i in range(10)], _fake_embedder(calls), "fake", "m")
+
+    reopened = EmbeddingCache(path=path, memory_size=1, disk_size=5)
+    (count,) = reopened._db.execute("SELECT count(*) FROM embeddings").fetchone()
+    assert count <= 5, "the disk tier should evict to its size bound"
+
+    calls = []
+    reopened.embed(["9"], _fake_embedder(calls), "fake", "m")
+    assert not calls, "recent entries should be read from disk"
+    assert reopened.stats()["disk_hits"] == 1
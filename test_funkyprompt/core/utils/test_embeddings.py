@@ -0,0 +1,46 @@
+import pytest
+from funkyprompt.core import AbstractEntity
+from funkyprompt.core.fields.annotations import HashingEmbeddingField
+from funkyprompt.core.utils.embeddings import (
+    embed_collection,
+    get_embedding_provider,
+)
+
+
+class _LocalThing(AbstractEntity):
+    class Config:
+        name: str = "local_thing"
+        namespace: str = "test"
+
+    description: str = HashingEmbeddingField(description="embedded locally")
+
+
+def test_hashing_provider_is_offline_and_normalized():
+    """"""
+    a, b, c = embed_collection(
+        ["the cat sat on the mat", "the cat sat on a mat", "quarterly revenue report"],
+        provider="hashing",
+        use_cache=False,
+    )
+    p = get_embedding_provider("hashing")
+    assert len(a) == p.dimension
+    assert abs(sum(x * x for x in a) - 1.0) < 1e-6, "vectors should be unit length"
+
+    def dot(x, y):
+        return sum(i * j for i, j in zip(x, y))
+
+    assert dot(a, b) > dot(a, c), "overlapping texts should be closer"
+
+
+def test_provider_names_are_normalized_and_unknown_providers_fail():
+    """"""
+    assert get_embedding_provider("open_ai") is get_embedding_provider("openai")
+    with pytest.raises(ValueError):
+        get_embedding_provider("not_a_provider")
+
+
+def test_ddl_uses_the_provider_dimension():
+    """"""
+    script = _LocalThing.sql().create_script()
+    dimension = get_embedding_provider("hashing").dimension
+    assert f"description_embedding vector({dimension})" in script
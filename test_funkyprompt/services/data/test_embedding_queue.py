@@ -0,0 +1,93 @@
+import datetime
+from funkyprompt.entities import Project
+from funkyprompt.services.data.embedding_queue import EmbeddingQueue, EmbeddingWorker
+
+
+class FakeStore:
+    """records statements and serves the claimed queue items and source rows"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+        self.upserts = []
+        self.data = []
+
+    def execute(self, query, data=None):
+        self.statements.append(query.strip().split()[0])
+        self.data.append(data)
+        if query.strip().startswith("UPDATE") and "RETURNING" in query:
+            return [
+                {
+                    "record_id": r["id"],
+                    "attempts": 0,
+                    "enqueued_at": datetime.datetime.now(),
+                }
+                for r in self.rows
+            ]
+        if query.strip().startswith("SELECT"):
+            return self.rows
+
+    def execute_upsert(self, query, data=None):
+        self.upserts.extend(data)
+
+
+def test_worker_embeds_in_provider_sized_batches():
+    """"""
+    calls = []
+
+    def fake_embedder(texts):
+        calls.append(len(texts))
+        return [[float(len(t))] for t in texts]
+
+    rows = [{"id": str(i), "description": f"project {i}"} for i in range(5)]
+    rows.append({"id": "empty", "description": None})
+    store = FakeStore(rows)
+    worker = EmbeddingWorker(
+        Project, embedder=fake_embedder, max_batch_size=2, store=store
+    )
+
+    assert worker.run_once() == 6, "all queued items should be claimed"
+    assert calls == [2, 2, 1], f"texts should be batched by max batch size - {calls}"
+    assert len(store.upserts) == 6, "every claimed record gets written back"
+    assert "DELETE" in store.statements, "completed items are removed from the queue"
+    assert worker.stats()["texts"] == 5
+
+
+def test_worker_backs_off_on_failure():
+    """"""
+
+    def failing_embedder(texts):
+        raise Exception("provider down")
+
+    store = FakeStore([{"id": "1", "description": "a project"}])
+    worker = EmbeddingWorker(Project, embedder=failing_embedder, store=store)
+    worker.run_once()
+    assert (
+        store.statements[-1] == "UPDATE"
+    ), "failed items should be released with a backoff"
+    assert "DELETE" not in store.statements
+    assert worker.stats()["failures"] == 1
+
+
+def test_complete_matches_each_claimed_enqueue_time():
+    """an item enqueued again while the batch was processed must not be removed"""
+    store = FakeStore([])
+    earlier = datetime.datetime(2024, 1, 1, 12, 0, 0)
+    later = earlier + datetime.timedelta(minutes=5)
+    worker = EmbeddingWorker(Project, embedder=lambda texts: [], store=store)
+    worker.queue.complete(
+        [
+            {"record_id": "a", "attempts": 0, "enqueued_at": earlier},
+            {"record_id": "b", "attempts": 0, "enqueued_at": later},
+        ]
+    )
+    assert store.statements == ["DELETE"]
+    assert store.data[-1][1] == (("a", earlier), ("b", later))
+
+
+def test_create_script_creates_the_queue_schema_first():
+    """"""
+    script = EmbeddingQueue.create_script()
+    assert script.index("CREATE SCHEMA IF NOT EXISTS core;") < script.index(
+        "CREATE TABLE IF NOT EXISTS core.embedding_queue"
+    )
@@ -0,0 +1,93 @@
+import pytest
+import threading
+from funkyprompt.services.data.pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def execute(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor()
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_pool_reuses_connections():
+    """"""
+    pool = ConnectionPool("fake", max_size=2, connect=FakeConnection)
+    with pool.connection() as a:
+        pass
+    with pool.connection() as b:
+        pass
+    assert a is b, "the idle connection should be reused"
+    stats = pool.stats()
+    assert stats["connects"] == 1 and stats["checkouts"] == 2, f"bad stats {stats}"
+    assert stats["idle"] == 1 and stats["in_use"] == 0, f"bad stats {stats}"
+
+
+def test_pool_is_size_bounded_and_times_out():
+    """"""
+    pool = ConnectionPool("fake", max_size=1, connect=FakeConnection)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    assert pool.stats()["timeouts"] == 1
+
+    """a waiting caller is handed the connection when it is returned"""
+    threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+    assert pool.getconn(timeout=2) is conn
+    assert pool.stats()["waits"] >= 1
+
+
+def test_pool_discards_closed_connections():
+    """"""
+    pool = ConnectionPool("fake", max_size=1, connect=FakeConnection)
+    with pool.connection() as a:
+        a.close()
+    assert (
+        pool.stats()["size"] == 0
+    ), "closed connections should not go back to the pool"
+    with pool.connection() as b:
+        pass
+    assert a is not b
+
+
+def test_pool_forgets_prepared_statements_of_discarded_connections():
+    """"""
+    pool = ConnectionPool("fake", max_size=1, connect=FakeConnection)
+    with pool.connection() as a:
+        pool.prepared_statements(a).add("fp_test")
+    with pool.connection() as b:
+        assert "fp_test" in pool.prepared_statements(
+            b
+        ), "the reused connection keeps its statements"
+        b.close()
+    assert pool.stats()["prepared_statements"] == 0
+    with pool.connection() as c:
+        assert not pool.prepared_statements(c)
+
+
+def test_pool_closes_connections_returned_after_close():
+    """"""
+    pool = ConnectionPool("fake", max_size=2, connect=FakeConnection)
+    idle = pool.getconn()
+    in_use = pool.getconn()
+    pool.putconn(idle)
+    pool.close()
+    assert idle.closed and not in_use.closed
+    pool.putconn(in_use)
+    assert in_use.closed, "connections checked out at close time are closed on return"
+    assert pool.stats()["size"] == 0 and pool.stats()["idle"] == 0
@@ -0,0 +1,177 @@
+import contextlib
+import csv
+import io
+import threading
+import psycopg2
+import pytest
+from funkyprompt.entities import Project, resolve_label
+from funkyprompt.services.data.postgres import PostgresService, prepared_statement
+
+
+def test_prepared_statement_shape():
+    """"""
+    name, settings, body, n = prepared_statement(
+        "SET LOCAL hnsw.ef_search = 40;\nSELECT * FROM t WHERE a = %s AND b <#> %s::vector"
+    )
+    assert (
+        name.startswith("fp_")
+        and name
+        == prepared_statement(
+            "SET LOCAL hnsw.ef_search = 40;\nSELECT * FROM t WHERE a = %s AND b <#> %s::vector"
+        )[0]
+    )
+    assert settings == ["SET LOCAL hnsw.ef_search = 40;"]
+    assert body.strip() == "SELECT * FROM t WHERE a = $1 AND b <#> $2::vector"
+    assert n == 2
+
+
+def test_resolve_nodes_selects_once_per_type(monkeypatch):
+    """matched names are grouped by their label model and returned in the order asked"""
+    calls = []
+    lock = threading.Lock()
+
+    def fake_select_many(self, names, column="name"):
+        with lock:
+            calls.append((self.model, tuple(names)))
+        return [self.model(name=n, description=n) for n in names]
+
+    monkeypatch.setattr(PostgresService, "select_many", fake_select_many)
+    model = resolve_label("public_project")
+    assert model is Project
+
+    nodes = [{"model": Project, "name": n} for n in ["b", "a", "c"]]
+    nodes.append({"model": None, "name": "unknown type"})
+    entities = PostgresService.resolve_nodes(nodes, names=["a", "b", "c"])
+
+    assert calls == [(Project, ("b", "a", "c"))], "one select for the type"
+    assert [e.name for e in entities] == ["a", "b", "c"]
+
+
+class _FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+
+    def execute(self, query, data=None):
+        self.conn.statements.append(query)
+        self.description = [("id",)] if query.startswith("INSERT") else None
+
+    def copy_expert(self, query, buffer):
+        self.conn.copied.append(buffer.read())
+
+    def fetchall(self):
+        return [
+            (r.split(",")[0].strip('"'),) for r in self.conn.copied[-1].splitlines()
+        ]
+
+
+class _FakeConnection:
+    def __init__(self):
+        self.statements, self.copied = [], []
+
+    def cursor(self):
+        return _FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class _FakePool:
+    def __init__(self):
+        self.conn = _FakeConnection()
+        self.in_use = 0
+
+    @contextlib.contextmanager
+    def connection(self):
+        self.in_use += 1
+        try:
+            yield self.conn
+        finally:
+            self.in_use -= 1
+
+
+def test_bulk_update_copies_duplicate_keys_in_order(monkeypatch):
+    """the last of a duplicate key in a batch wins and the follow up writes do not hold the merge connection"""
+    pool = _FakePool()
+    follow_ups = []
+
+    def follow_up(self, *args):
+        follow_ups.append(pool.in_use)
+
+    monkeypatch.setattr(PostgresService, "queue_update_embeddings", follow_up)
+    monkeypatch.setattr(PostgresService, "upsert_graph_nodes", follow_up)
+    store = PostgresService.__new__(PostgresService)
+    store.pool, store.model = pool, Project
+
+    records = [
+        Project(id="a", name="a", description="first"),
+        Project(id="b", name="b", description="other"),
+        Project(id="a", name="a", description="second"),
+    ]
+    stats = store.bulk_update_records(records, batch_size=10)
+
+    assert stats["rows"] == 3 and stats["batches"] == 1
+    rows = list(csv.reader(io.StringIO(pool.conn.copied[0])))
+    assert [(r[2], r[-1]) for r in rows] == [
+        ("first", "0"),
+        ("other", "1"),
+        ("second", "2"),
+    ], "rows are copied with their position in the batch"
+    assert "ORDER BY id, _staging_ordinal DESC" in pool.conn.statements[-1]
+    assert follow_ups == [0, 0], "the merge connection is returned before follow ups"
+
+
+class _PreparingCursor(_FakeCursor):
+    def execute(self, query, data=None):
+        super().execute(query, data)
+        if query.startswith("EXECUTE") and self.conn.errors:
+            error = self.conn.errors.pop(0)
+            if error:
+                raise error
+
+
+def _prepared_store(errors):
+    pool = _FakePool()
+    pool.conn.errors = errors
+    pool.conn.cursor = lambda: _PreparingCursor(pool.conn)
+    pool.statements = set()
+    pool.prepared_statements = lambda conn: pool.statements
+    store = PostgresService.__new__(PostgresService)
+    store.pool, store.model = pool, Project
+    return store, pool
+
+
+def test_prepared_statements_survive_data_errors():
+    """"""
+    store, pool = _prepared_store([None, psycopg2.errors.UniqueViolation("dup")])
+    query = "INSERT INTO t VALUES (%s)"
+    store.execute_prepared(query, (1,))
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        store.execute_prepared(query, (1,))
+    name = prepared_statement(query)[0]
+    assert pool.statements == {name}, "a data error keeps the prepared statement"
+    assert [s.split()[0] for s in pool.conn.statements] == [
+        "PREPARE",
+        "EXECUTE",
+        "EXECUTE",
+    ]
+
+
+def test_missing_prepared_statements_are_prepared_again():
+    """"""
+    store, pool = _prepared_store(
+        [None, psycopg2.errors.InvalidSqlStatementName("gone")]
+    )
+    query = "INSERT INTO t VALUES (%s)"
+    store.execute_prepared(query, (1,))
+    store.execute_prepared(query, (2,))
+    assert [s.split()[0] for s in pool.conn.statements] == [
+        "PREPARE",
+        "EXECUTE",
+        "EXECUTE",
+        "PREPARE",
+        "EXECUTE",
+    ]
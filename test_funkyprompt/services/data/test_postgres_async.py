@@ -0,0 +1,159 @@
+import asyncio
+import contextlib
+import threading
+from funkyprompt.entities import Project
+from funkyprompt.services.data import embedding_queue, postgres_async
+from funkyprompt.services.data.postgres_async import (
+    AsyncPostgresService,
+    expand_values_placeholder,
+)
+
+
+def test_expand_values_placeholder_pages_and_flattens():
+    """"""
+    query = "INSERT INTO t (a, b) VALUES %s ON CONFLICT (a) DO NOTHING"
+    pages = list(
+        expand_values_placeholder(query, [(1, "x"), (2, "y"), (3, "z")], page_size=2)
+    )
+    assert pages == [
+        (
+            "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s) ON CONFLICT (a) DO NOTHING",
+            [1, "x", 2, "y"],
+        ),
+        ("INSERT INTO t (a, b) VALUES (%s, %s) ON CONFLICT (a) DO NOTHING", [3, "z"]),
+    ]
+
+
+class _FakeAsyncCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = None
+
+    async def execute(self, query, params=None, prepare=None):
+        self.conn.statements.append((query, params, prepare))
+        self.description = [("id",)] if "INSERT" in query else None
+
+    async def fetchall(self):
+        return [dict(r) for r in self.conn.rows]
+
+
+class _FakeAsyncConnection:
+    def __init__(self):
+        self.statements, self.rows = [], []
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+    @contextlib.asynccontextmanager
+    async def cursor(self, row_factory=None):
+        yield _FakeAsyncCursor(self)
+
+
+class _FakeAsyncPool:
+    def __init__(self):
+        self.conn = _FakeAsyncConnection()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        yield self.conn
+
+
+def _store(monkeypatch):
+    pool = _FakeAsyncPool()
+
+    async def get_async_pool(connection_string=None):
+        return pool
+
+    monkeypatch.setattr(postgres_async, "get_async_pool", get_async_pool)
+    return AsyncPostgresService(Project, connection_string="fake"), pool
+
+
+def test_leading_settings_run_before_the_bound_statement(monkeypatch):
+    """"""
+    store, pool = _store(monkeypatch)
+    query = "SET LOCAL hnsw.ef_search = 40;\nSELECT * FROM t WHERE a = %s"
+    asyncio.run(store.execute(query, (1,), prepare=True))
+    assert [(q.strip(), p, prepare) for q, p, prepare in pool.conn.statements] == [
+        ("SET LOCAL hnsw.ef_search = 40;", None, None),
+        ("SELECT * FROM t WHERE a = %s", (1,), True),
+    ]
+
+
+def test_update_records_enqueues_embeddings_off_the_loop(monkeypatch):
+    """with the queue enabled the ids are enqueued in a worker thread and the graph nodes are upserted"""
+    store, pool = _store(monkeypatch)
+    pool.conn.rows = [
+        {"id": "a", "description": "first"},
+        {"id": "b", "description": "other"},
+    ]
+    enqueued, nodes = [], []
+
+    class FakeQueue:
+        def __init__(self, model):
+            self.model = model
+
+        def enqueue(self, ids):
+            enqueued.append((self.model, ids, threading.get_ident()))
+
+    async def upsert_graph_nodes(self, records):
+        nodes.extend(r.name for r in records)
+
+    monkeypatch.setattr(postgres_async, "EMBEDDING_QUEUE_ENABLED", True)
+    monkeypatch.setattr(embedding_queue, "EmbeddingQueue", FakeQueue)
+    monkeypatch.setattr(AsyncPostgresService, "upsert_graph_nodes", upsert_graph_nodes)
+
+    records = [
+        Project(id="a", name="a", description="first"),
+        Project(id="b", name="b", description="other"),
+    ]
+    result = asyncio.run(store.update_records(records))
+
+    assert result == pool.conn.rows
+    ((query, params, _),) = pool.conn.statements
+    assert "VALUES (%s, %s, %s, %s, %s), (%s, %s, %s, %s, %s)" in query
+    assert len(params) == 10 and params[0] == "a" and params[5] == "b"
+    assert [(m, ids) for m, ids, _ in enqueued] == [(Project, ["a", "b"])]
+    assert (
+        enqueued[0][2] != threading.get_ident()
+    ), "the sync queue does not block the loop"
+    assert nodes == ["a", "b"]
+
+
+def test_async_pools_are_per_loop_and_closed_with_it(monkeypatch):
+    """"""
+    pools = []
+
+    class FakePool:
+        check_connection = None
+
+        def __init__(self, *args, **kwargs):
+            self.opened = self.closed = False
+            pools.append(self)
+
+        async def open(self):
+            self.opened = True
+
+        async def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(postgres_async, "AsyncConnectionPool", FakePool)
+
+    async def in_loop():
+        pool = await postgres_async.get_async_pool("fake")
+        assert pool is await postgres_async.get_async_pool("fake")
+        return pool
+
+    first, second = asyncio.run(in_loop()), asyncio.run(in_loop())
+    assert first is not second
+    assert all(p.opened and p.closed for p in pools) and len(pools) == 2
+
+    async def closed_explicitly():
+        pool = await postgres_async.get_async_pool("fake")
+        await postgres_async.close_async_pools()
+        assert pool.closed
+        return await postgres_async.get_async_pool("fake")
+
+    assert asyncio.run(
+        closed_explicitly()
+    ).closed, "pools made after closing are closed with the loop"
@@ -0,0 +1,59 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from funkyprompt.services.models import clients
+
+
+def test_clients_are_shared_across_threads():
+    """one client is created per provider and model and reused by every caller"""
+    created = []
+
+    def factory(model=None, asynchronous=False):
+        created.append((model, asynchronous))
+        return object()
+
+    clients.register_client_factory("test", factory)
+    with ThreadPoolExecutor(8) as executor:
+        shared = set(
+            map(id, executor.map(lambda _: clients.get_client("test"), range(32)))
+        )
+    assert len(shared) == 1 and created == [(None, False)]
+
+    assert clients.get_client("test", model="other") is not clients.get_client("test")
+
+    async def in_loop():
+        return clients.get_client("test", asynchronous=True)
+
+    """async clients belong to the loop that created them"""
+    assert asyncio.run(in_loop()) is not clients.get_client("test")
+    assert len(created) == 3
+
+    clients.clear_clients()
+    clients.get_client("test")
+    assert len(created) == 4
+
+
+def test_async_clients_are_closed_with_their_loop():
+    """"""
+    created = []
+
+    class Client:
+        closed = False
+
+        async def close(self):
+            self.closed = True
+
+    def factory(model=None, asynchronous=False):
+        created.append(Client())
+        return created[-1]
+
+    clients.register_client_factory("test", factory)
+
+    async def in_loop():
+        client = clients.get_client("test", asynchronous=True)
+        assert client is clients.get_client("test", asynchronous=True)
+        clients.clear_clients()
+        assert client is not clients.get_client("test", asynchronous=True)
+        assert not client.closed, "clients in use are not closed under the caller"
+
+    asyncio.run(in_loop())
+    assert len(created) == 2 and all(c.closed for c in created)
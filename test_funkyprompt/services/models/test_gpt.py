@@ -0,0 +1,61 @@
+from types import SimpleNamespace as NS
+import openai
+from funkyprompt.services.models.gpt import _get_function_call_or_stream
+
+
+class _FakeStream(openai.Stream):
+    """a stream over prepared chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+def _tool_delta(index, id=None, name=None, arguments=None):
+    return NS(index=index, id=id, function=NS(name=name, arguments=arguments))
+
+
+def _chunk(content=None, tool_calls=None):
+    return NS(choices=[NS(delta=NS(content=content, tool_calls=tool_calls))])
+
+
+def test_parallel_tool_calls_are_collected_from_a_stream():
+    """the fragments of interleaved tool calls are merged by index"""
+    chunks = [
+        _chunk(tool_calls=[_tool_delta(0, "call_a", "lookup", "")]),
+        _chunk(tool_calls=[_tool_delta(0, arguments='{"key":')]),
+        _chunk(tool_calls=[_tool_delta(1, "call_b", "search", '{"question": "q"}')]),
+        _chunk(tool_calls=[_tool_delta(0, arguments=' "a"}')]),
+        NS(choices=[], usage=None),
+    ]
+    calls = _get_function_call_or_stream(_FakeStream(chunks), response_buffer=[])
+    assert [(c.id, c.name, c.arguments) for c in calls] == [
+        ("call_a", "lookup", {"key": "a"}),
+        ("call_b", "search", {"question": "q"}),
+    ]
+
+
+def test_parallel_tool_calls_without_streaming():
+    """"""
+    message = NS(
+        content=None,
+        tool_calls=[
+            NS(id="call_a", function=NS(name="lookup", arguments='{"key": "a"}')),
+            NS(id="call_b", function=NS(name="lookup", arguments='{"key": "b"}')),
+        ],
+    )
+    calls = _get_function_call_or_stream(NS(choices=[NS(message=message)]))
+    assert [c.arguments["key"] for c in calls] == ["a", "b"]
+
+
+def test_streamed_content_goes_to_the_callback():
+    """"""
+    tokens = []
+    buffer = []
+    chunks = [_chunk("hello"), _chunk(" world")]
+    content = _get_function_call_or_stream(
+        _FakeStream(chunks), callback=tokens.append, response_buffer=buffer
+    )
+    assert content == "hello world" and tokens == ["hello", " world"]
@@ -0,0 +1,91 @@
+import time
+from funkyprompt.core.agents import CallingContext
+from funkyprompt.services.models import LanguageModelBase
+from funkyprompt.services.models import response_cache
+from funkyprompt.services.models.response_cache import ResponseCache
+
+
+def _messages(question: str):
+    return [
+        {"role": "system", "content": "you are helpful"},
+        {"role": "user", "content": question},
+    ]
+
+
+def _cache(**kwargs):
+    return ResponseCache(
+        embedding_provider="hashing", similarity_threshold=0.8, **kwargs
+    )
+
+
+def test_exact_and_semantic_tiers():
+    """"""
+    cache = _cache()
+    key, scope, question = cache.keys(
+        _messages("What is the capital of Ireland?"), None, "gpt", 0
+    )
+    assert cache.get(key, scope, question) is None
+    cache.put(key, "Dublin", scope, question)
+    assert cache.get(key, scope, question) == "Dublin"
+
+    """a similar question in the same scope is a semantic hit - a different scope is not"""
+    similar = cache.keys(_messages("what is the capital of ireland"), None, "gpt", 0)
+    assert similar[0] != key and cache.get(*similar) == "Dublin"
+    other_model = cache.keys(_messages("what is the capital of ireland"), None, "o", 0)
+    assert cache.get(*other_model) is None
+    unrelated = cache.keys(_messages("how do I bake bread"), None, "gpt", 0)
+    assert cache.get(*unrelated) is None
+
+    stats = cache.stats()
+    assert stats["exact_hits"] == 1 and stats["semantic_hits"] == 1
+
+    """the semantic tier is opt-in"""
+    cache = ResponseCache(embedding_provider="hashing")
+    cache.put(key, "Dublin", scope, question)
+    assert cache.get(key, scope, question) == "Dublin"
+    assert cache.get(*similar) is None
+
+
+def test_ttl_and_invalidation():
+    """"""
+    cache = _cache(ttl_seconds=0.05)
+    keys = cache.keys(_messages("q"), None, "gpt", 0)
+    cache.put(keys[0], "a", *keys[1:])
+    time.sleep(0.1)
+    assert cache.get(*keys) is None
+
+    cache = _cache()
+    cache.put(keys[0], "a", *keys[1:])
+    cache.invalidate("public.project")
+    assert cache.get(*keys) is None
+
+    """a response computed while entity data changed is not cached"""
+    generation = cache.generation
+    cache.invalidate()
+    cache.put(keys[0], "a", *keys[1:], generation=generation)
+    assert cache.get(*keys) is None
+
+
+class _CountingModel(LanguageModelBase):
+    def __init__(self):
+        self.calls = 0
+
+    def run(self, messages, context, functions=None, **kwargs):
+        self.calls += 1
+        return f"answer {self.calls}"
+
+
+def test_only_deterministic_responses_are_reused(monkeypatch):
+    """"""
+    monkeypatch.setattr(response_cache, "_CACHE", _cache())
+    model = _CountingModel()
+    context = CallingContext(use_response_cache=True)
+    assert model(_messages("q"), context) == model(_messages("q"), context)
+    assert model.calls == 1
+
+    context = CallingContext(use_response_cache=True, temperature=0.7)
+    assert model(_messages("q"), context) != model(_messages("q"), context)
+
+    context = CallingContext()
+    model(_messages("q"), context)
+    assert model.calls == 4
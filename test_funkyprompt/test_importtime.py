@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+"""the startup budget for `import funkyprompt` in seconds - measured with `python -X importtime`"""
+IMPORT_BUDGET_SECONDS = 0.25
+"""provider SDKs and database drivers must only load on first use"""
+LAZY_MODULES = [
+    "openai",
+    "anthropic",
+    "groq",
+    "google.generativeai",
+    "psycopg2",
+    "psycopg",
+    "loguru",
+]
+
+
+def _importtime(statement: str) -> dict:
+    """cumulative import time in seconds for each module imported by the statement"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def test_import_funkyprompt_within_budget():
+    """"""
+    times = _importtime("import funkyprompt")
+    assert times["funkyprompt"] < IMPORT_BUDGET_SECONDS, times["funkyprompt"]
+
+
+def test_core_does_not_load_provider_sdks_or_drivers():
+    """"""
+    times = _importtime(
+        "import funkyprompt.entities; from funkyprompt.core.agents import CallingContext, MessageStack"
+    )
+    loaded = [m for m in LAZY_MODULES if m in times]
+    assert not loaded, f"{loaded} should only be imported on first use"